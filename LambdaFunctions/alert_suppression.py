@@ -0,0 +1,125 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Per-sensor alert cooldown for kfpLambdaConsumerSNS.
+#
+# The first alert of a sensor is sent, repeats within the cooldown are only
+# counted, and the next alert after the cooldown carries a digest of how many
+# were suppressed. State lives in a bounded in-memory LRU cache that survives
+# warm invocations, optionally backed by a store shared across invocations
+# (SQLiteStore is the local stand-in for an external key-value store).
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class SQLiteStore():
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS alert_state ("
+            " sensor_id TEXT PRIMARY KEY, last_sent REAL NOT NULL, suppressed INTEGER NOT NULL)")
+
+    def get(self, sensor_id):
+        row = self._db.execute(
+            "SELECT last_sent, suppressed FROM alert_state WHERE sensor_id = ?", (sensor_id,)).fetchone()
+        return list(row) if row else None
+
+    def put(self, sensor_id, state):
+        self._db.execute(
+            "INSERT OR REPLACE INTO alert_state (sensor_id, last_sent, suppressed) VALUES (?, ?, ?)",
+            (sensor_id, state[0], state[1]))
+
+
+class AlertSuppressor():
+    def __init__(self, cooldown_seconds, max_entries=100000, store=None):
+        self.cooldown = cooldown_seconds
+        self.max_entries = max_entries
+        self.store = store
+        # sensor_id -> [last_sent, suppressed since last_sent]
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, sensor_id, now=None):
+        # Returns (send, suppressed): whether to publish this alert, and how
+        # many alerts of the sensor were suppressed since the last one sent.
+        # Read-only, so an alert that fails to publish is sent on its retry;
+        # sent() and suppress() record the outcome
+        if self.cooldown <= 0:
+            return True, 0
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._lookup(sensor_id, now)
+            if state is None:
+                return True, 0
+            return now - state[0] >= self.cooldown, state[1]
+
+    def sent(self, sensor_id, reported=0, now=None):
+        # A published alert starts the cooldown; its digest covered
+        # `reported` suppressed alerts, later ones stay counted
+        if self.cooldown <= 0:
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._lookup(sensor_id, now)
+            self._update(sensor_id, [now, max(0, state[1] - reported) if state else 0])
+
+    def suppress(self, sensor_id, now=None):
+        # Counts an alert that is not published towards the next digest
+        if self.cooldown <= 0:
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._lookup(sensor_id, now) or [0, 0]
+            self._update(sensor_id, [state[0], state[1] + 1])
+
+    def _update(self, sensor_id, state):
+        self._remember(sensor_id, state)
+        if self.store is not None:
+            self.store.put(sensor_id, state)
+
+    def _lookup(self, sensor_id, now):
+        state = self._cache.get(sensor_id)
+        if state is not None:
+            self._cache.move_to_end(sensor_id)
+        elif self.store is not None:
+            state = self.store.get(sensor_id)
+        # Entries older than the cooldown only matter for a pending digest
+        if state is not None and now - state[0] >= self.cooldown and not state[1]:
+            return None
+        return state
+
+    def _remember(self, sensor_id, state):
+        self._cache[sensor_id] = state
+        self._cache.move_to_end(sensor_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+
+class RecentAlerts():
+    # Bounded LRU of the alerts already published, keyed by sensor and window
+    # start. Flink re-emits alerts it wrote before a restart unless the sink
+    # is exactly-once and the reader is read_committed; either way a replayed
+    # alert has the same key as the original and is dropped here. The keys
+    # are in memory, so only replays reaching the same warm execution
+    # environment are dropped.
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def seen(self, key):
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                return True
+            return False
+
+    def add(self, key):
+        with self._lock:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.max_entries:
+                self._keys.popitem(last=False)
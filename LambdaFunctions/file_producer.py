@@ -0,0 +1,59 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# File-backed stand-in for KafkaProducer, used by kfpLambdaStreamProducer when
+# localOutputPath is set (see local/harness.py). Each topic is a directory of
+# newline-delimited record values that the Flink job reads with the filesystem
+# connector in the same wire format it would read from Kafka.
+
+import os
+
+
+class RecordMetadata():
+    def __init__(self, topic, serialized_value_size):
+        self.topic = topic
+        self.partition = 0
+        self.serialized_value_size = serialized_value_size
+
+
+class FileFuture():
+    # Resolved on send, with the subset of FutureRecordMetadata the producer uses
+    def __init__(self, value):
+        self.value = value
+        self.exception = None
+
+    def failed(self):
+        return False
+
+
+class FileProducer():
+    def __init__(self, path):
+        self.path = path
+        self._files = {}
+
+    def _file(self, topic):
+        if topic not in self._files:
+            directory = os.path.join(self.path, topic)
+            os.makedirs(directory, exist_ok=True)
+            # One file per process, so parallel workers never interleave lines
+            self._files[topic] = open(os.path.join(directory, "part-{}.data".format(os.getpid())), "ab")
+        return self._files[topic]
+
+    def send(self, topic, value=None, key=None):
+        self._file(topic).write(value + b"\n")
+        return FileFuture(RecordMetadata(topic, len(value)))
+
+    def flush(self, timeout=None):
+        for file in self._files.values():
+            file.flush()
+
+    def partitions_for(self, topic):
+        return {0}
+
+    def metrics(self):
+        return {}
+
+    def close(self, timeout=None):
+        for file in self._files.values():
+            file.close()
+        self._files = {}
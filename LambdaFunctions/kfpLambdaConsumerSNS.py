@@ -2,22 +2,330 @@
 # SPDX-License-Identifier: MIT-0
 
 
-import base64
+import asyncio
 import boto3
 import json
 import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+import serialization
+from alert_suppression import AlertSuppressor, RecentAlerts, SQLiteStore
+from metrics import Metrics
+
+# PublishBatch accepts at most 10 entries per call
+SNS_BATCH_SIZE = 10
+# PublishBatch calls in flight at once; boto3 clients are thread safe
+PUBLISH_CONCURRENCY = int(os.environ.get("publishConcurrency", "8"))
+# Attempts per entry, failed entries of a batch are retried on their own
+PUBLISH_ATTEMPTS = int(os.environ.get("publishAttempts", "3"))
+RETRY_BACKOFF_SECONDS = 0.2
+# Whole calls rejected with these codes are retried like failed entries
+THROTTLING_CODES = {"Throttling", "ThrottlingException", "ThrottledException", "TooManyRequestsException"}
+# threads: one partition per executor thread, its batches sent one after the
+# other as they are decoded. async: batches of all partitions are in flight
+# together (publish_event_async)
+PUBLISH_MODE = os.environ.get("publishMode", "threads")
+# async only: send a partition's batches in offset order, one at a time
+PUBLISH_ORDERED = os.environ.get("publishOrdered", "false").lower() == "true"
+# Part of the invocation's remaining time kept for the batches in flight (with
+# their retries) and the metrics; no new alert is started after that point
+TIME_BUDGET_RESERVE_MS = int(os.environ.get("timeBudgetReserveMs", "5000"))
+
+# SNSEndpointUrl points the client at a stand-in (local/sns_stand_in.py)
+sns = boto3.client('sns', endpoint_url=os.environ.get("SNSEndpointUrl") or None,
+                   config=Config(max_pool_connections=max(10, PUBLISH_CONCURRENCY)))
+# kfp_sns_topic values are written by Flink in the shared wire format and
+# decoded straight from the event's base64 value, see
+# serialization.alert_value_decoder
+decode_alert_value = serialization.alert_value_decoder(serialization.wire_format())
+
+executor = ThreadPoolExecutor(max_workers=PUBLISH_CONCURRENCY)
+
+metrics = Metrics()
+
+# Repeat alerts of a sensor within the cooldown are counted instead of sent
+# (0 disables suppression). alertStore=sqlite keeps the state in a file that
+# survives beyond the in-memory cache, e.g. on an EFS mount.
+ALERT_COOLDOWN_SECONDS = float(os.environ.get("alertCooldownSeconds", "0"))
+ALERT_CACHE_SIZE = int(os.environ.get("alertCacheSize", "100000"))
+ALERT_STORE = os.environ.get("alertStore", "memory")
+
+suppressor = AlertSuppressor(
+    ALERT_COOLDOWN_SECONDS,
+    max_entries=ALERT_CACHE_SIZE,
+    store=SQLiteStore(os.environ.get("alertStorePath", "/tmp/alert_state.db")) if ALERT_STORE == "sqlite" else None,
+)
+
+# Alerts replayed by the Flink job after a restart are only published once
+# per warm execution environment
+recent_alerts = RecentAlerts(max_entries=ALERT_CACHE_SIZE)
+
+SUBJECT = "The sensor reading has exceeded the threshold"
+
+
+def alert_message(data, suppressed=0):
+    message = f"Sensor Id: {data['sensor_id']} has exceeded the set threshold at the window start time: {data['start_event_time']}"
+    # Sensor metadata joined in by the Flink job, NULL for unknown sensors
+    if data.get("site"):
+        message += f". Site: {data['site']}"
+    if data.get("owner"):
+        message += f", owner: {data['owner']}"
+    if data.get("threshold") is not None:
+        message += f", threshold: {data['threshold']}"
+    if suppressed:
+        message += f" ({suppressed} more breaches since the previous notification)"
+    return message
+
+
+def retry_backoff(attempt):
+    # Exponential with jitter, so throttled concurrent calls spread out
+    return RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1) * random.uniform(0.5, 1.0)
+
+
+def publish_attempt(topic_arn, pending):
+    # One PublishBatch call. Returns the errors by entry id and the entries
+    # worth retrying
+    try:
+        with metrics.timer("PublishMillis"):
+            response = sns.publish_batch(TopicArn=topic_arn, PublishBatchRequestEntries=pending)
+    except ClientError as e:
+        code = e.response.get("Error", {}).get("Code")
+        if code not in THROTTLING_CODES:
+            raise
+        metrics.count("PublishThrottled")
+        return {entry["Id"]: code for entry in pending}, pending
+    finally:
+        metrics.count("PublishCalls")
+    errors = {}
+    retry = []
+    by_id = {entry["Id"]: entry for entry in pending}
+    for failure in response.get("Failed", []):
+        # Sender faults (bad request) fail the same way on every attempt
+        if failure.get("SenderFault"):
+            errors[failure["Id"]] = "SenderFault:" + str(failure.get("Code"))
+        else:
+            errors[failure["Id"]] = failure.get("Code")
+            retry.append(by_id[failure["Id"]])
+    return errors, retry
+
+
+def merge_errors(errors, pending, attempt_errors):
+    # Entries of the attempt that are not in its errors were published
+    for entry in pending:
+        errors.pop(entry["Id"], None)
+    errors.update(attempt_errors)
+
+
+def publish_batch(topic_arn, entries):
+    # Returns the entries that still failed after PUBLISH_ATTEMPTS, with the error
+    pending = entries
+    errors = {}
+    for attempt in range(PUBLISH_ATTEMPTS):
+        if attempt:
+            time.sleep(retry_backoff(attempt))
+        attempt_errors, retry = publish_attempt(topic_arn, pending)
+        merge_errors(errors, pending, attempt_errors)
+        if not retry:
+            break
+        pending = retry
+    return errors
+
+
+def entry_id(record_value, index):
+    # Entry ids only need to be unique per request; the offset also
+    # identifies the record in the failure report
+    return str(record_value.get("offset", index))
+
+
+def partition_alerts(partition_key, records, stats, deadline=None):
+    # Yields (SNS entry, (alert key, suppressed alerts in its digest)) for the
+    # alerts of a partition to publish, in offset order. Undecodable records,
+    # duplicates and suppressed repeats are only counted in stats. Records
+    # reached after the deadline (a time.monotonic() value) are left untouched
+    # and listed as deferred.
+    pending = set()
+    # Sensors with an alert yielded in this call, their repeats are
+    # suppressed even before record_batch starts the cooldown
+    sending = set()
+    now_millis = time.time() * 1000
+    for index, record_value in enumerate(records):
+        if deadline is not None and time.monotonic() >= deadline:
+            stats["deferred"] = [entry_id(value, index + offset) for offset, value in enumerate(records[index:])]
+            return
+        record_id = entry_id(record_value, index)
+        try:
+            data = decode_alert_value(record_value['value'])
+        except (ValueError, KeyError, IndexError) as e:
+            print(f"Undecodable record {partition_key}:{record_id}: {e!r}")
+            stats["failed"].append(record_id)
+            continue
+        # Write-to-read delay; with an exactly-once sink this includes the
+        # wait for the checkpoint that commits the Flink transaction
+        if "timestamp" in record_value:
+            metrics.observe("AlertVisibilityMillis", now_millis - record_value["timestamp"])
+        key = (data['sensor_id'], data['start_event_time'])
+        if key in pending or recent_alerts.seen(key):
+            stats["duplicates"] += 1
+            continue
+        pending.add(key)
+        send, repeats = suppressor.check(data['sensor_id'])
+        if not send or (suppressor.cooldown > 0 and data['sensor_id'] in sending):
+            suppressor.suppress(data['sensor_id'])
+            recent_alerts.add(key)
+            stats["suppressed"] += 1
+            continue
+        sending.add(data['sensor_id'])
+        yield {"Id": record_id, "Subject": SUBJECT, "Message": alert_message(data, repeats)}, (key, repeats)
+
+
+def record_batch(partition_key, batch, errors, stats):
+    for entry, (key, repeats) in batch:
+        if entry["Id"] in errors:
+            print(f"Publish failed for {partition_key}:{entry['Id']}: {errors[entry['Id']]}")
+            stats["failed"].append(entry["Id"])
+        else:
+            stats["published"] += 1
+            recent_alerts.add(key)
+            # Only a published alert starts the sensor's cooldown
+            suppressor.sent(key[0], repeats)
+
+
+def partition_stats(records):
+    return {"records": len(records), "published": 0, "suppressed": 0, "duplicates": 0, "failed": [], "deferred": []}
+
+
+def partition_result(stats):
+    metrics.observe("PartitionBatchSize", stats["records"], "Count")
+    metrics.count("RecordsConsumed", stats["records"])
+    metrics.count("AlertsPublished", stats["published"])
+    metrics.count("AlertsSuppressed", stats["suppressed"])
+    metrics.count("AlertsDuplicate", stats["duplicates"])
+    metrics.count("AlertsFailed", len(stats["failed"]))
+    metrics.count("RecordsDeferred", len(stats["deferred"]))
+    return stats
+
+
+def publish_partition(topic_arn, partition_key, records, deadline=None):
+    stats = partition_stats(records)
+    batch = []
+    for alert in partition_alerts(partition_key, records, stats, deadline):
+        batch.append(alert)
+        if len(batch) == SNS_BATCH_SIZE:
+            record_batch(partition_key, batch, publish_batch(topic_arn, [entry for entry, _ in batch]), stats)
+            batch = []
+    if batch:
+        record_batch(partition_key, batch, publish_batch(topic_arn, [entry for entry, _ in batch]), stats)
+    return partition_result(stats)
+
+
+async def publish_batch_async(loop, in_flight, topic_arn, batch):
+    # publish_batch with the backoff outside the executor and the in-flight limit
+    pending = [entry for entry, _ in batch]
+    errors = {}
+    for attempt in range(PUBLISH_ATTEMPTS):
+        if attempt:
+            await asyncio.sleep(retry_backoff(attempt))
+        async with in_flight:
+            attempt_errors, retry = await loop.run_in_executor(executor, publish_attempt, topic_arn, pending)
+        merge_errors(errors, pending, attempt_errors)
+        if not retry:
+            break
+        pending = retry
+    return errors
+
+
+async def publish_partition_async(loop, in_flight, queued, topic_arn, partition_key, records, deadline=None):
+    stats = partition_stats(records)
+    tasks = []
+
+    async def send(batch):
+        try:
+            errors = await publish_batch_async(loop, in_flight, topic_arn, batch)
+            record_batch(partition_key, batch, errors, stats)
+        finally:
+            queued.release()
+
+    batch = []
+    for alert in partition_alerts(partition_key, records, stats, deadline):
+        batch.append(alert)
+        if len(batch) < SNS_BATCH_SIZE:
+            continue
+        # Decoding waits while too many batches are queued, so it does not
+        # run ahead of the deadline
+        await queued.acquire()
+        if PUBLISH_ORDERED:
+            await send(batch)
+        else:
+            tasks.append(loop.create_task(send(batch)))
+            # Let the batch go out while the next one is decoded
+            await asyncio.sleep(0)
+        batch = []
+    if batch:
+        await queued.acquire()
+        tasks.append(loop.create_task(send(batch)))
+    await asyncio.gather(*tasks)
+    return partition_result(stats)
+
+
+async def publish_event_async(topic_arn, records, deadline=None):
+    loop = asyncio.get_running_loop()
+    # At most PUBLISH_CONCURRENCY calls in flight, the executor's size
+    in_flight = asyncio.Semaphore(PUBLISH_CONCURRENCY)
+    # Batches decoded but not yet published, across partitions
+    queued = asyncio.Semaphore(2 * PUBLISH_CONCURRENCY)
+    results = await asyncio.gather(*(
+        publish_partition_async(loop, in_flight, queued, topic_arn, partition_key, partition_value, deadline)
+        for partition_key, partition_value in records.items()))
+    return dict(zip(records, results))
+
+
+def publish_event(topic_arn, records, deadline=None):
+    futures = {
+        partition_key: executor.submit(publish_partition, topic_arn, partition_key, partition_value, deadline)
+        for partition_key, partition_value in records.items()
+    }
+    return {partition_key: future.result() for partition_key, future in futures.items()}
+
+
+def time_budget_deadline(context):
+    # time.monotonic() value after which no new alert is started, None
+    # without a Lambda context (local runs)
+    if context is None:
+        return None
+    return time.monotonic() + (context.get_remaining_time_in_millis() - TIME_BUDGET_RESERVE_MS) / 1000.0
 
-sns = boto3.client('sns')
 
 def lambda_handler(event, context):
+    started = time.perf_counter()
     topic_arn = os.environ["SNSTopicArn"]
-    for partition_key, partition_value in event['records'].items():
-        for record_value in partition_value:
-            data = json.loads(base64.b64decode(record_value['value']))
-            subject = "The sensor reading has exceeded the threshold"
-            message = f"Sensor Id: {data['sensor_id']} has exceeded the set threshold at the window start time: {data['start_event_time']}"
-            sns.publish(
-                TargetArn=topic_arn,
-                Message=message,
-                Subject=subject
-            )
\ No newline at end of file
+    deadline = time_budget_deadline(context)
+    if PUBLISH_MODE == "async":
+        partitions = asyncio.run(publish_event_async(topic_arn, event['records'], deadline))
+    else:
+        partitions = publish_event(topic_arn, event['records'], deadline)
+
+    batch_item_failures = [
+        {"itemIdentifier": f"{partition_key}:{offset}"}
+        for partition_key, result in partitions.items() for offset in result["failed"] + result["deferred"]]
+    deferred = sum(len(result["deferred"]) for result in partitions.values())
+
+    print(json.dumps({key: dict(value, failed=len(value["failed"]), deferred=len(value["deferred"]))
+                      for key, value in partitions.items()}))
+    metrics.observe("HandlerMillis", (time.perf_counter() - started) * 1000)
+    metrics.flush()
+    if deferred:
+        # The MSK event source only redelivers a batch whose invocation
+        # failed. recent_alerts lives in this execution environment's memory:
+        # if the redelivered batch reaches the same warm environment, the
+        # alerts already published are skipped. In any other environment
+        # (cold start, concurrent instance) they are published again.
+        raise RuntimeError(f"{deferred} records deferred past the time budget, the batch will be redelivered")
+    # Same shape as the partial batch response of the SQS/Kinesis event sources.
+    # The MSK event source does not act on it, which is why failed entries are
+    # already retried individually above instead of failing the whole batch.
+    return {"batchItemFailures": batch_item_failures, "partitions": partitions}
@@ -1,57 +1,231 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
-import boto3
-import datetime
 import json
 import os
-import random
 import time
 
 from kafka import KafkaProducer
-from aws_msk_iam_sasl_signer import MSKAuthTokenProvider
+from kafka.errors import KafkaError
 import socket
 
-msk = boto3.client("kafka")
+import msk_client
+import partitioners
+import sensor_generator
+import serialization
+from file_producer import FileProducer
+from metrics import Metrics
+from msk_client import token_provider
 
-# For IAM Auth
-class MSKTokenProvider():
-    def token(self):
-        token, _ = MSKAuthTokenProvider.generate_auth_token(os.environ['AWS_REGION'])
-        return token
+# Throughput-oriented producer settings, overridable through the function environment.
+# Records are batched per partition for up to LINGER_MS or BATCH_SIZE bytes and
+# compressed per batch; the invocation flushes once at the end.
+RECORD_COUNT = int(os.environ.get("recordCount", str(sensor_generator.DEFAULTS["records"])))
+LINGER_MS = int(os.environ.get("lingerMs", "20"))
+BATCH_SIZE = int(os.environ.get("batchSize", str(256 * 1024)))
+# Codecs of kafka-python 2.0.2 (zstd needs 2.1+ brokers), "none" to disable
+COMPRESSION_TYPES = ("gzip", "snappy", "lz4", "zstd", "none")
+COMPRESSION_TYPE = os.environ.get("compressionType", "lz4")
+if COMPRESSION_TYPE not in COMPRESSION_TYPES:
+    raise ValueError("compressionType must be one of {}, got {!r}".format(COMPRESSION_TYPES, COMPRESSION_TYPE))
 
+# Record values are pre-encoded bytes in the format shared with the Flink job
+encode_record = serialization.record_encoder(serialization.wire_format())
+# Records are keyed by sensor_id unless partitioner is none, see partitioners.py
+PARTITIONER = os.environ.get("partitioner", "murmur2")
+encode_key = partitioners.key_encoder(PARTITIONER)
 
-def lambda_handler(event, context):
-    cluster_arn = os.environ["mskClusterArn"]
-    response = msk.get_bootstrap_brokers(
-        ClusterArn=cluster_arn
-    )
-    print(response)
-    
+# Local runs (local/harness.py): write the records to files under this
+# directory instead of MSK, one directory per topic
+LOCAL_OUTPUT_PATH = os.environ.get("localOutputPath")
+
+metrics = Metrics()
+
+# Warm-start reuse: the producer below (like the bootstrap string and IAM token
+# in msk_client) lives at module level and survives between invocations of the
+# same execution environment.
+_producer_cache = {"producer": None, "servers": None, "healthy": False}
+
+
+def get_bootstrap_servers(cluster_arn):
+    if LOCAL_OUTPUT_PATH:
+        return "file://" + LOCAL_OUTPUT_PATH
+    return msk_client.get_bootstrap_servers(cluster_arn)
+
+
+def create_producer(bootstrap_servers):
+    if LOCAL_OUTPUT_PATH:
+        return FileProducer(LOCAL_OUTPUT_PATH)
+    options = {}
+    partitioner = partitioners.partitioner(PARTITIONER)
+    if partitioner is not None:
+        options["partitioner"] = partitioner
     # IAM Auth
-    tp = MSKTokenProvider()
-    producer = KafkaProducer(security_protocol="SASL_SSL", 
-                             bootstrap_servers=response["BootstrapBrokerStringSaslIam"],
-                             value_serializer=lambda x: x.encode("utf-8"),
-                             sasl_mechanism='OAUTHBEARER',
-                             sasl_oauth_token_provider=tp,
-                             client_id=socket.gethostname(),
-                            #  api_version=(2,3,1),
-                            #  api_version_auto_timeout_ms=5000,
-                             )
-    # # Plaintext Auth                    
-    # producer = KafkaProducer(security_protocol="PLAINTEXT",#
-    #                          bootstrap_servers=response["BootstrapBrokerString"],#
-    #                          value_serializer=lambda x: x.encode("utf-8"),
-                            #  )
-
-    for _ in range(1, 100):
-       
-        data = json.dumps({
-            "sensor_id": str(random.randint(1, 5)),
-            "temperature": random.randint(27, 32),
-            "event_time": datetime.datetime.now().isoformat()
-        })
-        resp = producer.send(os.environ["topicName"], value=data)
+    return KafkaProducer(security_protocol="SASL_SSL",
+                         bootstrap_servers=bootstrap_servers,
+                         sasl_mechanism='OAUTHBEARER',
+                         sasl_oauth_token_provider=token_provider,
+                         client_id=socket.gethostname(),
+                         linger_ms=LINGER_MS,
+                         batch_size=BATCH_SIZE,
+                         compression_type=None if COMPRESSION_TYPE == "none" else COMPRESSION_TYPE,
+                        #  api_version=(2,3,1),
+                        #  api_version_auto_timeout_ms=5000,
+                         **options)
+    # # Plaintext Auth
+    # return KafkaProducer(security_protocol="PLAINTEXT",#
+    #                      bootstrap_servers=bootstrap_servers,#
+                        #  )
+
+
+def producer_healthy(producer):
+    # partitions_for() only reads cached metadata, so it cannot tell a dead
+    # producer from a live one. Instead the producer must not be closed, its
+    # sender thread (which does all the network I/O) must still run, and at
+    # least one broker must be connected or not in reconnect backoff.
+    # least_loaded_node() does not block, and returns None when every
+    # connection attempt is failing.
+    if isinstance(producer, FileProducer):
+        return True
+    return (not producer._closed and producer._sender.is_alive()
+            and producer._sender._client.least_loaded_node() is not None)
+
+
+def get_producer(bootstrap_servers, topic):
+    producer = _producer_cache["producer"]
+    if producer is not None:
+        if (_producer_cache["healthy"] and _producer_cache["servers"] == bootstrap_servers
+                and producer_healthy(producer)):
+            return producer
+        print("Rebuilding Kafka producer")
+        try:
+            producer.close(timeout=5)
+        except KafkaError as e:
+            print("Closing stale producer failed: {}".format(e))
+
+    producer = create_producer(bootstrap_servers)
+    # Fetch topic metadata now so it is already cached on warm invocations
+    producer.partitions_for(topic)
+    _producer_cache.update(producer=producer, servers=bootstrap_servers, healthy=True)
+    return producer
+
+
+def check_deliveries(futures):
+    # All futures are resolved after flush(), so this never blocks
+    failed = 0
+    value_bytes = 0
+    for future in futures:
+        if future.failed():
+            failed += 1
+            print("Delivery failed: {}".format(future.exception))
+        else:
+            value_bytes += future.value.serialized_value_size
+    return failed, value_bytes
+
+
+def producer_stats(producer, sent, failed, value_bytes, elapsed):
+    metrics = producer.metrics().get("producer-metrics", {})
+    return {
+        "records": sent,
+        "failed": failed,
+        "bytes": value_bytes,
+        "seconds": round(elapsed, 3),
+        "records_per_sec": round(sent / elapsed, 1) if elapsed else None,
+        "batch_size_avg": metrics.get("batch-size-avg"),
+        "records_per_request_avg": metrics.get("records-per-request-avg"),
+        "request_latency_avg": metrics.get("request-latency-avg"),
+        "compression_rate_avg": metrics.get("compression-rate-avg"),
+    }
+
+
+def send_records(producer, topic, records):
+    started = time.time()
+    futures = []
+    for record in records:
+        if metrics.sample():
+            # Sampled per-record timings, the other records take the plain path
+            sampled = time.perf_counter()
+            value = encode_record(record)
+            encoded = time.perf_counter()
+            futures.append(producer.send(topic, key=encode_key(record[0]), value=value))
+            metrics.observe("SerializeMicros", (encoded - sampled) * 1e6, "Microseconds")
+            metrics.observe("SendMicros", (time.perf_counter() - encoded) * 1e6, "Microseconds")
+        else:
+            futures.append(producer.send(topic, key=encode_key(record[0]), value=encode_record(record)))
+    # Single flush: lets kafka-python fill batches instead of a round trip per record
+    with metrics.timer("FlushMillis"):
         producer.flush()
-        #time.sleep(1)
+    elapsed = time.time() - started
+
+    failed, value_bytes = check_deliveries(futures)
+    metrics.count("RecordsSent", len(futures) - failed)
+    metrics.count("RecordsFailed", failed)
+    metrics.count("BytesSent", value_bytes, "Bytes")
+    return producer_stats(producer, len(futures), failed, value_bytes, elapsed)
+
+
+def send_from_worker(records):
+    # Runs in a sensor_generator worker process. The inherited producer's I/O
+    # thread does not survive the fork, so each worker connects on its own,
+    # with the bootstrap string the parent cached before forking. The parent's
+    # pending metrics (e.g. BootstrapMillis) are flushed by the parent only.
+    metrics.reset()
+    producer = create_producer(get_bootstrap_servers(os.environ["mskClusterArn"]))
+    try:
+        return send_records(producer, os.environ["topicName"], records)
+    finally:
+        producer.close()
+        metrics.flush()
+
+
+def combine_stats(results, elapsed):
+    sent = sum(r["records"] for r in results)
+    return {
+        "records": sent,
+        "failed": sum(r["failed"] for r in results),
+        "bytes": sum(r["bytes"] for r in results),
+        "seconds": round(elapsed, 3),
+        "records_per_sec": round(sent / elapsed, 1) if elapsed else None,
+        "processes": len(results),
+    }
+
+
+def lambda_handler(event, context):
+    # Load shape comes from the invocation event (see sensor_generator.EVENT_KEYS),
+    # the record count defaults to the recordCount environment variable
+    params = {"records": RECORD_COUNT}
+    params.update(event or {})
+    config = sensor_generator.generator_config(params)
+    # Sharded mode: one of shardCount concurrent invocations (see LambdaStack),
+    # owning its own range of sensor ids
+    if params.get("shardCount") is not None:
+        config = sensor_generator.shard_config(config, int(params.get("shard", 0)), int(params["shardCount"]))
+    processes = int(params.get("processes", 1))
+
+    topic = os.environ["topicName"]
+    with metrics.timer("BootstrapMillis"):
+        bootstrap_servers = get_bootstrap_servers(os.environ["mskClusterArn"])
+
+    try:
+        if processes == 1:
+            with metrics.timer("ProducerMillis"):
+                producer = get_producer(bootstrap_servers, topic)
+            with metrics.timer("SendPhaseMillis"):
+                stats = send_records(producer, topic, sensor_generator.generate(config))
+        else:
+            started = time.time()
+            with metrics.timer("SendPhaseMillis"):
+                results = sensor_generator.run_parallel(config, send_from_worker, processes)
+            stats = combine_stats(results, time.time() - started)
+    except KafkaError:
+        _producer_cache["healthy"] = False
+        raise
+    finally:
+        metrics.flush()
+    print(json.dumps(stats))
+
+    if stats["failed"]:
+        # Rebuild the producer (and its connections) on the next invocation
+        _producer_cache["healthy"] = False
+        raise RuntimeError("{} of {} records were not delivered".format(stats["failed"], stats["records"]))
+    return stats
@@ -0,0 +1,72 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Custom resource handler (custom_resources.Provider) that creates the
+# pipeline's topics with explicit partition counts instead of leaving them to
+# auto.create.topics.enable. Resource properties:
+#
+#   {"ClusterArn": "...", "Topics": [{"Name": "kfp_sensor_topic",
+#     "Partitions": 12, "ReplicationFactor": 3}, ...]}
+#
+# An optional "Configs" map of a topic (e.g. {"cleanup.policy": "compact"})
+# is applied when the topic is created.
+#
+# A topic that already exists (e.g. auto-created by an early client) gets
+# more partitions when it has fewer than planned; Kafka cannot remove
+# partitions, so a lower count is left as it is. Deleting the resource keeps
+# the topics and their data.
+
+import json
+import socket
+
+from kafka.admin import KafkaAdminClient, NewPartitions, NewTopic
+
+from msk_client import get_bootstrap_servers, token_provider
+
+
+def create_admin(bootstrap_servers):
+    # IAM Auth, as the producer
+    return KafkaAdminClient(security_protocol="SASL_SSL",
+                            bootstrap_servers=bootstrap_servers,
+                            sasl_mechanism="OAUTHBEARER",
+                            sasl_oauth_token_provider=token_provider,
+                            client_id=socket.gethostname())
+
+
+def check_errors(response, action):
+    failed = ["{} ({})".format(error[0], error[1]) for error in response.topic_errors if error[1] != 0]
+    if failed:
+        raise RuntimeError("{} failed for {}".format(action, ", ".join(failed)))
+
+
+def provision_topics(admin, topics):
+    existing = {topic["topic"]: len(topic["partitions"])
+                for topic in admin.describe_topics([t["Name"] for t in topics]) if topic["error_code"] == 0}
+    created = [NewTopic(name=t["Name"], num_partitions=int(t["Partitions"]),
+                        replication_factor=int(t["ReplicationFactor"]), topic_configs=t.get("Configs", {}))
+               for t in topics if t["Name"] not in existing]
+    grown = {t["Name"]: NewPartitions(total_count=int(t["Partitions"]))
+             for t in topics if existing.get(t["Name"], int(t["Partitions"])) < int(t["Partitions"])}
+    if created:
+        check_errors(admin.create_topics(created), "CreateTopics")
+    if grown:
+        check_errors(admin.create_partitions(grown), "CreatePartitions")
+    return {
+        "created": sorted(topic.name for topic in created),
+        "grown": sorted(grown),
+        "unchanged": sorted(name for name in existing if name not in grown),
+    }
+
+
+def lambda_handler(event, context):
+    properties = event["ResourceProperties"]
+    physical_id = "topics-" + properties["ClusterArn"].split("/")[-1]
+    if event["RequestType"] == "Delete":
+        return {"PhysicalResourceId": physical_id}
+    admin = create_admin(get_bootstrap_servers(properties["ClusterArn"]))
+    try:
+        result = provision_topics(admin, properties["Topics"])
+    finally:
+        admin.close()
+    print(json.dumps(result))
+    return {"PhysicalResourceId": physical_id}
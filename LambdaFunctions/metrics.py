@@ -0,0 +1,115 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Metrics for the Lambda functions as CloudWatch Embedded Metric Format (EMF)
+# log lines: CloudWatch extracts the metrics from the function's log, so
+# recording them costs no API calls.
+#
+# Counters are summed and histograms keep a bounded reservoir of values until
+# flush(), which prints one EMF line per invocation. Per-record timings are
+# only taken for every SAMPLE_EVERY-th record (see Metrics.sample).
+
+import json
+import os
+import random
+import threading
+import time
+
+NAMESPACE = os.environ.get("metricsNamespace", "KfpSensorPipeline")
+# Time one record in this many, 0 to disable per-record timings
+SAMPLE_EVERY = int(os.environ.get("metricsSampleEvery", "100"))
+# EMF accepts at most 100 values per metric and line
+MAX_VALUES = 100
+
+
+class Metrics():
+    def __init__(self, namespace=NAMESPACE, dimensions=None, sample_every=SAMPLE_EVERY):
+        self.namespace = namespace
+        self.dimensions = dimensions or {"FunctionName": os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "local")}
+        self.sample_every = sample_every
+        self._sampled = 0
+        self._lock = threading.Lock()
+        self._reset()
+
+    def reset(self):
+        # Drops the values not flushed yet, e.g. the copy a forked worker
+        # inherits from its parent, which the parent flushes itself
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.counters = {}
+        # name -> [reservoir, observations]
+        self.histograms = {}
+        self.units = {}
+
+    def count(self, name, value=1, unit="Count"):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            self.units[name] = unit
+
+    def observe(self, name, value, unit="Milliseconds"):
+        with self._lock:
+            histogram = self.histograms.setdefault(name, [[], 0])
+            histogram[1] += 1
+            # Reservoir sampling keeps a uniform sample of every observation
+            if len(histogram[0]) < MAX_VALUES:
+                histogram[0].append(value)
+            else:
+                index = random.randrange(histogram[1])
+                if index < MAX_VALUES:
+                    histogram[0][index] = value
+            self.units[name] = unit
+
+    def sample(self):
+        # True for one call in sample_every; not locked, a skewed sample is harmless
+        if not self.sample_every:
+            return False
+        self._sampled += 1
+        if self._sampled >= self.sample_every:
+            self._sampled = 0
+            return True
+        return False
+
+    def timer(self, name):
+        return _Timer(self, name)
+
+    def emf(self):
+        with self._lock:
+            counters, histograms, units = self.counters, self.histograms, self.units
+            self._reset()
+        record = dict(self.dimensions)
+        definitions = []
+        for name, value in counters.items():
+            record[name] = value
+            definitions.append({"Name": name, "Unit": units[name]})
+        for name, (values, _) in histograms.items():
+            record[name] = [round(value, 3) for value in values]
+            definitions.append({"Name": name, "Unit": units[name]})
+        record["_aws"] = {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": self.namespace,
+                "Dimensions": [sorted(self.dimensions)],
+                "Metrics": definitions,
+            }],
+        }
+        return record
+
+    def flush(self):
+        if self.counters or self.histograms:
+            print(json.dumps(self.emf(), separators=(",", ":")))
+
+
+class _Timer():
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, (time.perf_counter() - self.started) * 1000)
+        return False
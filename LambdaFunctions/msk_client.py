@@ -0,0 +1,51 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# MSK connection helpers shared by the producer and the topic provisioner:
+# the cluster's IAM bootstrap brokers and the IAM auth token provider for
+# kafka-python's OAUTHBEARER mechanism.
+#
+# Warm-start reuse: the bootstrap string and the token live at module level and
+# survive between invocations of the same execution environment.
+
+import os
+import time
+
+import boto3
+from aws_msk_iam_sasl_signer import MSKAuthTokenProvider
+
+msk = boto3.client("kafka")
+
+BOOTSTRAP_TTL_SECONDS = int(os.environ.get("bootstrapTtlSeconds", "900"))
+# Regenerate the IAM auth token this long before it expires
+TOKEN_REFRESH_MARGIN_SECONDS = 60
+
+_bootstrap_cache = {"servers": None, "expires_at": 0}
+
+
+# For IAM Auth
+class MSKTokenProvider():
+    def __init__(self):
+        self._token = None
+        self._expires_at = 0
+
+    def token(self):
+        # generate_auth_token returns the expiry in epoch milliseconds
+        if self._token is None or time.time() >= self._expires_at - TOKEN_REFRESH_MARGIN_SECONDS:
+            self._token, expiry_ms = MSKAuthTokenProvider.generate_auth_token(os.environ['AWS_REGION'])
+            self._expires_at = expiry_ms / 1000
+        return self._token
+
+
+token_provider = MSKTokenProvider()
+
+
+def get_bootstrap_servers(cluster_arn):
+    now = time.time()
+    if _bootstrap_cache["servers"] is None or now >= _bootstrap_cache["expires_at"]:
+        response = msk.get_bootstrap_brokers(
+            ClusterArn=cluster_arn
+        )
+        _bootstrap_cache["servers"] = response["BootstrapBrokerStringSaslIam"]
+        _bootstrap_cache["expires_at"] = now + BOOTSTRAP_TTL_SECONDS
+    return _bootstrap_cache["servers"]
@@ -0,0 +1,37 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Record keys and partitioners of kfp_sensor_topic, chosen with the
+# partitioner environment variable of kfpLambdaStreamProducer:
+#
+#   murmur2   records keyed by sensor_id, murmur2 hash of the key (kafka-python's
+#             default, the partition the Java client and Flink would pick)
+#   modulo    records keyed by sensor_id, integer id modulo the partition
+#             count, so a contiguous range of ids spreads evenly
+#   none      unkeyed records, spread over partitions regardless of sensor
+#
+# With a key all readings of a sensor land on one partition, in the order
+# they were sent.
+
+PARTITIONERS = ("murmur2", "modulo", "none")
+
+
+def modulo_partitioner(key, all_partitions, available):
+    # Same signature as kafka-python partitioners; sensor ids are integers
+    return all_partitions[int(key) % len(all_partitions)]
+
+
+def partitioner(name):
+    # Returns the KafkaProducer partitioner for name, None to keep
+    # kafka-python's default (murmur2 for keyed records)
+    if name not in PARTITIONERS:
+        raise ValueError("Unsupported partitioner {!r}, expected one of {}".format(name, PARTITIONERS))
+    return modulo_partitioner if name == "modulo" else None
+
+
+def key_encoder(name):
+    # Returns a function sensor_id -> record key
+    partitioner(name)
+    if name == "none":
+        return lambda sensor_id: None
+    return str.encode
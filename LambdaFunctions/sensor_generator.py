@@ -0,0 +1,286 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Synthetic sensor load generator.
+#
+# Used by kfpLambdaStreamProducer (parameters from the invocation event) and
+# runnable from a shell to capacity-test the Flink job:
+#
+#   python sensor_generator.py --records 1000000 --rate 50000 --sensors 2000000 \
+#       --zipf 1.1 --late-ratio 0.01 --max-lateness 20 --seed 42 --processes 0
+#
+# Records are (sensor_id, temperature, event_time) tuples, event_time being UTC
+# epoch seconds, so each sink decides how to serialize them.
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+DEFAULTS = {
+    "records": 99,
+    # Target records/sec for the whole run, 0 for as fast as possible
+    "rate": 0,
+    "sensors": 5,
+    # Zipf exponent of the sensor_id distribution, 0 for uniform
+    "zipf": 0.0,
+    "min_temperature": 27,
+    "max_temperature": 32,
+    # Every record's event time is shifted back by up to this much
+    "out_of_order_seconds": 0.0,
+    # Share of records that arrive late, and the bound on how late they are
+    "late_ratio": 0.0,
+    "max_lateness_seconds": 0.0,
+    "seed": None,
+    # Epoch seconds of the first event; set it together with a rate for a
+    # simulated, fully reproducible clock instead of wall-clock event times
+    "start_time": None,
+    # First sensor id, so several generators can own disjoint id ranges
+    "sensor_offset": 1,
+}
+
+# Lambda event keys (camelCase like the function environment) to generator parameters
+EVENT_KEYS = {
+    "records": "records",
+    "rate": "rate",
+    "sensors": "sensors",
+    "zipfExponent": "zipf",
+    "minTemperature": "min_temperature",
+    "maxTemperature": "max_temperature",
+    "outOfOrderSeconds": "out_of_order_seconds",
+    "lateRatio": "late_ratio",
+    "maxLatenessSeconds": "max_lateness_seconds",
+    "seed": "seed",
+    "startTime": "start_time",
+    "sensorOffset": "sensor_offset",
+}
+
+# Rate pacing granularity
+PACING_INTERVAL_SECONDS = 0.01
+
+
+class ZipfSampler():
+    # Rejection-inversion sampling (Hoermann & Derflinger, 1996): O(1) memory and
+    # time per sample, so millions of keys need no probability table.
+    def __init__(self, n, exponent, rng):
+        self.n = n
+        self.exponent = exponent
+        self.rng = rng
+        self.h_integral_x1 = self._h_integral(1.5) - 1.0
+        self.h_integral_n = self._h_integral(n + 0.5)
+        self.s = 2.0 - self._h_integral_inverse(self._h_integral(2.5) - self._h(2.0))
+
+    def sample(self):
+        while True:
+            u = self.h_integral_n + self.rng.random() * (self.h_integral_x1 - self.h_integral_n)
+            x = self._h_integral_inverse(u)
+            k = min(max(int(x + 0.5), 1), self.n)
+            if k - x <= self.s or u >= self._h_integral(k + 0.5) - self._h(k):
+                return k
+
+    def _h(self, x):
+        return math.exp(-self.exponent * math.log(x))
+
+    def _h_integral(self, x):
+        log_x = math.log(x)
+        return _expm1_over_x((1.0 - self.exponent) * log_x) * log_x
+
+    def _h_integral_inverse(self, x):
+        t = max(x * (1.0 - self.exponent), -1.0)
+        return math.exp(_log1p_over_x(t) * x)
+
+
+def _expm1_over_x(x):
+    if abs(x) > 1e-8:
+        return math.expm1(x) / x
+    return 1.0 + x * 0.5 * (1.0 + x / 3.0 * (1.0 + 0.25 * x))
+
+
+def _log1p_over_x(x):
+    if abs(x) > 1e-8:
+        return math.log1p(x) / x
+    return 1.0 - x * (0.5 - x * (1.0 / 3.0 - 0.25 * x))
+
+
+def generator_config(event=None, **overrides):
+    config = dict(DEFAULTS)
+    for key, name in EVENT_KEYS.items():
+        if event and event.get(key) is not None:
+            config[name] = event[key]
+    config.update(overrides)
+    if config["sensors"] < 1 or config["records"] < 0 or config["rate"] < 0:
+        raise ValueError("sensors must be >= 1, records and rate >= 0")
+    if not 0.0 <= config["late_ratio"] <= 1.0:
+        raise ValueError("late_ratio must be between 0 and 1")
+    return config
+
+
+def generate(config):
+    rng = random.Random(config["seed"])
+    sensors = int(config["sensors"])
+    offset = int(config["sensor_offset"])
+    if config["zipf"] > 0 and sensors > 1:
+        sample_sensor = ZipfSampler(sensors, float(config["zipf"]), rng).sample
+    else:
+        sample_sensor = lambda: rng.randint(1, sensors)
+    min_temperature = int(config["min_temperature"])
+    max_temperature = int(config["max_temperature"])
+    out_of_order = float(config["out_of_order_seconds"])
+    late_ratio = float(config["late_ratio"])
+    max_lateness = float(config["max_lateness_seconds"])
+    # Truncated exponential, most late records are only slightly late
+    lateness_rate = 3.0 / max_lateness if max_lateness > 0 else 0.0
+
+    rate = float(config["rate"])
+    simulated = config["start_time"] is not None and rate > 0
+    chunk = max(1, int(rate * PACING_INTERVAL_SECONDS)) if rate > 0 else 0
+    started = time.time()
+
+    for i in range(int(config["records"])):
+        if simulated:
+            now = config["start_time"] + i / rate
+        else:
+            if chunk and i % chunk == 0:
+                # Sleep until the schedule catches up, never burst ahead of it
+                ahead = i / rate - (time.time() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+            now = time.time()
+
+        event_time = now
+        if out_of_order:
+            event_time -= rng.random() * out_of_order
+        if late_ratio and rng.random() < late_ratio:
+            event_time -= min(rng.expovariate(lateness_rate), max_lateness) if lateness_rate else 0.0
+
+        yield (str(sample_sensor() + offset - 1),
+               rng.randint(min_temperature, max_temperature),
+               event_time)
+
+
+def split_config(config, parts):
+    # Same sensor population and skew in every part, but independent streams
+    # (seed + index) sharing the record count and the rate.
+    configs = []
+    for index in range(parts):
+        part = dict(config)
+        part["records"] = config["records"] // parts + (1 if index < config["records"] % parts else 0)
+        part["rate"] = config["rate"] / parts
+        if config["seed"] is not None:
+            part["seed"] = config["seed"] + index
+        configs.append(part)
+    return configs
+
+
+def shard_config(config, shard, shard_count):
+    # The shard-th of shard_count generators running side by side, e.g.
+    # concurrent producer invocations: a disjoint, contiguous range of the
+    # sensor ids, with its share of the records and the rate. The Zipf skew
+    # applies within each range.
+    if not 0 <= shard < shard_count:
+        raise ValueError("shard must be between 0 and shardCount - 1, got {} of {}".format(shard, shard_count))
+    if config["sensors"] < shard_count:
+        raise ValueError("sensors ({}) must be at least shardCount ({})".format(config["sensors"], shard_count))
+    part = dict(config)
+    sensors, extra = divmod(int(config["sensors"]), shard_count)
+    part["sensors"] = sensors + (1 if shard < extra else 0)
+    part["sensor_offset"] = int(config["sensor_offset"]) + shard * sensors + min(shard, extra)
+    part["records"] = config["records"] // shard_count + (1 if shard < config["records"] % shard_count else 0)
+    part["rate"] = config["rate"] / shard_count
+    if config["seed"] is not None:
+        part["seed"] = config["seed"] + shard
+    return part
+
+
+def _run_worker(sink, config, connection):
+    try:
+        connection.send(sink(generate(config)))
+    except Exception as e:
+        connection.send({"error": repr(e)})
+    finally:
+        connection.close()
+
+
+def run_parallel(config, sink, processes=0):
+    # sink(records) consumes an iterator of records and returns a picklable
+    # result; it must be a module-level function. Pipes instead of
+    # multiprocessing.Pool/Queue because Lambda has no /dev/shm.
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        return [sink(generate(config))]
+
+    workers = []
+    for part in split_config(config, processes):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_run_worker, args=(sink, part, sender))
+        process.start()
+        workers.append((process, receiver))
+
+    results = []
+    for process, receiver in workers:
+        results.append(receiver.recv())
+        process.join()
+    errors = [r["error"] for r in results if isinstance(r, dict) and "error" in r]
+    if errors:
+        raise RuntimeError("Generator workers failed: {}".format(errors))
+    return results
+
+
+def count_sink(records):
+    count = 0
+    for _ in records:
+        count += 1
+    return count
+
+
+def stdout_sink(records):
+    write = sys.stdout.write
+    count = 0
+    for sensor_id, temperature, event_time in records:
+        write(json.dumps({"sensor_id": sensor_id, "temperature": temperature, "event_time": event_time}) + "\n")
+        count += 1
+    sys.stdout.flush()
+    return count
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Synthetic sensor load generator")
+    parser.add_argument("--records", type=int, default=DEFAULTS["records"])
+    parser.add_argument("--rate", type=float, default=DEFAULTS["rate"], help="records/sec, 0 for unlimited")
+    parser.add_argument("--sensors", type=int, default=DEFAULTS["sensors"])
+    parser.add_argument("--zipf", type=float, default=DEFAULTS["zipf"], help="Zipf exponent, 0 for uniform")
+    parser.add_argument("--out-of-order", type=float, default=DEFAULTS["out_of_order_seconds"])
+    parser.add_argument("--late-ratio", type=float, default=DEFAULTS["late_ratio"])
+    parser.add_argument("--max-lateness", type=float, default=DEFAULTS["max_lateness_seconds"])
+    parser.add_argument("--seed", type=int, default=DEFAULTS["seed"])
+    parser.add_argument("--start-time", type=float, default=DEFAULTS["start_time"])
+    parser.add_argument("--processes", type=int, default=1, help="worker processes, 0 for one per core")
+    parser.add_argument("--sink", choices=["stdout", "count"], default="stdout",
+                        help="count only measures generation throughput")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.sink == "stdout" and args.processes != 1:
+        raise SystemExit("--sink stdout writes from a single process, use --processes 1")
+    config = generator_config(
+        records=args.records, rate=args.rate, sensors=args.sensors, zipf=args.zipf,
+        out_of_order_seconds=args.out_of_order, late_ratio=args.late_ratio,
+        max_lateness_seconds=args.max_lateness, seed=args.seed, start_time=args.start_time)
+    sink = stdout_sink if args.sink == "stdout" else count_sink
+
+    started = time.time()
+    total = sum(run_parallel(config, sink, args.processes))
+    elapsed = time.time() - started
+    print(json.dumps({"records": total, "seconds": round(elapsed, 3),
+                      "records_per_sec": round(total / elapsed, 1) if elapsed else None}),
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Wire formats for kfp_sensor_topic (sensor readings) and kfp_sns_topic (alerts).
+#
+# The format is chosen once, by the "wireFormat" CDK context value, and reaches
+# the Lambda functions as the wireFormat environment variable and the Flink job
+# as the "wire.format" property (see PythonKafkaSink/wire_formats.py). Every
+# encoding here is byte-compatible with the corresponding Flink 1.13 format:
+#   json - 'format' = 'json' with ISO-8601 timestamps
+#   csv  - 'format' = 'csv', SQL timestamps ("2023-01-31 12:00:00.123")
+#   avro - 'format' = 'avro', schemaless Avro binary following schemas/*.avsc
+
+import binascii
+import csv
+import datetime
+import json
+import os
+import re
+import struct
+import time
+
+WIRE_FORMATS = ("json", "csv", "avro")
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schemas")
+
+
+def wire_format():
+    fmt = os.environ.get("wireFormat", "json")
+    if fmt not in WIRE_FORMATS:
+        raise ValueError("Unsupported wireFormat {!r}, expected one of {}".format(fmt, WIRE_FORMATS))
+    return fmt
+
+
+# Timestamps
+
+_second_cache = {"second": None, "iso": None, "sql": None}
+
+
+def _format_second(second):
+    # Records arrive in roughly time order, so the formatted seconds part is
+    # computed once and reused for all records of the same second
+    if _second_cache["second"] != second:
+        parts = time.gmtime(second)
+        _second_cache["second"] = second
+        _second_cache["iso"] = time.strftime("%Y-%m-%dT%H:%M:%S", parts).encode()
+        _second_cache["sql"] = time.strftime("%Y-%m-%d %H:%M:%S", parts).encode()
+    return _second_cache
+
+
+def _split_millis(event_time):
+    millis = int(round(event_time * 1000))
+    return millis // 1000, b".%03d" % (millis % 1000)
+
+
+def _needs_quoting(value):
+    return not value.isalnum()
+
+
+# JSON: static fragments are pre-encoded, only the three values are formatted
+
+_JSON_SENSOR = b'{"sensor_id":'
+_JSON_TEMPERATURE = b',"temperature":'
+_JSON_EVENT_TIME = b',"event_time":"'
+_JSON_END = b'"}'
+
+
+def encode_json(record):
+    sensor_id, temperature, event_time = record
+    second, millis = _split_millis(event_time)
+    return b"".join((
+        _JSON_SENSOR,
+        json.dumps(sensor_id).encode() if _needs_quoting(sensor_id) else b'"' + sensor_id.encode() + b'"',
+        _JSON_TEMPERATURE, b"%d" % temperature,
+        _JSON_EVENT_TIME, _format_second(second)["iso"], millis,
+        _JSON_END,
+    ))
+
+
+def decode_json(value):
+    return json.loads(value)
+
+
+# Alerts as Flink writes them: compact, in table order, NULL as null. String
+# values without quotes or escapes are taken as they are; anything else
+# (escapes, whitespace, other columns) goes through json.loads.
+_JSON_ALERT = re.compile(
+    rb'\{"sensor_id":"([^"\\]*)","count_temp":(-?\d+),"start_event_time":(?:"([^"\\]*)"|null)'
+    rb'(?:,"site":(?:"([^"\\]*)"|null),"owner":(?:"([^"\\]*)"|null),"threshold":(?:null|(-?[0-9.eE+-]+)))?\}')
+
+
+def _text(value):
+    return None if value is None else value.decode()
+
+
+def decode_json_alert(value):
+    # Only the fields of the notification, with one regular expression match
+    # instead of building the whole object. Both paths return the columns of
+    # sensor_alert.avsc, missing ones as None.
+    match = _JSON_ALERT.fullmatch(value)
+    if match is None:
+        alert = json.loads(value)
+        return {name: alert.get(name) for name in ALERT_FIELDS}
+    sensor_id, count_temp, start_event_time, site, owner, threshold = match.groups()
+    return {"sensor_id": sensor_id.decode(), "count_temp": int(count_temp),
+            "start_event_time": _text(start_event_time),
+            "site": _text(site), "owner": _text(owner),
+            "threshold": None if threshold is None else float(threshold)}
+
+
+# CSV: one row per Kafka record, columns in table order
+
+def encode_csv(record):
+    sensor_id, temperature, event_time = record
+    second, millis = _split_millis(event_time)
+    if _needs_quoting(sensor_id):
+        sensor_id = '"' + sensor_id.replace('"', '""') + '"'
+    return b"%s,%d,%s%s" % (sensor_id.encode(), temperature,
+                            _format_second(second)["sql"], millis)
+
+
+def decode_csv(value, fields):
+    # Flink only quotes fields that need it, so rows without quotes are split
+    # directly and only quoted rows (e.g. sites with commas) go through csv
+    text = value.decode() if isinstance(value, (bytes, bytearray, memoryview)) else value
+    if '"' in text:
+        values = next(csv.reader([text]))
+    else:
+        values = text.split(",")
+    row = dict(zip(fields, values))
+    for name, kind in fields.items():
+        if kind == "long" and row.get(name):
+            row[name] = int(row[name])
+        elif kind.startswith("nullable-") and row.get(name) == "":
+            # Flink writes NULL as an empty field
+            row[name] = None
+        elif kind == "nullable-double" and row.get(name):
+            row[name] = float(row[name])
+    return row
+
+
+# Avro: schemaless binary, zig-zag varints
+
+def _nullable_kind(union):
+    if len(union) != 2 or union[0] != "null":
+        return None
+    branch = union[1]
+    if isinstance(branch, dict):
+        return "nullable-timestamp" if branch.get("logicalType") == "timestamp-millis" else None
+    if branch in ("string", "double"):
+        return "nullable-" + branch
+    return None
+
+
+def _load_schema(name):
+    with open(os.path.join(SCHEMA_DIR, name)) as file:
+        schema = json.load(file)
+    fields = {}
+    for field in schema["fields"]:
+        kind = field["type"]
+        if isinstance(kind, list):
+            kind = _nullable_kind(kind)
+        if kind not in ("string", "long", "nullable-timestamp", "nullable-string", "nullable-double"):
+            raise ValueError("Unsupported Avro field type in {}: {}".format(name, field))
+        fields[field["name"]] = kind
+    return fields
+
+
+READING_FIELDS = _load_schema("sensor_reading.avsc")
+ALERT_FIELDS = _load_schema("sensor_alert.avsc")
+
+
+def _zigzag(n):
+    n = (n << 1) ^ (n >> 63)
+    out = bytearray()
+    while n & ~0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def encode_avro(record):
+    out = []
+    for (name, kind), value in zip(READING_FIELDS.items(), record):
+        if kind == "string":
+            data = value.encode()
+            out.append(_zigzag(len(data)))
+            out.append(data)
+        elif kind == "long":
+            out.append(_zigzag(value))
+        elif value is None:
+            out.append(b"\x00")
+        else:
+            # Union branch 1, epoch milliseconds
+            out.append(b"\x02")
+            out.append(_zigzag(int(round(value * 1000))))
+    return b"".join(out)
+
+
+def _read_long(buffer, position):
+    shift = 0
+    result = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    return (result >> 1) ^ -(result & 1), position
+
+
+def _format_millis(millis):
+    moment = datetime.datetime(1970, 1, 1) + datetime.timedelta(milliseconds=millis)
+    return moment.isoformat(timespec="milliseconds")
+
+
+_DOUBLE = struct.Struct("<d")
+
+
+def decode_avro(value, fields):
+    buffer = memoryview(value)
+    position = 0
+    row = {}
+    for name, kind in fields.items():
+        if kind == "string":
+            length, position = _read_long(buffer, position)
+            row[name] = str(buffer[position:position + length], "utf-8")
+            position += length
+        elif kind == "long":
+            row[name], position = _read_long(buffer, position)
+        else:
+            branch, position = _read_long(buffer, position)
+            if branch == 0:
+                row[name] = None
+            elif kind == "nullable-timestamp":
+                millis, position = _read_long(buffer, position)
+                row[name] = _format_millis(millis)
+            elif kind == "nullable-string":
+                length, position = _read_long(buffer, position)
+                row[name] = str(buffer[position:position + length], "utf-8")
+                position += length
+            else:
+                # Avro doubles are 8 bytes, little-endian
+                row[name] = _DOUBLE.unpack_from(buffer, position)[0]
+                position += 8
+    return row
+
+
+ENCODERS = {
+    "json": encode_json,
+    "csv": encode_csv,
+    "avro": encode_avro,
+}
+
+
+def record_encoder(fmt):
+    # Returns a function (sensor_id, temperature, event_time) -> bytes
+    return ENCODERS[fmt]
+
+
+def alert_decoder(fmt):
+    # Returns a function Kafka record value (bytes) -> alert dict
+    if fmt == "json":
+        return decode_json
+    if fmt == "csv":
+        return lambda value: decode_csv(value, ALERT_FIELDS)
+    return lambda value: decode_avro(value, ALERT_FIELDS)
+
+
+def alert_value_decoder(fmt):
+    # Returns a function base64 record value of an MSK event (str) -> alert
+    # dict with the columns of sensor_alert.avsc. binascii decodes the ASCII
+    # string directly, without base64.b64decode's argument conversion, and the
+    # JSON decoder only extracts the fields the notification uses.
+    # The standard library cannot decode base64 into a caller's buffer, and
+    # a2b_base64 stops at the first padding, so the values of a partition
+    # cannot be decoded together either: each value is one bytes object,
+    # which the Avro decoder then reads through a memoryview.
+    a2b_base64 = binascii.a2b_base64
+    if fmt == "json":
+        return lambda value: decode_json_alert(a2b_base64(value))
+    if fmt == "csv":
+        return lambda value: decode_csv(a2b_base64(value), ALERT_FIELDS)
+    return lambda value: decode_avro(a2b_base64(value), ALERT_FIELDS)
@@ -0,0 +1,70 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Rolling z-score anomaly scoring (pipeline.config.0 anomaly.zscore.*).
+#
+# Each sensor's mean temperature per alert window is scored against its
+# previous anomaly.zscore.windows windows by the vectorized rolling_zscore
+# UDAF (anomaly_udfs.py) over a bounded OVER window. The Python aggregate only
+# sees one row per sensor and window, never the raw readings. With the shared
+# pre-aggregation the window means are rolled up from the sensor slices.
+#
+# Scores at or above anomaly.zscore.threshold go to anomaly.topic.name
+# (consumer.config.0), or to anomaly.path with the filesystem output connector.
+
+from pipeline import SENSOR_SLICES_VIEW, interval, with_clause, topic_options
+
+ROLLING_ZSCORE_FUNCTION = "rolling_zscore"
+
+
+def create_table_anomalies(table_name, config):
+    return """ CREATE TABLE {0} (
+                `sensor_id` VARCHAR(64) NOT NULL,
+                `mean_temp` DOUBLE,
+                `zscore` DOUBLE,
+                `start_event_time` TIMESTAMP(3)
+              )
+              WITH (
+                {1}
+              ) """.format(table_name, with_clause(
+        topic_options(config.output_connector, config.anomaly_topic, config.anomaly_path, config),
+        config.kafka_sink_options if config.output_connector == "kafka" else {}))
+
+
+def create_view_window_means(view_name, input_table, config):
+    window = interval(config.alert_window_seconds)
+    if not config.shared_preaggregation:
+        query = """SELECT sensor_id, AVG(CAST(temperature AS DOUBLE)) AS mean_temp, window_start, window_time
+              FROM TABLE(TUMBLE(TABLE {0}, DESCRIPTOR(event_time), {1}))
+              GROUP BY window_start, window_end, window_time, sensor_id""".format(input_table, window)
+    elif config.alert_window_seconds == config.slice_seconds:
+        query = """SELECT sensor_id, CAST(sum_temp AS DOUBLE) / cnt AS mean_temp,
+              slice_start AS window_start, slice_time AS window_time
+              FROM {0}""".format(SENSOR_SLICES_VIEW)
+    else:
+        query = """SELECT sensor_id, CAST(SUM(sum_temp) AS DOUBLE) / SUM(cnt) AS mean_temp, window_start, window_time
+              FROM TABLE(TUMBLE(TABLE {0}, DESCRIPTOR(slice_time), {1}))
+              GROUP BY window_start, window_end, window_time, sensor_id""".format(SENSOR_SLICES_VIEW, window)
+    return """ CREATE TEMPORARY VIEW {0} AS
+              {1} """.format(view_name, query)
+
+
+def insert_anomalies(window_means, insert_into, config):
+    return """ INSERT INTO {1}
+              SELECT sensor_id, mean_temp, zscore, window_start
+              FROM (
+                SELECT sensor_id, mean_temp, window_start,
+                {2}(mean_temp) OVER (
+                  PARTITION BY sensor_id ORDER BY window_time
+                  ROWS BETWEEN {3} PRECEDING AND CURRENT ROW) AS zscore
+                FROM {0})
+              WHERE ABS(zscore) >= {4} """.format(window_means, insert_into, ROLLING_ZSCORE_FUNCTION,
+                                                   config.anomaly_zscore_windows, config.anomaly_zscore_threshold)
+
+
+def add_anomaly_statements(table_env, statement_set, config, input_table, anomaly_table):
+    # After add_insert_statements, which creates the sensor slices view
+    window_means = "sensor_window_means"
+    table_env.execute_sql(create_table_anomalies(anomaly_table, config))
+    table_env.execute_sql(create_view_window_means(window_means, input_table, config))
+    statement_set.add_insert_sql(insert_anomalies(window_means, anomaly_table, config))
@@ -0,0 +1,75 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Vectorized (Pandas) Python functions for per-sensor thresholds and anomaly
+# scoring. Rows reach the Python worker in Arrow batches of
+# python.fn-execution.arrow.batch.size (runtime.config.0) and each call works
+# on whole pandas Series, so the per-row cost is a dictionary lookup in
+# Series.map instead of a Python function call.
+
+import csv
+import os
+
+from pyflink.table import DataTypes
+from pyflink.table.udf import ScalarFunction, udf, udaf
+
+from pipeline import ABOVE_THRESHOLD_FUNCTION, SENSOR_THRESHOLD_FUNCTION
+from anomaly import ROLLING_ZSCORE_FUNCTION
+
+
+def load_thresholds(path):
+    # sensor_id,threshold CSV; relative paths are resolved next to this module
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+    with open(path, newline="") as file:
+        return {row["sensor_id"]: float(row["threshold"]) for row in csv.DictReader(file)}
+
+
+class AboveThreshold(ScalarFunction):
+    # The threshold table is pickled with the function, which broadcasts it
+    # to every Python worker; sensors without an entry use the default, or
+    # the threshold column of the alert control (pipeline.py) when given
+    def __init__(self, thresholds, default):
+        self.thresholds = thresholds
+        self.default = default
+
+    def eval(self, sensor_id, temperature, default=None):
+        limits = sensor_id.map(self.thresholds).fillna(self.default if default is None else default)
+        return (temperature > limits).astype("int64")
+
+
+class SensorThreshold(ScalarFunction):
+    # Threshold of each alert's sensor, from the same table as AboveThreshold;
+    # only runs on the alert rows
+    def __init__(self, thresholds):
+        self.thresholds = thresholds
+
+    def eval(self, sensor_id, default):
+        return sensor_id.map(self.thresholds).fillna(default).astype("float64")
+
+
+def rolling_zscore(mean_temp):
+    # Latest window against the ones before it in the OVER window
+    history = mean_temp.iloc[:-1]
+    if len(history) < 2:
+        return 0.0
+    std = history.std()
+    if not std:
+        return 0.0
+    return float((mean_temp.iloc[-1] - history.mean()) / std)
+
+
+def register_anomaly_functions(table_env, config):
+    if config.sensor_thresholds:
+        thresholds = load_thresholds(config.sensor_thresholds_file)
+        table_env.create_temporary_system_function(
+            ABOVE_THRESHOLD_FUNCTION,
+            udf(AboveThreshold(thresholds, config.alert_temperature_threshold), result_type=DataTypes.BIGINT(),
+                func_type="pandas"))
+        table_env.create_temporary_system_function(
+            SENSOR_THRESHOLD_FUNCTION,
+            udf(SensorThreshold(thresholds), result_type=DataTypes.DOUBLE(), func_type="pandas"))
+    if config.anomaly_zscore:
+        table_env.create_temporary_system_function(
+            ROLLING_ZSCORE_FUNCTION,
+            udaf(rolling_zscore, result_type=DataTypes.DOUBLE(), func_type="pandas"))
@@ -0,0 +1,135 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Flink custom metrics for the job's outputs. The pass-through UDFs below wrap
+# the sensor_id column of each output (see pipeline.metered) and count its
+# rows in the "kfp" metric group (non-deterministic, see is_deterministic, so
+# the planner never calls them twice per row), next to the operators' built-in
+# numRecordsIn/Out; Managed Flink publishes them to CloudWatch.
+#
+# RecordLateness backs late_data.py and only sees the late readings.
+# KeyRates sees one row per sensor and slice (skew.metrics.enabled, see
+# pipeline.insert_key_rates).
+
+import time
+
+from pyflink.table import DataTypes
+from pyflink.table.udf import ScalarFunction, udf
+
+from pipeline import ALERT_ROWS_FUNCTION, AVERAGE_ROWS_FUNCTION, KEY_RATES_FUNCTION
+from late_data import LATENESS_FUNCTION
+
+METRIC_GROUP = "kfp"
+# Rate of the meters, per second over this span
+METER_SPAN_SECONDS = 60
+
+# Hot key candidates logged per subtask, each sensor once
+MAX_REPORTED_HOT_KEYS = 1000
+
+
+class CountRows(ScalarFunction):
+    def __init__(self, name):
+        self.name = name
+
+    def open(self, function_context):
+        group = function_context.get_metric_group().add_group(METRIC_GROUP)
+        self.counter = group.counter(self.name)
+        self.meter = group.meter(self.name + "PerSecond", time_span_in_seconds=METER_SPAN_SECONDS)
+
+    def is_deterministic(self):
+        return False
+
+    def eval(self, value):
+        self.counter.inc()
+        self.meter.mark_event()
+        return value
+
+
+class RecordLateness(ScalarFunction):
+    # Vectorized: milliseconds each late reading is behind its sensor's
+    # watermark estimate. late_data.py filters the late readings in SQL first,
+    # so only they reach the Python worker.
+    def open(self, function_context):
+        group = function_context.get_metric_group().add_group(METRIC_GROUP)
+        self.late_records = group.counter("lateRecords")
+        self.late_meter = group.meter("lateRecordsPerSecond", time_span_in_seconds=METER_SPAN_SECONDS)
+        self.lateness = group.distribution("latenessMillis")
+
+    def is_deterministic(self):
+        # The planner must not duplicate the call when it merges the
+        # projections of the late readings view
+        return False
+
+    def eval(self, event_time, sensor_watermark):
+        lateness = ((sensor_watermark - event_time).dt.total_seconds() * 1000).round().astype("int64")
+        self.late_records.inc(len(lateness))
+        self.late_meter.mark_event(len(lateness))
+        for value in lateness:
+            self.lateness.update(int(value))
+        return lateness
+
+
+class KeyRates(ScalarFunction):
+    # Records/sec of each sensor per slice, from the slice's record count.
+    # keyRecordsPerSecond is their distribution, maxKeyRecordsPerSecond the
+    # largest over the last METER_SPAN_SECONDS, and hotKeyRecordSharePercent the share
+    # of the records that belong to the configured hot keys. Sensors above the
+    # detection rate are counted and logged as candidates for skew.hot.keys.
+    def __init__(self, slice_seconds, hot_keys, detect_rate):
+        self.slice_seconds = slice_seconds
+        self.hot_keys = frozenset(hot_keys)
+        self.detect_rate = detect_rate
+
+    def open(self, function_context):
+        self.records = 0
+        self.hot_key_records = 0
+        self.reported = set()
+        self.span_started = time.time()
+        self.span_max = 0
+        self.previous_span_max = 0
+        group = function_context.get_metric_group().add_group(METRIC_GROUP)
+        self.rates = group.distribution("keyRecordsPerSecond")
+        self.hot_key_slices = group.counter("hotKeySlices")
+        group.gauge("maxKeyRecordsPerSecond", lambda: int(max(self.span_max, self.previous_span_max)))
+        group.gauge("hotKeyRecordSharePercent",
+                    lambda: int(100 * self.hot_key_records / self.records) if self.records else 0)
+
+    def is_deterministic(self):
+        return False
+
+    def eval(self, sensor_id, cnt):
+        rate = cnt / self.slice_seconds
+        self.rates.update(int(rate))
+        self.records += cnt
+        if sensor_id in self.hot_keys:
+            self.hot_key_records += cnt
+        now = time.time()
+        if now - self.span_started >= METER_SPAN_SECONDS:
+            self.previous_span_max, self.span_max, self.span_started = self.span_max, 0, now
+        self.span_max = max(self.span_max, rate)
+        if rate >= self.detect_rate:
+            self.hot_key_slices.inc()
+            if sensor_id not in self.hot_keys and sensor_id not in self.reported \
+                    and len(self.reported) < MAX_REPORTED_HOT_KEYS:
+                self.reported.add(sensor_id)
+                print("Hot key candidate: sensor {} at {:.0f} records/s, consider adding it to skew.hot.keys".format(
+                    sensor_id, rate))
+        return sensor_id
+
+
+def register_metric_functions(table_env):
+    for function_name, metric_name in ((ALERT_ROWS_FUNCTION, "alertRows"),
+                                       (AVERAGE_ROWS_FUNCTION, "averageRows")):
+        table_env.create_temporary_system_function(
+            function_name, udf(CountRows(metric_name), result_type=DataTypes.STRING()))
+
+
+def register_key_rate_function(table_env, config):
+    table_env.create_temporary_system_function(
+        KEY_RATES_FUNCTION, udf(KeyRates(config.slice_seconds, config.skew_hot_keys, config.skew_detect_rate),
+                                result_type=DataTypes.STRING()))
+
+
+def register_lateness_function(table_env):
+    table_env.create_temporary_system_function(
+        LATENESS_FUNCTION, udf(RecordLateness(), result_type=DataTypes.BIGINT(), func_type="pandas"))
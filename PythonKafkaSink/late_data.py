@@ -0,0 +1,108 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Late-record reporting (pipeline.config.0 late.data.mode).
+#
+# Records behind the watermark are silently dropped by the event-time windows.
+# Late readings are found in SQL: a reading is late when it is more than
+# watermark.delay.seconds behind the newest reading of its sensor (a keyed
+# OVER aggregation, no Python on the input records). Only the late readings
+# reach the vectorized record_lateness UDF (flink_metrics.py), which measures
+# their lateness in milliseconds and publishes late-record metrics. From its
+# result:
+#
+# metrics   late stats: per sensor, lateness bucket and processing-time window,
+#           the number of late records and the largest lateness
+# route     also writes the late records themselves to their own sink, so
+#           they can be replayed or inspected instead of being lost
+#
+# Both sinks are Kafka topics in the wire format (late.records.topic.name,
+# late.stats.topic.name in consumer.config.0), or directories with the
+# filesystem output connector (late.records.path, late.stats.path). Flink 1.13
+# window table functions have no allowed lateness, so the stats are the data
+# to tune watermark.delay.seconds with.
+
+from pipeline import interval, with_clause, topic_options
+
+LATENESS_FUNCTION = "record_lateness"
+
+# Lower bounds of the lateness histogram buckets, in milliseconds
+LATENESS_BUCKETS_MS = (0, 1000, 5000, 30000, 60000, 300000)
+
+
+def lateness_bucket(column):
+    cases = " ".join("WHEN {} >= {} THEN {}".format(column, bound, bound)
+                     for bound in reversed(LATENESS_BUCKETS_MS[1:]))
+    return "CAST(CASE {} ELSE 0 END AS BIGINT)".format(cases)
+
+
+def create_table_late_records(table_name, config):
+    return """ CREATE TABLE {0} (
+                `sensor_id` VARCHAR(64) NOT NULL,
+                `temperature` BIGINT NOT NULL,
+                `event_time` TIMESTAMP(3),
+                `lateness_ms` BIGINT
+              )
+              WITH (
+                {1}
+              ) """.format(table_name, with_clause(
+        topic_options(config.output_connector, config.late_records_topic, config.late_records_path, config),
+        config.kafka_sink_options if config.output_connector == "kafka" else {}))
+
+
+def create_table_late_stats(table_name, config):
+    return """ CREATE TABLE {0} (
+                `sensor_id` VARCHAR(64) NOT NULL,
+                `lateness_bucket_ms` BIGINT NOT NULL,
+                `late_count` BIGINT NOT NULL,
+                `max_lateness_ms` BIGINT,
+                `window_start` TIMESTAMP(3)
+              )
+              WITH (
+                {1}
+              ) """.format(table_name, with_clause(
+        topic_options(config.output_connector, config.late_stats_topic, config.late_stats_path, config),
+        config.kafka_sink_options if config.output_connector == "kafka" else {}))
+
+
+def create_view_late_readings(view_name, insert_from, config):
+    # The per-sensor watermark estimate is the sensor's largest event time so
+    # far minus the watermark delay. The windows use the job's watermark (the
+    # minimum over the source partitions), so this is an estimate of the
+    # records they drop, not an exact count.
+    return """ CREATE TEMPORARY VIEW {1} AS
+              SELECT sensor_id, temperature, event_time, proc_time, lateness_ms, {2} AS lateness_bucket_ms
+              FROM (SELECT sensor_id, temperature, event_time, PROCTIME() AS proc_time,
+                    {3}(event_time, sensor_watermark) AS lateness_ms
+                    FROM (SELECT sensor_id, temperature, event_time,
+                          MAX(event_time) OVER (
+                            PARTITION BY sensor_id ORDER BY proc_time
+                            ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) - {4} AS sensor_watermark
+                          FROM {0})
+                    WHERE event_time < sensor_watermark) """.format(
+        insert_from, view_name, lateness_bucket("lateness_ms"), LATENESS_FUNCTION,
+        interval(config.watermark_delay_seconds))
+
+
+def insert_late_records(late_readings, insert_into):
+    return """ INSERT INTO {1}
+              SELECT sensor_id, temperature, event_time, lateness_ms
+              FROM {0} """.format(late_readings, insert_into)
+
+
+def insert_late_stats(late_readings, insert_into, config):
+    return """ INSERT INTO {1}
+              SELECT sensor_id, lateness_bucket_ms, COUNT(*), MAX(lateness_ms), window_start
+              FROM TABLE(TUMBLE(TABLE {0}, DESCRIPTOR(proc_time), {2}))
+              GROUP BY window_start, window_end, sensor_id, lateness_bucket_ms """.format(
+        late_readings, insert_into, interval(config.late_stats_window_seconds))
+
+
+def add_late_data_statements(table_env, statement_set, config, input_table, late_records_table, late_stats_table):
+    late_readings = "late_readings"
+    table_env.execute_sql(create_table_late_stats(late_stats_table, config))
+    table_env.execute_sql(create_view_late_readings(late_readings, input_table, config))
+    statement_set.add_insert_sql(insert_late_stats(late_readings, late_stats_table, config))
+    if config.late_data_mode == "route":
+        table_env.execute_sql(create_table_late_records(late_records_table, config))
+        statement_set.add_insert_sql(insert_late_records(late_readings, late_records_table))
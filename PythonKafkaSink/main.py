@@ -5,148 +5,79 @@ from pyflink.table import EnvironmentSettings, StreamTableEnvironment, Statement
 import os
 import json
 
+from pipeline import (PipelineConfig, property_groups, create_table_input, create_table_output_kafka,
+                      create_table_output_s3, add_insert_statements)
+from runtime_tuning import (RUNTIME_PROPERTY_GROUP_KEY, SOURCE_IDLE_TIMEOUT_KEY, DEFAULT_CONTROL_IDLE_TIMEOUT,
+                            runtime_settings, apply_runtime_settings)
+from flink_metrics import register_metric_functions, register_key_rate_function, register_lateness_function
+from late_data import add_late_data_statements
+from anomaly_udfs import register_anomaly_functions
+from anomaly import add_anomaly_statements
+from sensor_metadata import create_table_sensor_metadata
+from metadata_udfs import register_metadata_function
+
 env_settings = EnvironmentSettings.new_instance().in_streaming_mode().use_blink_planner().build()
 table_env = StreamTableEnvironment.create(environment_settings=env_settings)
 statement_set = table_env.create_statement_set()
 
-
-def create_table_input(table_name, stream_name, broker):
-    return """ CREATE TABLE {0} (
-                `sensor_id` VARCHAR(64) NOT NULL,
-                `temperature` BIGINT NOT NULL,
-                `event_time` TIMESTAMP(3),
-                WATERMARK FOR event_time AS event_time - INTERVAL '5' SECOND
-              )
-              WITH (
-                'connector' = 'kafka',
-                'topic' = '{1}',
-                'properties.bootstrap.servers' = '{2}',
-                'properties.group.id' = 'testGroup',
-                'format' = 'json',
-                'json.timestamp-format.standard' = 'ISO-8601',
-                'scan.startup.mode' = 'earliest-offset',
-                'properties.security.protocol' = 'SASL_SSL',
-                'properties.sasl.mechanism' = 'AWS_MSK_IAM',
-                'properties.sasl.jaas.config' = 'software.amazon.msk.auth.iam.IAMLoginModule required;',
-                'properties.sasl.client.callback.handler.class' = 'software.amazon.msk.auth.iam.IAMClientCallbackHandler'
-              ) """.format(table_name, stream_name, broker)
-# SSL IAM Properties
-# 'properties.security.protocol' = 'SASL_SSL',
-# 'properties.sasl.mechanism' = 'AWS_MSK_IAM',
-# 'properties.sasl.jaas.config' = 'software.amazon.msk.auth.iam.IAMLoginModule required;',
-# 'properties.sasl.client.callback.handler.class' = 'software.amazon.msk.auth.iam.IAMClientCallbackHandler'
-def create_table_output_kafka(table_name, stream_name, broker):
-    return """ CREATE TABLE {0} (
-                `sensor_id` VARCHAR(64) NOT NULL,
-                `count_temp` BIGINT NOT NULL ,
-                `start_event_time` TIMESTAMP(3)
-              )
-              WITH (
-                'connector' = 'kafka',
-                'topic' = '{1}',
-                'properties.bootstrap.servers' = '{2}',
-                'properties.group.id' = 'testGroup',
-                'format' = 'json',
-                'json.timestamp-format.standard' = 'ISO-8601',
-                'scan.startup.mode' = 'earliest-offset',
-                'properties.security.protocol' = 'SASL_SSL',
-                'properties.sasl.mechanism' = 'AWS_MSK_IAM',
-                'properties.sasl.jaas.config' = 'software.amazon.msk.auth.iam.IAMLoginModule required;',
-                'properties.sasl.client.callback.handler.class' = 'software.amazon.msk.auth.iam.IAMClientCallbackHandler'
-              ) """.format(table_name, stream_name, broker)
-
-
-def create_table_output_s3(table_name, stream_name):
-    return """ CREATE TABLE {0} (
-                `sensor_id` VARCHAR(64) NOT NULL,
-                `avg_temp` BIGINT NOT NULL ,
-                `start_event_time` TIMESTAMP(3),
-                `year` BIGINT,
-                `month` BIGINT,
-                `day` BIGINT,
-                `hour` BIGINT
-              )
-              PARTITIONED BY (`year`,`month`,`day`,`hour`)
-              WITH (
-                'connector' = 'filesystem',
-                'path' = 's3a://{1}/',
-                'format' = 'json',
-                'sink.partition-commit.policy.kind'='success-file',
-                'sink.partition-commit.delay' = '1 min'
-              ) """.format(table_name, stream_name)
-
-
-def insert_stream_sns(insert_from, insert_into):
-    return """ INSERT INTO {1} 
-              SELECT sensor_id, count(*),
-              TUMBLE_START(event_time, INTERVAL '30' SECOND )  
-              FROM {0}
-              where temperature > 30
-              GROUP BY TUMBLE(event_time, INTERVAL '30' SECOND ),sensor_id 
-              HAVING count(*) > 3 """.format(insert_from, insert_into)
-
-
-
-def insert_stream_s3(insert_from, insert_into):
-    return """INSERT INTO {1}
-              SELECT *, YEAR(start_event_time), MONTH(start_event_time), DAYOFMONTH(start_event_time), HOUR(start_event_time)
-              FROM
-              (SELECT sensor_id, AVG(temperature) as avg_temp, TUMBLE_START(event_time, INTERVAL '60' SECOND ) as start_event_time
-              FROM {0} 
-              GROUP BY TUMBLE(event_time, INTERVAL '60' SECOND ), sensor_id) """.format(insert_from, insert_into)
+# Managed Flink provides the properties at the default path; local runs
+# (local/harness.py) point FLINK_APPLICATION_PROPERTIES at their own file
+PROPERTIES_FILE_KEY = 'FLINK_APPLICATION_PROPERTIES'
+DEFAULT_PROPERTIES_FILE = '/etc/flink/application_properties.json'
 
 
 def app_properties():
-    file_path = '/etc/flink/application_properties.json'
+    file_path = os.environ.get(PROPERTIES_FILE_KEY, DEFAULT_PROPERTIES_FILE)
     if os.path.isfile(file_path):
         with open(file_path, 'r') as file:
-            contents = file.read()
-            print('Contents of ' + file_path)
-            print(contents)
-            properties = json.loads(contents)
+            properties = json.load(file)
+            # Group ids only, the values include broker addresses and bucket names
+            print('Property groups in {}: {}'.format(
+                file_path, ', '.join(prop['PropertyGroupId'] for prop in properties)))
             return properties
     else:
         print('A file at "{}" was not found'.format(file_path))
 
 
-def property_map(props, property_group_id):
-    for prop in props:
-        if prop["PropertyGroupId"] == property_group_id:
-            return prop["PropertyMap"]
-
-
 def main():
-    INPUT_PROPERTY_GROUP_KEY = "producer.config.0"
-    CONSUMER_PROPERTY_GROUP_KEY = "consumer.config.0"
-
-    INPUT_TOPIC_KEY = "input.topic.name"
-    OUTPUT_TOPIC_KEY = "output.topic.name"
-    OUTPUT_BUCKET_KEY = "output.s3.bucket"
-    BROKER_KEY = "bootstrap.servers"
-
-    props = app_properties()
-
-    input_property_map = property_map(props, INPUT_PROPERTY_GROUP_KEY)
-    output_property_map = property_map(props, CONSUMER_PROPERTY_GROUP_KEY)
-
-    input_stream = input_property_map[INPUT_TOPIC_KEY]
-    broker = input_property_map[BROKER_KEY]
-
-    output_stream_sns = output_property_map[OUTPUT_TOPIC_KEY]
-    output_s3_bucket = output_property_map[OUTPUT_BUCKET_KEY]
+    groups = property_groups(app_properties())
+    config = PipelineConfig(groups)
+    settings = runtime_settings(groups.get(RUNTIME_PROPERTY_GROUP_KEY))
+    if config.alert_control:
+        settings.setdefault(SOURCE_IDLE_TIMEOUT_KEY, DEFAULT_CONTROL_IDLE_TIMEOUT)
+    # Must be set before any statement is planned
+    apply_runtime_settings(table_env, settings)
 
     input_table = "input_table"
     output_table_sns = "output_table_sns"
     output_table_s3 = "output_table_s3"
 
-    table_env.execute_sql(create_table_input(input_table, input_stream, broker))
-    table_env.execute_sql(create_table_output_kafka(output_table_sns, output_stream_sns, broker))
-    table_env.execute_sql(create_table_output_s3(output_table_s3, output_s3_bucket))
-
-    statement_set.add_insert_sql(insert_stream_sns(input_table, output_table_sns))
-    statement_set.add_insert_sql(insert_stream_s3(input_table, output_table_s3))
-
-    statement_set.execute()
+    table_env.execute_sql(create_table_input(input_table, config))
+    table_env.execute_sql(create_table_output_kafka(output_table_sns, config))
+    table_env.execute_sql(create_table_output_s3(output_table_s3, config))
+    if config.output_metrics:
+        register_metric_functions(table_env)
+    if config.skew_metrics:
+        register_key_rate_function(table_env, config)
+    if config.sensor_thresholds or config.anomaly_zscore:
+        register_anomaly_functions(table_env, config)
+    if config.metadata_lookup == "jdbc":
+        table_env.execute_sql(create_table_sensor_metadata(config))
+    elif config.metadata_lookup == "sqlite":
+        register_metadata_function(table_env, config)
+
+    add_insert_statements(table_env, statement_set, config, input_table, output_table_sns, output_table_s3)
+    if config.late_data_mode != "off":
+        register_lateness_function(table_env)
+        add_late_data_statements(table_env, statement_set, config, input_table,
+                                 "output_table_late_records", "output_table_late_stats")
+    if config.anomaly_zscore:
+        add_anomaly_statements(table_env, statement_set, config, input_table, "output_table_anomalies")
+
+    result = statement_set.execute()
+    if PROPERTIES_FILE_KEY in os.environ:
+        # Local mini-cluster: keep the process alive until the bounded input is done
+        result.wait()
 
 
 if __name__ == '__main__':
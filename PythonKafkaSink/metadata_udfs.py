@@ -0,0 +1,107 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# SQLite-backed sensor metadata lookup (metadata.config.0 lookup=sqlite).
+#
+# A bounded LRU cache of up to cache.max-rows sensors sits in front of the
+# database; unknown sensors are cached too. Only a sensor's first lookup waits
+# for SQLite: once an entry is older than cache.ttl.seconds the cached row is
+# still returned and a background thread refreshes it, so a slow database
+# never stalls the alert stream.
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from pyflink.table import DataTypes
+from pyflink.table.udf import TableFunction, udtf
+
+from pipeline import METADATA_FUNCTION
+from flink_metrics import METRIC_GROUP
+
+QUERY = "SELECT site, owner FROM sensor_metadata WHERE sensor_id = ?"
+
+
+def resolve(path):
+    # Relative paths are resolved next to this module (inside PythonKafkaSink.zip)
+    if path and path != ":memory:" and not os.path.isabs(path):
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+    return path
+
+
+class SensorMetadataLookup(TableFunction):
+    def __init__(self, path, init_script, max_rows, ttl_seconds):
+        self.path = path
+        self.init_script = init_script
+        self.max_rows = max_rows
+        self.ttl_seconds = ttl_seconds
+
+    def open(self, function_context):
+        self._db = sqlite3.connect(resolve(self.path), check_same_thread=False)
+        # The init script only seeds an in-memory database, never a file
+        if self.init_script and self.path == ":memory:":
+            with open(resolve(self.init_script)) as file:
+                self._db.executescript(file.read())
+        self._db_lock = threading.Lock()
+        # sensor_id -> [loaded_at, row or None]
+        self._cache = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=1)
+        group = function_context.get_metric_group().add_group(METRIC_GROUP)
+        self.hits = group.counter("metadataCacheHits")
+        self.misses = group.counter("metadataCacheMisses")
+
+    def close(self):
+        self._refresher.shutdown(wait=False)
+        self._db.close()
+
+    def _query(self, sensor_id):
+        # Cache hits only take _lock, so they never wait for a refresh query
+        with self._db_lock:
+            return self._db.execute(QUERY, (sensor_id,)).fetchone()
+
+    def _store(self, sensor_id, row):
+        with self._lock:
+            self._cache[sensor_id] = [time.time(), row]
+            self._cache.move_to_end(sensor_id)
+            while len(self._cache) > self.max_rows:
+                self._cache.popitem(last=False)
+            self._refreshing.discard(sensor_id)
+
+    def _refresh(self, sensor_id):
+        try:
+            self._store(sensor_id, self._query(sensor_id))
+        except sqlite3.Error as e:
+            print("Refreshing metadata of sensor {} failed: {!r}".format(sensor_id, e))
+            with self._lock:
+                self._refreshing.discard(sensor_id)
+
+    def eval(self, sensor_id):
+        with self._lock:
+            entry = self._cache.get(sensor_id)
+            if entry is not None:
+                self._cache.move_to_end(sensor_id)
+                if time.time() - entry[0] >= self.ttl_seconds and sensor_id not in self._refreshing:
+                    self._refreshing.add(sensor_id)
+                    self._refresher.submit(self._refresh, sensor_id)
+        if entry is None:
+            self.misses.inc()
+            row = self._query(sensor_id)
+            self._store(sensor_id, row)
+        else:
+            self.hits.inc()
+            row = entry[1]
+        # No row for unknown sensors, the LEFT JOIN fills in NULLs
+        if row is not None:
+            yield row[0], row[1]
+
+
+def register_metadata_function(table_env, config):
+    lookup = SensorMetadataLookup(config.metadata["sqlite.path"], config.metadata.get("sqlite.init-script"),
+                                  config.metadata_cache_max_rows, config.metadata_cache_ttl_seconds)
+    table_env.create_temporary_system_function(METADATA_FUNCTION, udtf(
+        lookup, result_types=[DataTypes.STRING(), DataTypes.STRING()]))
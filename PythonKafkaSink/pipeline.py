@@ -0,0 +1,775 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Pipeline definition: builds the Flink SQL DDL and INSERT statements from the
+# application property groups, so windows, thresholds and connector tuning can
+# be changed per deployment without rebuilding PythonKafkaSink.zip.
+#
+# producer.config.0   input topic, brokers, wire format and source tuning:
+#                     source.option.<kafka connector option>, e.g.
+#                     source.option.properties.fetch.min.bytes
+# consumer.config.0   output topic and bucket, S3 file format and partitioning
+#                     (see S3_FORMATS), sink tuning:
+#                     kafka.sink.option.<kafka connector option>
+#                     s3.sink.option.<filesystem connector option>
+# pipeline.config.0   windows and alert thresholds, late-data reporting, hot
+#                     sensors, see PIPELINE_DEFAULTS and late_data.py
+#
+# The alert threshold and minimum count can also follow a control topic
+# (alert.control.enabled, control.topic.name in producer.config.0), so they
+# change without restarting the job, see create_view_controlled_input.
+# metadata.config.0   sensor metadata lookup for the alerts, see
+#                     METADATA_DEFAULTS and sensor_metadata.py
+#
+# For local runs (local/harness.py) input.connector / output.connector set to
+# filesystem replace the Kafka topics with directories (input.path,
+# control.path, output.path), output.s3.path replaces the bucket and auth.mode=none drops the
+# MSK IAM options.
+
+from math import gcd
+
+from wire_formats import WIRE_FORMAT_KEY, DEFAULT_WIRE_FORMAT, format_options
+
+INPUT_PROPERTY_GROUP_KEY = "producer.config.0"
+CONSUMER_PROPERTY_GROUP_KEY = "consumer.config.0"
+PIPELINE_PROPERTY_GROUP_KEY = "pipeline.config.0"
+METADATA_PROPERTY_GROUP_KEY = "metadata.config.0"
+
+INPUT_TOPIC_KEY = "input.topic.name"
+OUTPUT_TOPIC_KEY = "output.topic.name"
+OUTPUT_BUCKET_KEY = "output.s3.bucket"
+BROKER_KEY = "bootstrap.servers"
+GROUP_ID_KEY = "group.id"
+AUTH_MODE_KEY = "auth.mode"
+INPUT_CONNECTOR_KEY = "input.connector"
+INPUT_PATH_KEY = "input.path"
+CONTROL_TOPIC_KEY = "control.topic.name"
+CONTROL_PATH_KEY = "control.path"
+OUTPUT_CONNECTOR_KEY = "output.connector"
+OUTPUT_PATH_KEY = "output.path"
+OUTPUT_S3_PATH_KEY = "output.s3.path"
+OUTPUT_S3_FORMAT_KEY = "output.s3.format"
+OUTPUT_S3_COMPRESSION_KEY = "output.s3.compression"
+OUTPUT_S3_PARTITIONING_KEY = "output.s3.partition.granularity"
+LATE_RECORDS_TOPIC_KEY = "late.records.topic.name"
+LATE_RECORDS_PATH_KEY = "late.records.path"
+LATE_STATS_TOPIC_KEY = "late.stats.topic.name"
+LATE_STATS_PATH_KEY = "late.stats.path"
+ANOMALY_TOPIC_KEY = "anomaly.topic.name"
+ANOMALY_PATH_KEY = "anomaly.path"
+OUTPUT_DELIVERY_GUARANTEE_KEY = "output.delivery.guarantee"
+OUTPUT_TRANSACTION_TIMEOUT_KEY = "output.transaction.timeout.ms"
+
+CONNECTORS = ("kafka", "filesystem")
+AUTH_MODES = ("iam", "none")
+
+# Kafka sinks: at-least-once with the idempotent producer (no duplicates from
+# producer retries, replays after a restart still duplicate), exactly-once with
+# Kafka transactions committed on every checkpoint, or none. Exactly-once
+# records only become visible to read_committed consumers after the
+# checkpoint, so the checkpoint interval adds to their latency.
+DELIVERY_GUARANTEES = ("at-least-once", "exactly-once", "none")
+# MSK's default transaction.max.timeout.ms; the brokers reject Flink's own
+# default of one hour. Must exceed the checkpoint interval plus restart time.
+DEFAULT_TRANSACTION_TIMEOUT_MS = "900000"
+
+SOURCE_OPTION_PREFIX = "source.option."
+KAFKA_SINK_OPTION_PREFIX = "kafka.sink.option."
+S3_SINK_OPTION_PREFIX = "s3.sink.option."
+
+PIPELINE_DEFAULTS = {
+    "watermark.delay.seconds": "5",
+    "alert.window.seconds": "30",
+    "alert.temperature.threshold": "30",
+    # Alert when more than this many readings in a window exceed the threshold
+    "alert.min.count": "3",
+    # Threshold and minimum count from the latest control topic record as of
+    # each reading, falling back to the two values above
+    "alert.control.enabled": "false",
+    # Readings are spread over this many join keys, each with its own copy of
+    # the control records, see create_view_alert_control_versions
+    "alert.control.buckets": "8",
+    "average.window.seconds": "60",
+    # Derive both outputs from one per-sensor pre-aggregation instead of
+    # aggregating the input twice, see create_view_sensor_slices
+    "shared.preaggregation.enabled": "true",
+    # Count the rows of each output with a pass-through UDF, see flink_metrics.py
+    "output.metrics.enabled": "false",
+    # off, metrics (late record metrics and per-sensor late stats) or route
+    # (metrics, and the late records themselves to their own sink)
+    "late.data.mode": "off",
+    "late.stats.window.seconds": "60",
+    # Per-sensor alert thresholds from a CSV file (sensor_id,threshold) instead
+    # of alert.temperature.threshold for every sensor, see anomaly.py
+    "sensor.thresholds.enabled": "false",
+    "sensor.thresholds.file": "sensor_thresholds.csv",
+    # Rolling z-score of each sensor's alert-window mean over the previous
+    # anomaly.zscore.windows windows, scores at or above the threshold are
+    # written to the anomaly sink
+    "anomaly.zscore.enabled": "false",
+    "anomaly.zscore.windows": "10",
+    "anomaly.zscore.threshold": "3",
+    # Hot sensors, see create_view_salted_slices: off, or salt to spread the
+    # readings of skew.hot.keys (comma-separated sensor ids, empty for every
+    # sensor) over skew.salt.buckets subtasks before merging them per sensor
+    "skew.mode": "off",
+    "skew.hot.keys": "",
+    "skew.salt.buckets": "8",
+    # Per-sensor record rates of the slices, sensors above the rate are
+    # reported as hot key candidates, see flink_metrics.KeyRates
+    "skew.metrics.enabled": "false",
+    "skew.detect.records.per.second": "1000",
+}
+
+LATE_DATA_MODES = ("off", "metrics", "route")
+SKEW_MODES = ("off", "salt")
+
+# Pass-through functions registered by flink_metrics.register_metric_functions
+ALERT_ROWS_FUNCTION = "alert_rows"
+AVERAGE_ROWS_FUNCTION = "average_rows"
+# Vectorized per-sensor threshold check and lookup registered by anomaly_udfs.py
+ABOVE_THRESHOLD_FUNCTION = "above_threshold"
+SENSOR_THRESHOLD_FUNCTION = "sensor_threshold"
+# Per-sensor rate metrics registered by flink_metrics.register_key_rate_function
+KEY_RATES_FUNCTION = "key_rates"
+
+# Alerts are enriched with site and owner of their sensor: off
+# (NULL columns), jdbc (lookup join with the connector's cache) or sqlite
+# (cached lookup table function, the local stand-in), see sensor_metadata.py
+METADATA_LOOKUPS = ("off", "jdbc", "sqlite")
+METADATA_DEFAULTS = {
+    "lookup": "off",
+    "cache.max-rows": "10000",
+    "cache.ttl.seconds": "600",
+    "jdbc.table-name": "sensor_metadata",
+    # :memory: with the init script shipped in PythonKafkaSink.zip, or a database file
+    "sqlite.path": ":memory:",
+    "sqlite.init-script": "sensor_metadata.sql",
+}
+METADATA_TABLE = "sensor_metadata"
+METADATA_FUNCTION = "sensor_metadata_lookup"
+
+# S3 sink formats. The columnar ones roll files by size and time on top of the
+# roll on every checkpoint, and merge the files a checkpoint produced in a
+# partition before the partition is committed, so readers see few large files.
+S3_FORMATS = ("json", "parquet", "orc")
+S3_COMPRESSION_OPTION = {"parquet": "parquet.compression", "orc": "orc.compress"}
+S3_COMPRESSIONS = {
+    "parquet": ("SNAPPY", "GZIP", "ZSTD", "LZ4", "UNCOMPRESSED"),
+    "orc": ("SNAPPY", "ZLIB", "ZSTD", "LZ4", "NONE"),
+}
+COLUMNAR_SINK_OPTIONS = {
+    "sink.rolling-policy.file-size": "128MB",
+    "sink.rolling-policy.rollover-interval": "15 min",
+    "sink.rolling-policy.check-interval": "1 min",
+    "auto-compaction": "true",
+    "compaction.file-size": "128MB",
+}
+
+# Partition columns of the S3 table per granularity, with the expression that
+# derives each one from start_event_time
+S3_PARTITIONINGS = ("hour", "day")
+PARTITION_COLUMNS = (
+    ("year", "YEAR"),
+    ("month", "MONTH"),
+    ("day", "DAYOFMONTH"),
+    ("hour", "HOUR"),
+)
+
+# SSL IAM Properties
+MSK_IAM_OPTIONS = {
+    "properties.security.protocol": "SASL_SSL",
+    "properties.sasl.mechanism": "AWS_MSK_IAM",
+    "properties.sasl.jaas.config": "software.amazon.msk.auth.iam.IAMLoginModule required;",
+    "properties.sasl.client.callback.handler.class": "software.amazon.msk.auth.iam.IAMClientCallbackHandler",
+}
+
+# Options derived from the pipeline definition itself, tuning must not replace them
+MANAGED_OPTIONS = {"connector", "topic", "path", "format", "properties.bootstrap.servers", "sink.semantic"}
+
+
+def property_groups(props):
+    # Property maps by group id, indexed once instead of scanned per lookup
+    return {prop["PropertyGroupId"]: prop["PropertyMap"] for prop in props or []}
+
+
+def prefixed_options(property_group, prefix):
+    options = {}
+    for key, value in property_group.items():
+        if key.startswith(prefix):
+            option = key[len(prefix):]
+            if option in MANAGED_OPTIONS or option.split(".")[0] in ("json", "csv", "avro"):
+                raise ValueError("{} cannot be overridden through {}".format(option, key))
+            options[option] = value
+    return options
+
+
+def choice(group, key, choices):
+    value = group.get(key, choices[0])
+    if value not in choices:
+        raise ValueError("{} must be one of {}, got {!r}".format(key, choices, value))
+    return value
+
+
+def positive_int(group, key):
+    value = group[key]
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError("{} must be an integer, got {!r}".format(key, value))
+    if number <= 0:
+        raise ValueError("{} must be positive, got {!r}".format(key, value))
+    return number
+
+
+def number(group, key):
+    try:
+        value = float(group[key])
+    except ValueError:
+        raise ValueError("{} must be a number, got {!r}".format(key, group[key]))
+    return int(value) if value.is_integer() else value
+
+
+class PipelineConfig():
+    def __init__(self, props):
+        # props: the application properties, or property_groups() of them
+        groups = props if isinstance(props, dict) else property_groups(props)
+        source = groups[INPUT_PROPERTY_GROUP_KEY]
+        output = groups[CONSUMER_PROPERTY_GROUP_KEY]
+        pipeline = dict(PIPELINE_DEFAULTS)
+        pipeline.update(groups.get(PIPELINE_PROPERTY_GROUP_KEY) or {})
+        metadata = dict(METADATA_DEFAULTS)
+        metadata.update(groups.get(METADATA_PROPERTY_GROUP_KEY) or {})
+
+        self.input_connector = choice(source, INPUT_CONNECTOR_KEY, CONNECTORS)
+        self.output_connector = choice(output, OUTPUT_CONNECTOR_KEY, CONNECTORS)
+        self.auth_mode = choice(source, AUTH_MODE_KEY, AUTH_MODES)
+        if self.input_connector == "kafka" or self.output_connector == "kafka":
+            self.broker = source[BROKER_KEY]
+        self.input_topic = source.get(INPUT_TOPIC_KEY)
+        self.input_path = source.get(INPUT_PATH_KEY)
+        self.group_id = source.get(GROUP_ID_KEY, "testGroup")
+        self.wire_format = source.get(WIRE_FORMAT_KEY, DEFAULT_WIRE_FORMAT)
+        self.output_topic = output.get(OUTPUT_TOPIC_KEY)
+        self.output_path = output.get(OUTPUT_PATH_KEY)
+        self.output_s3_path = output.get(OUTPUT_S3_PATH_KEY) or "s3a://{}/".format(output[OUTPUT_BUCKET_KEY])
+        self.output_s3_format = choice(output, OUTPUT_S3_FORMAT_KEY, S3_FORMATS)
+        if self.output_s3_format in S3_COMPRESSIONS:
+            compression = {OUTPUT_S3_COMPRESSION_KEY: output.get(OUTPUT_S3_COMPRESSION_KEY, "SNAPPY").upper()}
+            self.output_s3_compression = choice(compression, OUTPUT_S3_COMPRESSION_KEY,
+                                                S3_COMPRESSIONS[self.output_s3_format])
+        self.output_s3_partitioning = choice(output, OUTPUT_S3_PARTITIONING_KEY, S3_PARTITIONINGS)
+
+        self.watermark_delay_seconds = positive_int(pipeline, "watermark.delay.seconds")
+        self.alert_window_seconds = positive_int(pipeline, "alert.window.seconds")
+        self.alert_temperature_threshold = number(pipeline, "alert.temperature.threshold")
+        self.alert_min_count = number(pipeline, "alert.min.count")
+        self.alert_control = pipeline["alert.control.enabled"].lower() == "true"
+        self.control_topic = source.get(CONTROL_TOPIC_KEY, "kfp_control_topic")
+        self.control_path = source.get(CONTROL_PATH_KEY)
+        self.alert_control_buckets = positive_int(pipeline, "alert.control.buckets")
+        self.average_window_seconds = positive_int(pipeline, "average.window.seconds")
+        self.shared_preaggregation = pipeline["shared.preaggregation.enabled"].lower() == "true"
+        self.output_metrics = pipeline["output.metrics.enabled"].lower() == "true"
+        self.late_data_mode = choice(pipeline, "late.data.mode", LATE_DATA_MODES)
+        self.late_stats_window_seconds = positive_int(pipeline, "late.stats.window.seconds")
+        self.late_records_topic = output.get(LATE_RECORDS_TOPIC_KEY, "kfp_late_records_topic")
+        self.late_records_path = output.get(LATE_RECORDS_PATH_KEY)
+        self.late_stats_topic = output.get(LATE_STATS_TOPIC_KEY, "kfp_late_stats_topic")
+        self.late_stats_path = output.get(LATE_STATS_PATH_KEY)
+        self.sensor_thresholds = pipeline["sensor.thresholds.enabled"].lower() == "true"
+        self.sensor_thresholds_file = pipeline["sensor.thresholds.file"]
+        self.anomaly_zscore = pipeline["anomaly.zscore.enabled"].lower() == "true"
+        self.anomaly_zscore_windows = positive_int(pipeline, "anomaly.zscore.windows")
+        self.anomaly_zscore_threshold = number(pipeline, "anomaly.zscore.threshold")
+        self.anomaly_topic = output.get(ANOMALY_TOPIC_KEY, "kfp_anomaly_topic")
+        self.anomaly_path = output.get(ANOMALY_PATH_KEY)
+        self.metadata_lookup = choice(metadata, "lookup", METADATA_LOOKUPS)
+        self.metadata_cache_max_rows = positive_int(metadata, "cache.max-rows")
+        self.metadata_cache_ttl_seconds = positive_int(metadata, "cache.ttl.seconds")
+        self.metadata = metadata
+        self.skew_mode = choice(pipeline, "skew.mode", SKEW_MODES)
+        self.skew_hot_keys = tuple(key.strip() for key in pipeline["skew.hot.keys"].split(",") if key.strip())
+        self.skew_salt_buckets = positive_int(pipeline, "skew.salt.buckets")
+        self.skew_metrics = pipeline["skew.metrics.enabled"].lower() == "true"
+        self.skew_detect_rate = number(pipeline, "skew.detect.records.per.second")
+        # Both work on the per-sensor slices
+        if (self.skew_mode != "off" or self.skew_metrics) and not self.shared_preaggregation:
+            raise ValueError("skew.mode and skew.metrics.enabled need shared.preaggregation.enabled")
+        # Largest window both outputs can be rolled up from
+        self.slice_seconds = gcd(self.alert_window_seconds, self.average_window_seconds)
+
+        self.source_options = prefixed_options(source, SOURCE_OPTION_PREFIX)
+        self.delivery_guarantee = choice(output, OUTPUT_DELIVERY_GUARANTEE_KEY, DELIVERY_GUARANTEES)
+        self.transaction_timeout_ms = positive_int(
+            dict({OUTPUT_TRANSACTION_TIMEOUT_KEY: DEFAULT_TRANSACTION_TIMEOUT_MS}, **output),
+            OUTPUT_TRANSACTION_TIMEOUT_KEY)
+        self.kafka_sink_options = delivery_options(self)
+        self.kafka_sink_options.update(prefixed_options(output, KAFKA_SINK_OPTION_PREFIX))
+        self.s3_sink_options = prefixed_options(output, S3_SINK_OPTION_PREFIX)
+
+
+def delivery_options(config):
+    # Applied to every Kafka sink, kafka.sink.option.properties.* can override
+    # the producer settings but not the semantic
+    if config.delivery_guarantee == "exactly-once":
+        # Flink 1.13 derives the transactional ids from the sink operator, so
+        # there is no prefix to configure
+        return {
+            "sink.semantic": "exactly-once",
+            "properties.transaction.timeout.ms": str(config.transaction_timeout_ms),
+        }
+    if config.delivery_guarantee == "at-least-once":
+        return {
+            "sink.semantic": "at-least-once",
+            "properties.enable.idempotence": "true",
+            "properties.acks": "all",
+            "properties.max.in.flight.requests.per.connection": "5",
+        }
+    return {"sink.semantic": "none"}
+
+
+def interval(seconds):
+    # Single-field interval literals have a leading precision of two digits
+    if seconds < 100:
+        return "INTERVAL '{}' SECOND".format(seconds)
+    if seconds % 60 == 0 and seconds // 60 < 100:
+        return "INTERVAL '{}' MINUTE".format(seconds // 60)
+    hours, rest = divmod(seconds, 3600)
+    return "INTERVAL '{}:{:02d}:{:02d}' HOUR TO SECOND".format(hours, rest // 60, rest % 60)
+
+
+def with_clause(*option_maps):
+    options = {}
+    for option_map in option_maps:
+        options.update(option_map)
+    return ",\n                ".join(
+        "'{}' = '{}'".format(key, str(value).replace("'", "''")) for key, value in options.items())
+
+
+def topic_options(connector, topic, path, config):
+    # Kafka topic, or a directory of files in the same format for local runs
+    if connector == "filesystem":
+        options = {
+            "connector": "filesystem",
+            "path": path,
+        }
+    else:
+        options = {
+            "connector": "kafka",
+            "topic": topic,
+            "properties.bootstrap.servers": config.broker,
+        }
+    options.update(format_options(config.wire_format))
+    if connector == "kafka" and config.auth_mode == "iam":
+        options.update(MSK_IAM_OPTIONS)
+    return options
+
+
+def create_table_input(table_name, config):
+    # Late-data stats are windowed on processing time, late records never
+    # reach an event-time window
+    proc_time = "`proc_time` AS PROCTIME(),\n                " if config.late_data_mode != "off" else ""
+    if config.input_connector == "kafka":
+        source_options = {
+            "properties.group.id": config.group_id,
+            "scan.startup.mode": "earliest-offset",
+        }
+        source_options.update(config.source_options)
+    else:
+        source_options = {}
+    return """ CREATE TABLE {0} (
+                `sensor_id` VARCHAR(64) NOT NULL,
+                `temperature` BIGINT NOT NULL,
+                `event_time` TIMESTAMP(3),
+                {3}WATERMARK FOR event_time AS event_time - {1}
+              )
+              WITH (
+                {2}
+              ) """.format(table_name, interval(config.watermark_delay_seconds),
+                           with_clause(topic_options(config.input_connector, config.input_topic,
+                                                     config.input_path, config), source_options),
+                           proc_time)
+
+
+def create_table_output_kafka(table_name, config):
+    sink_options = config.kafka_sink_options if config.output_connector == "kafka" else {}
+    return """ CREATE TABLE {0} (
+                `sensor_id` VARCHAR(64) NOT NULL,
+                `count_temp` BIGINT NOT NULL ,
+                `start_event_time` TIMESTAMP(3),
+                `site` VARCHAR(128),
+                `owner` VARCHAR(128),
+                `threshold` DOUBLE
+              )
+              WITH (
+                {1}
+              ) """.format(table_name, with_clause(topic_options(config.output_connector, config.output_topic,
+                                                                 config.output_path, config), sink_options))
+
+
+def partition_columns(config):
+    columns = PARTITION_COLUMNS if config.output_s3_partitioning == "hour" else PARTITION_COLUMNS[:3]
+    return [name for name, _ in columns], ["{}(start_event_time)".format(function) for _, function in columns]
+
+
+def s3_format_options(config):
+    if config.output_s3_format == "json":
+        return {"format": "json"}
+    options = {
+        "format": config.output_s3_format,
+        S3_COMPRESSION_OPTION[config.output_s3_format]: config.output_s3_compression,
+    }
+    options.update(COLUMNAR_SINK_OPTIONS)
+    return options
+
+
+def create_table_output_s3(table_name, config):
+    s3_options = {
+        "connector": "filesystem",
+        "path": config.output_s3_path,
+    }
+    s3_options.update(s3_format_options(config))
+    s3_options.update({
+        "sink.partition-commit.policy.kind": "success-file",
+        "sink.partition-commit.delay": "1 min",
+    })
+    names, _ = partition_columns(config)
+    return """ CREATE TABLE {0} (
+                `sensor_id` VARCHAR(64) NOT NULL,
+                `avg_temp` BIGINT NOT NULL ,
+                `start_event_time` TIMESTAMP(3),
+                {1}
+              )
+              PARTITIONED BY ({2})
+              WITH (
+                {3}
+              ) """.format(table_name,
+                           ",\n                ".join("`{}` BIGINT".format(name) for name in names),
+                           ",".join("`{}`".format(name) for name in names),
+                           with_clause(s3_options, config.s3_sink_options))
+
+
+def metered(column, function, config):
+    # Output rows are few (one per sensor and window), so a Python UDF on them
+    # costs little, unlike one on every input record
+    return "{}({})".format(function, column) if config.output_metrics else column
+
+
+def above_threshold(config):
+    # Condition for a reading to count towards an alert. With the control
+    # topic, the reading's threshold column replaces alert.temperature.threshold
+    if config.sensor_thresholds:
+        return "{}(sensor_id, temperature{}) = 1".format(ABOVE_THRESHOLD_FUNCTION,
+                                                          ", threshold" if config.alert_control else "")
+    return "temperature > {}".format("threshold" if config.alert_control else config.alert_temperature_threshold)
+
+
+def alert_threshold(config, control="MAX(threshold)"):
+    # Threshold reported with an alert: the one its readings were checked
+    # against, the largest in effect during the window with the control topic
+    default = control if config.alert_control else "CAST({} AS DOUBLE)".format(config.alert_temperature_threshold)
+    if config.sensor_thresholds:
+        return "{}(sensor_id, {})".format(SENSOR_THRESHOLD_FUNCTION, default)
+    return default
+
+
+def min_count(config, aggregated="MAX(min_count)"):
+    # Readings above the threshold an alert needs more than. A window that
+    # spans a control update uses the larger of the minimum counts in it
+    return aggregated if config.alert_control else config.alert_min_count
+
+
+def insert_alerts(alerts, insert_into, config):
+    # alerts: query with sensor_id, count_temp, start_event_time, threshold
+    if config.metadata_lookup == "off":
+        return """ INSERT INTO {1}
+              SELECT sensor_id, count_temp, start_event_time,
+              CAST(NULL AS VARCHAR(128)), CAST(NULL AS VARCHAR(128)), threshold
+              FROM ({0}) """.format(alerts, insert_into)
+    if config.metadata_lookup == "jdbc":
+        # Lookup joins probe on processing time, the window rowtime is gone here
+        return """ INSERT INTO {1}
+              SELECT a.sensor_id, a.count_temp, a.start_event_time, m.site, m.owner, a.threshold
+              FROM (SELECT *, PROCTIME() AS proc_time FROM ({0})) AS a
+              LEFT JOIN {2} FOR SYSTEM_TIME AS OF a.proc_time AS m
+              ON a.sensor_id = m.sensor_id """.format(alerts, insert_into, METADATA_TABLE)
+    return """ INSERT INTO {1}
+              SELECT a.sensor_id, a.count_temp, a.start_event_time, m.site, m.owner, a.threshold
+              FROM ({0}) AS a
+              LEFT JOIN LATERAL TABLE({2}(a.sensor_id)) AS m(site, owner) ON TRUE """.format(
+        alerts, insert_into, METADATA_FUNCTION)
+
+
+def insert_stream_sns(insert_from, insert_into, config):
+    window = interval(config.alert_window_seconds)
+    alerts = """SELECT {4} AS sensor_id, count(*) AS count_temp, window_start AS start_event_time,
+              {5} AS threshold
+              FROM TABLE(TUMBLE(TABLE {0}, DESCRIPTOR(event_time), {1}))
+              where {2}
+              GROUP BY window_start, window_end, sensor_id
+              HAVING count(*) > {3}""".format(insert_from, window, above_threshold(config), min_count(config),
+                                              metered("sensor_id", ALERT_ROWS_FUNCTION, config),
+                                              alert_threshold(config))
+    return insert_alerts(alerts, insert_into, config)
+
+
+def insert_stream_s3(insert_from, insert_into, config):
+    window = interval(config.average_window_seconds)
+    return """INSERT INTO {1}
+              SELECT *, {3}
+              FROM
+              (SELECT {4} as sensor_id, AVG(temperature) as avg_temp, window_start as start_event_time
+              FROM TABLE(TUMBLE(TABLE {0}, DESCRIPTOR(event_time), {2}))
+              GROUP BY window_start, window_end, sensor_id) """.format(insert_from, insert_into, window,
+                                                                       ", ".join(partition_columns(config)[1]),
+                                                                       metered("sensor_id", AVERAGE_ROWS_FUNCTION, config))
+
+
+# Shared pre-aggregation: one keyed window aggregation per sensor and slice
+# (the gcd of both window sizes) keeps count, count above threshold, sum and
+# min/max. The alert and average outputs are rolled up from the slices, so the
+# input is scanned, shuffled and held in window state once instead of twice.
+
+SENSOR_SLICES_VIEW = "sensor_slices"
+
+def create_view_sensor_slices(view_name, insert_from, config):
+    # With skew.mode=salt, insert_from is the salted slices view
+    # (create_view_salted_slices) and its partial slices are merged per sensor
+    if config.skew_mode == "salt":
+        slices = """SELECT sensor_id, window_start AS slice_start, window_time AS slice_time,
+              SUM(cnt) AS cnt,
+              SUM(cnt_above) AS cnt_above,
+              SUM(sum_temp) AS sum_temp,
+              MIN(min_temp) AS min_temp,
+              MAX(max_temp) AS max_temp{2}
+              FROM TABLE(TUMBLE(TABLE {0}, DESCRIPTOR(slice_time), {1}))
+              GROUP BY window_start, window_end, window_time, sensor_id""".format(
+            insert_from, interval(config.slice_seconds), control_aggregates(config))
+    else:
+        slices = """SELECT sensor_id, window_start AS slice_start, window_time AS slice_time,
+              {2}
+              FROM TABLE(TUMBLE(TABLE {0}, DESCRIPTOR(event_time), {1}))
+              GROUP BY window_start, window_end, window_time, sensor_id""".format(
+            insert_from, interval(config.slice_seconds), slice_aggregates(config))
+    return """ CREATE TEMPORARY VIEW {0} AS
+              {1} """.format(view_name, slices)
+
+
+def slice_aggregates(config):
+    return """COUNT(*) AS cnt,
+              SUM(CAST(CASE WHEN {0} THEN 1 ELSE 0 END AS BIGINT)) AS cnt_above,
+              SUM(temperature) AS sum_temp,
+              MIN(temperature) AS min_temp,
+              MAX(temperature) AS max_temp{1}""".format(above_threshold(config), control_aggregates(config))
+
+
+def control_aggregates(config):
+    # The slices carry the minimum count and threshold of their readings for
+    # the alerts
+    if not config.alert_control:
+        return ""
+    return """,
+              MAX(min_count) AS min_count,
+              MAX(threshold) AS threshold"""
+
+
+# Salted slices (skew.mode=salt): the readings of a hot sensor are spread over
+# skew.salt.buckets random salts, so its window state and aggregation work are
+# split over as many subtasks instead of piling up on one. The partial slices
+# are merged per sensor in create_view_sensor_slices. Counts, sums, minimum and
+# maximum merge exactly, so every output is the same as without salting.
+
+SALTED_INPUT_VIEW = "salted_input"
+SALTED_SLICES_VIEW = "sensor_slices_salted"
+
+def sql_string(value):
+    return "'{}'".format(value.replace("'", "''"))
+
+
+def salt(config):
+    spread = "RAND_INTEGER({})".format(config.skew_salt_buckets)
+    if not config.skew_hot_keys:
+        return spread
+    return "CASE WHEN sensor_id IN ({}) THEN {} ELSE 0 END".format(
+        ", ".join(sql_string(key) for key in config.skew_hot_keys), spread)
+
+
+def create_view_salted_input(view_name, insert_from, config):
+    # A view, because window table functions only take a table name
+    return """ CREATE TEMPORARY VIEW {1} AS
+              SELECT *, {2} AS salt FROM {0} """.format(insert_from, view_name, salt(config))
+
+
+def create_view_salted_slices(view_name, insert_from, config):
+    return """ CREATE TEMPORARY VIEW {1} AS
+              SELECT sensor_id, salt, window_start AS slice_start, window_time AS slice_time,
+              {3}
+              FROM TABLE(TUMBLE(TABLE {0}, DESCRIPTOR(event_time), {2}))
+              GROUP BY window_start, window_end, window_time, sensor_id, salt """.format(
+        insert_from, view_name, interval(config.slice_seconds), slice_aggregates(config))
+
+
+def insert_alerts_from_slices(slices, insert_into, config):
+    sensor_id = metered("sensor_id", ALERT_ROWS_FUNCTION, config)
+    if config.alert_window_seconds == config.slice_seconds:
+        alerts = """SELECT {2} AS sensor_id, cnt_above AS count_temp, slice_start AS start_event_time,
+              {3} AS threshold
+              FROM {0}
+              WHERE cnt_above > {1}""".format(slices, min_count(config, "min_count"), sensor_id,
+                                              alert_threshold(config, "threshold"))
+    else:
+        alerts = """SELECT {3} AS sensor_id, SUM(cnt_above) AS count_temp, window_start AS start_event_time,
+              {4} AS threshold
+              FROM TABLE(TUMBLE(TABLE {0}, DESCRIPTOR(slice_time), {1}))
+              GROUP BY window_start, window_end, sensor_id
+              HAVING SUM(cnt_above) > {2}""".format(slices, interval(config.alert_window_seconds),
+                                                   min_count(config), sensor_id, alert_threshold(config))
+    return insert_alerts(alerts, insert_into, config)
+
+
+def insert_averages_from_slices(slices, insert_into, config):
+    # Same truncating integer average as AVG(temperature) on BIGINT
+    sensor_id = metered("sensor_id", AVERAGE_ROWS_FUNCTION, config)
+    if config.average_window_seconds == config.slice_seconds:
+        averages = """SELECT {1} as sensor_id, CAST(sum_temp / cnt AS BIGINT) as avg_temp, slice_start as start_event_time
+              FROM {0}""".format(slices, sensor_id)
+    else:
+        averages = """SELECT {2} as sensor_id, CAST(SUM(sum_temp) / SUM(cnt) AS BIGINT) as avg_temp, window_start as start_event_time
+              FROM TABLE(TUMBLE(TABLE {0}, DESCRIPTOR(slice_time), {1}))
+              GROUP BY window_start, window_end, sensor_id""".format(slices, interval(config.average_window_seconds),
+                                                                      sensor_id)
+    return """INSERT INTO {1}
+              SELECT *, {2}
+              FROM
+              ({0}) """.format(averages, insert_into, ", ".join(partition_columns(config)[1]))
+
+
+# Hot key detection (skew.metrics.enabled): the per-sensor record rates are
+# taken from the slices by a statement of their own into a blackhole sink, so
+# the non-deterministic metric function stays out of the shared slices view.
+
+KEY_RATES_TABLE = "output_table_key_rates"
+
+def create_table_key_rates(table_name):
+    return """ CREATE TABLE {0} (
+                `sensor_id` VARCHAR(64)
+              )
+              WITH (
+                'connector' = 'blackhole'
+              ) """.format(table_name)
+
+
+def insert_key_rates(slices, insert_into):
+    return """ INSERT INTO {1}
+              SELECT {2}(sensor_id, cnt) FROM {0} """.format(slices, insert_into, KEY_RATES_FUNCTION)
+
+
+# Alert control (alert.control.enabled): the threshold and minimum count are
+# read from a compacted control topic, records under the key CONTROL_KEY, e.g.
+#
+#   key   {"control_key": "alert"}
+#   value {"threshold": 35, "min_count": 5, "update_time": "2026-10-17 12:00:00"}
+#
+# Every reading is joined with the record in effect at its event time (an
+# event-time temporal join, the control versions are kept in state), so a new
+# record applies from its update_time on and no restart or savepoint is
+# needed. NULL fields fall back to alert.temperature.threshold and
+# alert.min.count; tombstones are skipped. The control topic is idle between
+# updates, table.exec.source.idle-timeout (runtime.config.0) keeps it from
+# holding back the join's watermark.
+#
+# Flink 1.13 needs a non-constant equi-join key for a temporal join, and a
+# single key would send every reading through one subtask. The readings get a
+# random bucket instead, and the versioned side repeats the control records
+# for every bucket (a UNION ALL keeps update_time a time attribute, and the
+# planner reads the source once). The versions are the latest record per
+# bucket, deduplicated on update_time, so the topic is read as an append-only
+# stream by the kafka connector.
+
+CONTROL_TABLE = "alert_control"
+CONTROL_VERSIONS_VIEW = "alert_control_versions"
+CONTROLLED_INPUT_VIEW = "controlled_input"
+CONTROL_KEY = "alert"
+
+def create_table_alert_control(table_name, config):
+    if config.input_connector == "filesystem":
+        options = {
+            "connector": "filesystem",
+            "path": config.control_path,
+            "format": "json",
+        }
+    else:
+        options = {
+            "connector": "kafka",
+            "topic": config.control_topic,
+            "properties.bootstrap.servers": config.broker,
+            "scan.startup.mode": "earliest-offset",
+            "key.format": "json",
+            "key.fields": "control_key",
+            "value.format": "json",
+            "value.fields-include": "EXCEPT_KEY",
+        }
+        if config.auth_mode == "iam":
+            options.update(MSK_IAM_OPTIONS)
+    return """ CREATE TABLE {0} (
+                `control_key` VARCHAR(64) NOT NULL,
+                `threshold` DOUBLE,
+                `min_count` BIGINT,
+                `update_time` TIMESTAMP(3),
+                WATERMARK FOR update_time AS update_time
+              )
+              WITH (
+                {1}
+              ) """.format(table_name, with_clause(options))
+
+
+def create_view_alert_control_versions(view_name, control_table, config):
+    # A versioned view: primary key bucket, time attribute update_time
+    buckets = " UNION ALL ".join(
+        "SELECT {0} AS bucket, threshold, min_count, update_time FROM {1} WHERE control_key = {2}".format(
+            bucket, control_table, sql_string(CONTROL_KEY))
+        for bucket in range(config.alert_control_buckets))
+    return """ CREATE TEMPORARY VIEW {0} AS
+              SELECT bucket, threshold, min_count, update_time
+              FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY bucket ORDER BY update_time DESC) AS row_num
+                    FROM ({1}))
+              WHERE row_num = 1 """.format(view_name, buckets)
+
+
+def create_view_controlled_input(view_name, insert_from, control_versions, config):
+    # The readings keep event_time as their time attribute
+    return """ CREATE TEMPORARY VIEW {1} AS
+              SELECT i.sensor_id, i.temperature, i.event_time,
+              COALESCE(c.threshold, {3}) AS threshold,
+              COALESCE(c.min_count, {4}) AS min_count
+              FROM (SELECT sensor_id, temperature, event_time, RAND_INTEGER({5}) AS control_bucket FROM {0}) AS i
+              LEFT JOIN {2} FOR SYSTEM_TIME AS OF i.event_time AS c
+              ON i.control_bucket = c.bucket """.format(insert_from, view_name, control_versions,
+                                                        config.alert_temperature_threshold,
+                                                        config.alert_min_count, config.alert_control_buckets)
+
+
+def add_insert_statements(table_env, statement_set, config, input_table, output_table_sns, output_table_s3):
+    if config.alert_control:
+        table_env.execute_sql(create_table_alert_control(CONTROL_TABLE, config))
+        table_env.execute_sql(create_view_alert_control_versions(CONTROL_VERSIONS_VIEW, CONTROL_TABLE, config))
+        table_env.execute_sql(create_view_controlled_input(CONTROLLED_INPUT_VIEW, input_table,
+                                                           CONTROL_VERSIONS_VIEW, config))
+        input_table = CONTROLLED_INPUT_VIEW
+    if config.shared_preaggregation:
+        slices = SENSOR_SLICES_VIEW
+        slices_from = input_table
+        if config.skew_mode == "salt":
+            table_env.execute_sql(create_view_salted_input(SALTED_INPUT_VIEW, input_table, config))
+            table_env.execute_sql(create_view_salted_slices(SALTED_SLICES_VIEW, SALTED_INPUT_VIEW, config))
+            slices_from = SALTED_SLICES_VIEW
+        table_env.execute_sql(create_view_sensor_slices(slices, slices_from, config))
+        if config.skew_metrics:
+            table_env.execute_sql(create_table_key_rates(KEY_RATES_TABLE))
+            statement_set.add_insert_sql(insert_key_rates(slices, KEY_RATES_TABLE))
+        statement_set.add_insert_sql(insert_alerts_from_slices(slices, output_table_sns, config))
+        statement_set.add_insert_sql(insert_averages_from_slices(slices, output_table_s3, config))
+    else:
+        statement_set.add_insert_sql(insert_stream_sns(input_table, output_table_sns, config))
+        statement_set.add_insert_sql(insert_stream_s3(input_table, output_table_s3, config))
@@ -0,0 +1,95 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Table runtime tuning from the runtime.config.0 property group.
+#
+# Only the keys below are accepted, with their values validated before the job
+# is built, so a typo fails the deployment instead of being silently ignored.
+# The window aggregations in pipeline.py use window table functions, which is
+# what lets mini-batch and TWO_PHASE (local-global) aggregation apply to them:
+# every subtask pre-aggregates its share of a hot sensor before the shuffle.
+
+import re
+
+RUNTIME_PROPERTY_GROUP_KEY = "runtime.config.0"
+
+RUNTIME_DEFAULTS = {
+    "table.exec.mini-batch.enabled": "true",
+    "table.exec.mini-batch.allow-latency": "1 s",
+    "table.exec.mini-batch.size": "5000",
+    "table.optimizer.agg-phase-strategy": "TWO_PHASE",
+}
+
+# Default idle timeout of jobs with the alert control topic
+SOURCE_IDLE_TIMEOUT_KEY = "table.exec.source.idle-timeout"
+DEFAULT_CONTROL_IDLE_TIMEOUT = "10 s"
+
+_DURATION = re.compile(r"^\d+\s*(ms|s|sec|min|h|d)?$")
+
+
+def _boolean(value):
+    return value.lower() in ("true", "false")
+
+
+def _duration(value):
+    return bool(_DURATION.match(value.strip()))
+
+
+def _positive_int(value):
+    return value.isdigit() and int(value) > 0
+
+
+def _non_empty(value):
+    return bool(value.strip())
+
+
+def _choice(*choices):
+    return lambda value: value.upper() in choices
+
+
+VALIDATORS = {
+    "table.exec.mini-batch.enabled": _boolean,
+    "table.exec.mini-batch.allow-latency": _duration,
+    "table.exec.mini-batch.size": _positive_int,
+    "table.optimizer.agg-phase-strategy": _choice("AUTO", "ONE_PHASE", "TWO_PHASE"),
+    "table.optimizer.distinct-agg.split.enabled": _boolean,
+    "table.optimizer.distinct-agg.split.bucket-num": _positive_int,
+    # Idle state retention for non-windowed state, "0 ms" keeps state forever
+    "table.exec.state.ttl": _duration,
+    # Source partitions without records for this long stop holding back the
+    # watermark, e.g. the alert control topic between updates
+    "table.exec.source.idle-timeout": _duration,
+    "table.exec.resource.default-parallelism": _positive_int,
+    "parallelism.default": _positive_int,
+    # Checkpointing of self-managed runs (local harness, benchmarks); Managed
+    # Flink configures checkpoints through the application instead
+    "execution.checkpointing.interval": _duration,
+    "execution.checkpointing.timeout": _duration,
+    "execution.checkpointing.min-pause": _duration,
+    "execution.checkpointing.mode": _choice("EXACTLY_ONCE", "AT_LEAST_ONCE"),
+    "execution.checkpointing.max-concurrent-checkpoints": _positive_int,
+    "state.checkpoints.dir": _non_empty,
+    # Python UDF workers: rows per Arrow batch of the vectorized functions,
+    # and rows / milliseconds per bundle before results are flushed
+    "python.fn-execution.arrow.batch.size": _positive_int,
+    "python.fn-execution.bundle.size": _positive_int,
+    "python.fn-execution.bundle.time": _positive_int,
+}
+
+
+def runtime_settings(property_group):
+    settings = dict(RUNTIME_DEFAULTS)
+    settings.update(property_group or {})
+    for key, value in settings.items():
+        if key not in VALIDATORS:
+            raise ValueError("Unsupported {} property {!r}, expected one of {}".format(
+                RUNTIME_PROPERTY_GROUP_KEY, key, sorted(VALIDATORS)))
+        if not VALIDATORS[key](str(value)):
+            raise ValueError("Invalid value {!r} for {}".format(value, key))
+    return settings
+
+
+def apply_runtime_settings(table_env, settings):
+    configuration = table_env.get_config().get_configuration()
+    for key, value in settings.items():
+        configuration.set_string(key, str(value))
@@ -0,0 +1,49 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Sensor metadata (site, owner) for the alerts, looked up once per alert in
+# the job instead of per notification in kfpLambdaConsumerSNS. The alert's
+# threshold is the one the job checked, see pipeline.alert_threshold.
+# pipeline.insert_alerts does the join, this module declares the dimension
+# table (metadata.config.0):
+#
+# lookup=jdbc     JDBC table metadata.jdbc.url / jdbc.table-name, joined with
+#                 FOR SYSTEM_TIME AS OF. The connector caches up to
+#                 cache.max-rows rows for cache.ttl.seconds (Flink 1.13 JDBC
+#                 lookups are synchronous, the cache keeps them off the hot path)
+# lookup=sqlite   metadata_udfs.SensorMetadataLookup, a cached table function
+#                 over SQLite that refreshes expired rows in the background
+
+from pipeline import METADATA_TABLE, with_clause
+
+# Keys passed through to the JDBC connector when set
+JDBC_OPTIONS = {
+    "jdbc.url": "url",
+    "jdbc.table-name": "table-name",
+    "jdbc.username": "username",
+    "jdbc.password": "password",
+    "jdbc.driver": "driver",
+}
+
+
+def create_table_sensor_metadata(config):
+    options = {"connector": "jdbc"}
+    for key, option in JDBC_OPTIONS.items():
+        if config.metadata.get(key):
+            options[option] = config.metadata[key]
+    if "url" not in options:
+        raise ValueError("metadata lookup=jdbc needs jdbc.url")
+    options.update({
+        "lookup.cache.max-rows": config.metadata_cache_max_rows,
+        "lookup.cache.ttl": "{} s".format(config.metadata_cache_ttl_seconds),
+        "lookup.max-retries": "3",
+    })
+    return """ CREATE TABLE {0} (
+                `sensor_id` VARCHAR(64) NOT NULL,
+                `site` VARCHAR(128),
+                `owner` VARCHAR(128),
+                PRIMARY KEY (`sensor_id`) NOT ENFORCED
+              )
+              WITH (
+                {1}
+              ) """.format(METADATA_TABLE, with_clause(options))
@@ -0,0 +1,14 @@
+-- Sample sensor metadata for metadata.config.0 lookup=sqlite with the default
+-- in-memory database. Sensors without a row are sent without metadata.
+CREATE TABLE IF NOT EXISTS sensor_metadata (
+    sensor_id TEXT PRIMARY KEY,
+    site TEXT,
+    owner TEXT
+);
+-- Thresholds are in sensor_thresholds.csv (pipeline.config.0 sensor.thresholds.*)
+INSERT OR REPLACE INTO sensor_metadata (sensor_id, site, owner) VALUES
+    ('1', 'Plant A, line 1', 'ops-team-a'),
+    ('2', 'Plant A, line 2', 'ops-team-a'),
+    ('3', 'Plant B, line 1', 'ops-team-b'),
+    ('4', 'Plant B, line 2', 'ops-team-b'),
+    ('5', 'Warehouse', 'facilities');
@@ -0,0 +1,31 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Format options for the Kafka tables. The format name comes from the
+# "wire.format" property, which the CDK stack sets from the same "wireFormat"
+# context value it passes to the Lambda functions (LambdaFunctions/serialization.py).
+
+WIRE_FORMAT_KEY = "wire.format"
+DEFAULT_WIRE_FORMAT = "json"
+
+FORMAT_OPTIONS = {
+    "json": {
+        "format": "json",
+        "json.timestamp-format.standard": "ISO-8601",
+    },
+    "csv": {
+        "format": "csv",
+    },
+    # Schemaless Avro binary, the schema is derived from the table columns
+    # (needs flink-sql-avro in the connector jar)
+    "avro": {
+        "format": "avro",
+    },
+}
+
+
+def format_options(wire_format):
+    if wire_format not in FORMAT_OPTIONS:
+        raise ValueError("Unsupported {} {!r}, expected one of {}".format(
+            WIRE_FORMAT_KEY, wire_format, sorted(FORMAT_OPTIONS)))
+    return dict(FORMAT_OPTIONS[wire_format])
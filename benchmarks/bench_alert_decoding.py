@@ -0,0 +1,145 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# CPU time and peak RSS of decoding a maximum-size MSK event (6 MB payload)
+# of kfp_sns_topic alerts in kfpLambdaConsumerSNS, per wire format:
+#
+#   full   base64.b64decode, then the complete decoder (json.loads for json)
+#   fast   serialization.alert_value_decoder: binascii straight from the
+#          base64 string, only the notification's fields for json
+#
+#   python benchmarks/bench_alert_decoding.py --event-bytes 6000000 --repeat 5
+#
+# Every variant runs in its own process, so its peak RSS is not inflated by
+# the ones before it. peak_rss_kb includes the event itself, as in the Lambda
+# function; decode_peak_kb is the most Python memory allocated at once while
+# decoding (tracemalloc, in a separate untimed pass).
+
+import argparse
+import base64
+import json
+import os
+import resource
+import struct
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "LambdaFunctions"))
+
+import serialization
+
+VARIANTS = ("full", "fast")
+SITES = ("Plant A, line 1", "Plant B", None)
+
+
+def encode_alert(fmt, sensor_id, count, start, site, threshold):
+    timestamp = time.strftime("%Y-%m-%dT%H:%M:%S" if fmt == "json" else "%Y-%m-%d %H:%M:%S",
+                              time.gmtime(start))
+    if fmt == "json":
+        return json.dumps({"sensor_id": sensor_id, "count_temp": count, "start_event_time": timestamp,
+                           "site": site, "owner": "ops" if site else None,
+                           "threshold": threshold if site else None}, separators=(",", ":")).encode()
+    if fmt == "csv":
+        quoted_site = '"{}"'.format(site) if site and "," in site else (site or "")
+        return "{},{},{}.000,{},{},{}".format(sensor_id, count, timestamp, quoted_site,
+                                             "ops" if site else "", threshold if site else "").encode()
+    out = [serialization._zigzag(len(sensor_id)), sensor_id.encode(), serialization._zigzag(count),
+           b"\x02", serialization._zigzag(start * 1000)]
+    for value in (site, "ops" if site else None):
+        if value is None:
+            out.append(b"\x00")
+        else:
+            out.extend((b"\x02", serialization._zigzag(len(value.encode())), value.encode()))
+    out.append(b"\x02" + struct.pack("<d", threshold) if site else b"\x00")
+    return b"".join(out)
+
+
+def build_event(fmt, event_bytes, partitions):
+    # MSK event JSON, parsed the way the Lambda runtime hands it to the handler
+    records = {"kfp_sns_topic-{}".format(p): [] for p in range(partitions)}
+    size = 0
+    offset = 0
+    while size < event_bytes:
+        value = encode_alert(fmt, str(offset % 10000), 4, 1672531200 + offset * 30,
+                             SITES[offset % len(SITES)], 30.0)
+        record = {"topic": "kfp_sns_topic", "partition": offset % partitions, "offset": offset,
+                  "timestamp": 1672531200000, "timestampType": "CREATE_TIME",
+                  "value": base64.b64encode(value).decode()}
+        records["kfp_sns_topic-{}".format(offset % partitions)].append(record)
+        size += len(json.dumps(record))
+        offset += 1
+    return json.loads(json.dumps({"eventSource": "aws:kafka", "records": records})), offset
+
+
+def child(fmt, variant, args):
+    event, count = build_event(fmt, args.event_bytes, args.partitions)
+    if variant == "full":
+        decode = serialization.alert_decoder(fmt)
+        b64decode = base64.b64decode
+
+        def decode_value(value):
+            return decode(b64decode(value))
+    else:
+        decode_value = serialization.alert_value_decoder(fmt)
+
+    def decode_event():
+        # The handler keeps a partition's decoded alerts until they are sent
+        for records in event["records"].values():
+            rows = [decode_value(record["value"]) for record in records]
+            del rows
+
+    cpu = []
+    for _ in range(args.repeat):
+        started = time.process_time()
+        decode_event()
+        cpu.append(time.process_time() - started)
+    tracemalloc.start()
+    decode_event()
+    decode_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "format": fmt,
+        "variant": variant,
+        "records": count,
+        "cpu_ms": round(min(cpu) * 1000, 1),
+        "us_per_record": round(min(cpu) * 1e6 / count, 2),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "decode_peak_kb": decode_peak // 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SNS consumer alert decoding benchmark")
+    parser.add_argument("--event-bytes", type=int, default=6000000)
+    parser.add_argument("--partitions", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5, help="best of n decoding passes")
+    parser.add_argument("--formats", nargs="+", default=list(serialization.WIRE_FORMATS),
+                        choices=serialization.WIRE_FORMATS)
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=VARIANTS)
+    parser.add_argument("--child", nargs=2, metavar=("FORMAT", "VARIANT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args.child[0], args.child[1], args)))
+        return
+    results = []
+    for fmt in args.formats:
+        for variant in args.variants:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", fmt, variant,
+                 "--event-bytes", str(args.event_bytes), "--partitions", str(args.partitions),
+                 "--repeat", str(args.repeat)],
+                check=True, stdout=subprocess.PIPE, env=dict(os.environ, wireFormat=fmt)).stdout
+            results.append(json.loads(output))
+    for result in results:
+        full = next((r for r in results if r["format"] == result["format"] and r["variant"] == "full"), None)
+        if full:
+            result["cpu_speedup"] = round(full["cpu_ms"] / result["cpu_ms"], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Synthesis time of MSKFlinkStreamingStack, and a check that consecutive
+# syntheses of an unchanged app produce identical templates (so `cdk deploy`
+# of an unchanged stack is a no-op). Runs the app in-process with the
+# context of cdk.json, from the repository root:
+#
+#   pip install -r requirements.txt
+#   zip -r PythonKafkaSink.zip PythonKafkaSink/ -x "*/__pycache__/*"
+#   python benchmarks/bench_cdk_synth.py --runs 3
+#
+# Asset bundling (a Docker build of the producer Lambda) is skipped unless
+# --bundling is given, it would dominate the timings. Exits with status 1 when
+# two runs produce different templates.
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT)
+
+import aws_cdk as cdk
+
+from msk_flink_streaming_stack import MSKFlinkStreamingStack
+
+
+def synth(outdir, bundling):
+    with open(os.path.join(ROOT, "cdk.json")) as file:
+        context = json.load(file)["context"]
+    if not bundling:
+        context["aws:cdk:bundling-stacks"] = []
+    # Timed from the construction of the app: most of a synth is spent
+    # building the construct tree, not writing the templates
+    started = time.perf_counter()
+    app = cdk.App(outdir=outdir, context=context)
+    MSKFlinkStreamingStack(app, "MSKFlinkStreamingStack")
+    app.synth()
+    return time.perf_counter() - started
+
+
+def templates(outdir):
+    # Root and nested stack templates, keyed by file name
+    result = {}
+    for name in sorted(os.listdir(outdir)):
+        if name.endswith(".template.json"):
+            with open(os.path.join(outdir, name)) as file:
+                result[name] = json.load(file)
+    return result
+
+
+def summary(outdir):
+    found = templates(outdir)
+    resources = {}
+    for template in found.values():
+        for resource in template.get("Resources", {}).values():
+            resources[resource["Type"]] = resources.get(resource["Type"], 0) + 1
+    with open(os.path.join(outdir, "manifest.json")) as file:
+        manifest = json.load(file)
+    assets = sum(1 for artifact in manifest["artifacts"].values() if artifact["type"] == "cdk:asset-manifest")
+    digest = hashlib.sha256(json.dumps(found, sort_keys=True).encode()).hexdigest()
+    return found, {
+        "templates": len(found),
+        "resources": sum(resources.values()),
+        "custom_resources": resources.get("Custom::AWS", 0),
+        "bucket_deployments": resources.get("Custom::CDKBucketDeployment", 0),
+        "asset_manifests": assets,
+        "digest": digest[:16],
+    }
+
+
+def diff(first, second):
+    # Logical ids that differ between two syntheses, per template
+    changed = {}
+    for name in sorted(set(first) | set(second)):
+        a = first.get(name, {}).get("Resources", {})
+        b = second.get(name, {}).get("Resources", {})
+        ids = sorted(key for key in set(a) | set(b) if a.get(key) != b.get(key))
+        if ids:
+            changed[name] = ids
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CDK synth time and template determinism")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--bundling", action="store_true", help="bundle the producer Lambda with Docker")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    if not os.path.exists("PythonKafkaSink.zip"):
+        raise SystemExit("PythonKafkaSink.zip is missing, see the README")
+    results = []
+    first = None
+    changed = {}
+    for run in range(args.runs):
+        outdir = tempfile.mkdtemp(prefix="cdk-synth-")
+        try:
+            seconds = synth(outdir, args.bundling)
+            found, result = summary(outdir)
+        finally:
+            shutil.rmtree(outdir, ignore_errors=True)
+        result.update(run=run, seconds=round(seconds, 3))
+        results.append(result)
+        if first is None:
+            first = found
+        else:
+            changed.update(diff(first, found))
+    identical = len({r["digest"] for r in results}) == 1
+    print(json.dumps({"runs": results, "identical": identical, "changed": changed}, indent=2))
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
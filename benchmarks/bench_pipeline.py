@@ -0,0 +1,204 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# End-to-end benchmark of the sensor pipeline on the local stand-ins of
+# local/harness.py: producer Lambda -> Flink job on a local mini-cluster ->
+# SNS consumer Lambda. Sweeps record rate, sensor cardinality and late-record
+# ratio and writes one JSON document with a result per combination, tagged
+# with the git commit, so runs can be compared across commits.
+#
+#   pip install apache-flink==1.13.6 boto3 -r LambdaFunctions/requirements.txt
+#   python benchmarks/bench_pipeline.py --records 200000 --rates 0 20000 \
+#       --sensors 100 10000 --late-ratios 0 0.05 --output bench_pipeline.json
+#
+# Reported per run:
+#   throughput    records/sec of the producer, of the Flink job (including
+#                 job startup) and of the whole run
+#   latency       event_time -> SNS publish, measured from the end of each
+#                 alert window. The local stages run one after the other, so
+#                 this includes the producer run and Flink startup: compare it
+#                 between commits, not with a deployed pipeline.
+#   checkpoints   count and the largest checkpoint seen while the job ran
+#   rows          alerts, averages and published notifications
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "local"))
+sys.path.insert(0, os.path.join(ROOT, "PythonKafkaSink"))
+sys.path.insert(0, os.path.join(ROOT, "LambdaFunctions"))
+
+import harness
+import serialization
+from pipeline import PIPELINE_DEFAULTS
+
+
+class CheckpointMonitor(threading.Thread):
+    # Polls the checkpoint directory while the job runs: a bounded job
+    # discards its checkpoints when it finishes
+    def __init__(self, directory, interval=0.2):
+        super().__init__(daemon=True)
+        self.directory = directory
+        self.interval = interval
+        self.checkpoints = set()
+        self.max_bytes = 0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        for path, _, _ in os.walk(self.directory):
+            name = os.path.basename(path)
+            if not name.startswith("chk-"):
+                continue
+            size = 0
+            for root, _, names in os.walk(path):
+                for file_name in names:
+                    try:
+                        size += os.path.getsize(os.path.join(root, file_name))
+                    except OSError:
+                        pass
+            self.checkpoints.add(name)
+            self.max_bytes = max(self.max_bytes, size)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return {"count": len(self.checkpoints), "max_bytes": self.max_bytes}
+
+
+def percentiles(values, points=(50, 95, 99)):
+    if not values:
+        return {}
+    ordered = sorted(values)
+    result = {"p{}".format(p): round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))], 3)
+              for p in points}
+    result["max"] = round(ordered[-1], 3)
+    return result
+
+
+def window_end(alert, window_seconds):
+    # start_event_time is UTC, ISO-8601 (json) or SQL (csv) formatted
+    start = datetime.datetime.fromisoformat(str(alert["start_event_time"]).replace("T", " ").rstrip("Z"))
+    return start.replace(tzinfo=datetime.timezone.utc).timestamp() + window_seconds
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, check=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_one(args, rate, sensors, late_ratio):
+    workdir = tempfile.mkdtemp(prefix="kfp-bench-")
+    checkpoint_dir = os.path.join(workdir, "checkpoints")
+    pipeline = {"late.data.mode": args.late_data_mode}
+    runtime = {
+        "parallelism.default": str(args.parallelism),
+        "execution.checkpointing.interval": args.checkpoint_interval,
+        "state.checkpoints.dir": "file://" + checkpoint_dir,
+    }
+    properties_file = harness.prepare_workdir(workdir, args.wire_format, pipeline=pipeline, runtime=runtime)
+    # Wall-clock event times (no startTime), so they can be compared with publish times
+    event = {"records": args.records, "rate": rate, "sensors": sensors, "zipfExponent": args.zipf,
+             "lateRatio": late_ratio, "maxLatenessSeconds": args.max_lateness, "seed": args.seed}
+
+    started = time.time()
+    producer = harness.run_producer(workdir, args.wire_format, event)
+    produced = time.time()
+
+    monitor = CheckpointMonitor(checkpoint_dir)
+    monitor.start()
+    harness.run_flink(properties_file)
+    checkpoints = monitor.stop()
+    processed = time.time()
+
+    alert_lines = harness.read_lines(os.path.join(workdir, "topics", harness.OUTPUT_TOPIC))
+    averages = harness.read_lines(os.path.join(workdir, "s3"))
+    late_records = harness.read_lines(os.path.join(workdir, "topics", "late_records"))
+    consumer, sns = harness.run_consumer(args.wire_format, alert_lines, args.consumer_batch_size)
+    finished = time.time()
+
+    decode_alert = serialization.alert_decoder(args.wire_format)
+    window_seconds = int(PIPELINE_DEFAULTS["alert.window.seconds"])
+    latencies = [sns.published_at[str(offset)] - window_end(decode_alert(value), window_seconds)
+                 for offset, value in enumerate(alert_lines) if str(offset) in sns.published_at]
+
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "params": {"rate": rate, "sensors": sensors, "late_ratio": late_ratio},
+        "records": producer["records"],
+        "records_per_sec": {
+            "producer": producer["records_per_sec"],
+            "flink": round(producer["records"] / (processed - produced), 1),
+            "end_to_end": round(producer["records"] / (finished - started), 1),
+        },
+        "seconds": {
+            "producer": round(produced - started, 3),
+            "flink": round(processed - produced, 3),
+            "consumer": round(finished - processed, 3),
+        },
+        "latency_seconds": percentiles(latencies),
+        "checkpoints": checkpoints,
+        "rows": {"alerts": len(alert_lines), "averages": len(averages), "late_records": len(late_records),
+                 "published": consumer["published"], "failed": consumer["failed"]},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark on local stand-ins.")
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--rates", type=float, nargs="+", default=[0],
+                        help="producer records/sec, 0 for as fast as possible")
+    parser.add_argument("--sensors", type=int, nargs="+", default=[5, 10000])
+    parser.add_argument("--late-ratios", type=float, nargs="+", default=[0.0, 0.05])
+    parser.add_argument("--max-lateness", type=float, default=30)
+    parser.add_argument("--zipf", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--wire-format", default="json", choices=harness.LOCAL_WIRE_FORMATS)
+    parser.add_argument("--parallelism", type=int, default=1)
+    parser.add_argument("--checkpoint-interval", default="1 s")
+    parser.add_argument("--late-data-mode", default="route", choices=("off", "metrics", "route"),
+                        help="late.data.mode of the job; route also counts the late records")
+    parser.add_argument("--consumer-batch-size", type=int, default=100)
+    parser.add_argument("--keep", action="store_true", help="keep the work directories")
+    parser.add_argument("--output", help="write the results to this file instead of stdout")
+    args = parser.parse_args()
+
+    results = [run_one(args, rate, sensors, late_ratio)
+               for rate, sensors, late_ratio in itertools.product(args.rates, args.sensors, args.late_ratios)]
+    report = {
+        "benchmark": "pipeline",
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "wire_format": args.wire_format,
+        "parallelism": args.parallelism,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
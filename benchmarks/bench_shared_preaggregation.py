@@ -0,0 +1,120 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Compares the shared pre-aggregation plan with the two independent window
+# aggregations on a local PyFlink mini-cluster. A bounded datagen source feeds
+# the statement set built by PythonKafkaSink/pipeline.py, the outputs go to
+# blackhole sinks, so the run time is the cost of the aggregations themselves.
+#
+#   pip install apache-flink==1.13.6
+#   python benchmarks/bench_shared_preaggregation.py --rows 5000000 --sensors 100000
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "PythonKafkaSink"))
+
+from pyflink.table import EnvironmentSettings, StreamTableEnvironment
+
+from pipeline import PipelineConfig, add_insert_statements
+from runtime_tuning import RUNTIME_DEFAULTS, apply_runtime_settings
+
+
+def benchmark_properties(shared):
+    return [
+        {"PropertyGroupId": "producer.config.0",
+         "PropertyMap": {"input.topic.name": "unused", "bootstrap.servers": "unused"}},
+        {"PropertyGroupId": "consumer.config.0",
+         "PropertyMap": {"output.topic.name": "unused", "output.s3.bucket": "unused"}},
+        {"PropertyGroupId": "pipeline.config.0",
+         # Without the Python metric UDFs, so only the aggregations are compared
+         "PropertyMap": {"shared.preaggregation.enabled": str(shared).lower(),
+                         "output.metrics.enabled": "false"}},
+    ]
+
+
+def create_tables(table_env, config, rows, sensors, rows_per_second):
+    # One second of event time per rows_per_second records, temperatures 27-32
+    table_env.execute_sql(""" CREATE TABLE input_table (
+                `seq` BIGINT,
+                `sensor_num` INT,
+                `temperature` BIGINT,
+                `sensor_id` AS CAST(sensor_num AS VARCHAR(64)),
+                `event_time` AS TO_TIMESTAMP(FROM_UNIXTIME(1672531200 + seq / {3})),
+                WATERMARK FOR event_time AS event_time - INTERVAL '{4}' SECOND
+              )
+              WITH (
+                'connector' = 'datagen',
+                'number-of-rows' = '{0}',
+                'fields.seq.kind' = 'sequence',
+                'fields.seq.start' = '0',
+                'fields.seq.end' = '{1}',
+                'fields.sensor_num.min' = '1',
+                'fields.sensor_num.max' = '{2}',
+                'fields.temperature.min' = '27',
+                'fields.temperature.max' = '32'
+              ) """.format(rows, rows - 1, sensors, rows_per_second, config.watermark_delay_seconds))
+    table_env.execute_sql(""" CREATE TABLE output_table_sns (
+                `sensor_id` VARCHAR(64) NOT NULL,
+                `count_temp` BIGINT NOT NULL,
+                `start_event_time` TIMESTAMP(3),
+                `site` VARCHAR(128),
+                `owner` VARCHAR(128),
+                `threshold` DOUBLE
+              ) WITH ('connector' = 'blackhole') """)
+    table_env.execute_sql(""" CREATE TABLE output_table_s3 (
+                `sensor_id` VARCHAR(64) NOT NULL,
+                `avg_temp` BIGINT NOT NULL,
+                `start_event_time` TIMESTAMP(3),
+                `year` BIGINT,
+                `month` BIGINT,
+                `day` BIGINT,
+                `hour` BIGINT
+              ) WITH ('connector' = 'blackhole') """)
+
+
+def run(shared, args):
+    settings = EnvironmentSettings.new_instance().in_streaming_mode().use_blink_planner().build()
+    table_env = StreamTableEnvironment.create(environment_settings=settings)
+    runtime = dict(RUNTIME_DEFAULTS, **{"parallelism.default": str(args.parallelism)})
+    apply_runtime_settings(table_env, runtime)
+
+    config = PipelineConfig(benchmark_properties(shared))
+    create_tables(table_env, config, args.rows, args.sensors, args.rows_per_second)
+    statement_set = table_env.create_statement_set()
+    add_insert_statements(table_env, statement_set, config, "input_table", "output_table_sns", "output_table_s3")
+
+    plan = statement_set.explain().split("== Optimized Execution Plan ==")[-1]
+    started = time.time()
+    statement_set.execute().wait()
+    elapsed = time.time() - started
+    return {
+        "plan": "shared" if shared else "independent",
+        "rows": args.rows,
+        "sensors": args.sensors,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(args.rows / elapsed, 1),
+        # Window aggregations holding keyed state (local pre-aggregation excluded)
+        "window_aggregations": len(re.findall(r"\b(?:Global)?WindowAggregate\(", plan)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared vs independent window aggregation benchmark")
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--sensors", type=int, default=100000)
+    parser.add_argument("--rows-per-second", type=int, default=10000, help="records per second of event time")
+    parser.add_argument("--parallelism", type=int, default=1)
+    args = parser.parse_args()
+
+    results = [run(False, args), run(True, args)]
+    results.append({"speedup": round(results[0]["seconds"] / results[1]["seconds"], 2)})
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
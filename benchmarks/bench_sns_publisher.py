@@ -0,0 +1,119 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Handler latency of kfpLambdaConsumerSNS per publishMode against the local
+# SNS HTTP stand-in (local/sns_stand_in.py), with a real boto3 client:
+#
+#   threads        one executor thread per partition, batches sent in turn
+#   async          batches of all partitions in flight together
+#   async-ordered  async, with each partition's batches sent in offset order
+#
+#   pip install boto3
+#   python benchmarks/bench_sns_publisher.py --invocations 20 --partitions 4 \
+#       --records 500 --latency-ms 20 --throttle-every 0
+#
+# Each invocation gets an MSK event of --partitions partitions with --records
+# alerts each; every alert is distinct, so none is dropped as a duplicate.
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "local"))
+
+import harness
+from bench_pipeline import percentiles
+from sns_stand_in import SNSStandIn
+
+MODES = {
+    "threads": {"publishMode": "threads"},
+    "async": {"publishMode": "async", "publishOrdered": "false"},
+    "async-ordered": {"publishMode": "async", "publishOrdered": "true"},
+}
+
+
+def alert_events(invocations, partitions, records):
+    # Distinct window starts per invocation and offset
+    for invocation in range(invocations):
+        event = {"eventSource": "aws:kafka", "records": {}}
+        for partition in range(partitions):
+            values = []
+            for offset in range(records):
+                start = harness.START_TIME + (invocation * records + offset) * 30
+                alert = {"sensor_id": str(partition * 100 + offset % 100), "count_temp": 4,
+                         "start_event_time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(start))}
+                values.append({"topic": harness.OUTPUT_TOPIC, "partition": partition,
+                               "offset": invocation * records + offset,
+                               "timestamp": int(time.time() * 1000), "timestampType": "CREATE_TIME",
+                               "value": base64.b64encode(json.dumps(alert).encode()).decode()})
+            event["records"]["{}-{}".format(harness.OUTPUT_TOPIC, partition)] = values
+        yield event
+
+
+def run_mode(mode, args, stand_in):
+    consumer = harness.lambda_module("kfpLambdaConsumerSNS", dict(MODES[mode], **{
+        "SNSTopicArn": harness.SNS_TOPIC_ARN,
+        "SNSEndpointUrl": stand_in.endpoint_url,
+        "wireFormat": "json",
+        "publishConcurrency": str(args.concurrency),
+        "alertCooldownSeconds": "0",
+        "metricsSampleEvery": "0",
+    }))
+    # The EMF and per-partition log lines would dominate the timings
+    consumer.print = lambda *a, **k: None
+    consumer.metrics.flush = consumer.metrics._reset
+    calls, throttled = stand_in.calls, stand_in.throttled
+    durations = []
+    published = failed = 0
+    for event in alert_events(args.invocations, args.partitions, args.records):
+        started = time.perf_counter()
+        response = consumer.lambda_handler(event, None)
+        durations.append((time.perf_counter() - started) * 1000)
+        published += sum(result["published"] for result in response["partitions"].values())
+        failed += len(response["batchItemFailures"])
+    consumer.executor.shutdown()
+    alerts = args.invocations * args.partitions * args.records
+    return {
+        "mode": mode,
+        "invocation_ms": percentiles(durations),
+        "alerts_per_sec": round(alerts / (sum(durations) / 1000), 1),
+        "published": published,
+        "failed": failed,
+        "publish_calls": stand_in.calls - calls,
+        "throttled_calls": stand_in.throttled - throttled,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SNS publisher: threaded loop vs asyncio")
+    parser.add_argument("--invocations", type=int, default=20)
+    parser.add_argument("--partitions", type=int, default=4)
+    parser.add_argument("--records", type=int, default=500, help="alerts per partition and invocation")
+    parser.add_argument("--concurrency", type=int, default=8, help="publishConcurrency")
+    parser.add_argument("--latency-ms", type=float, default=20, help="stand-in latency per PublishBatch call")
+    parser.add_argument("--throttle-every", type=int, default=0, help="throttle every n-th call, 0 never")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    # botocore signs every request, any credentials do
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "local")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "local")
+    stand_in = SNSStandIn(latency_ms=args.latency_ms, throttle_every=args.throttle_every).start()
+    try:
+        results = [run_mode(mode, args, stand_in) for mode in args.modes]
+    finally:
+        stand_in.stop()
+    baseline = next((r["invocation_ms"]["p50"] for r in results if r["mode"] == "threads"), None)
+    if baseline:
+        for result in results:
+            result["speedup_p50"] = round(baseline / result["invocation_ms"]["p50"], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Cost of the Python UDF path on a local PyFlink mini-cluster. The same
+# datagen input and blackhole sinks as bench_shared_preaggregation.py run with:
+#
+#   sql          fixed threshold, pure SQL plan
+#   row          per-sensor thresholds through a row-at-a-time Python UDF
+#   vectorized   per-sensor thresholds through the Pandas UDF (anomaly_udfs.py)
+#   vectorized+zscore   as vectorized, plus the rolling z-score UDAF
+#
+# and reports each run's time as a factor of the pure SQL plan.
+#
+#   pip install apache-flink==1.13.6
+#   python benchmarks/bench_vectorized_udfs.py --rows 2000000 --sensors 10000 --arrow-batch-size 10000
+
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "PythonKafkaSink"))
+
+from pyflink.table import DataTypes, EnvironmentSettings, StreamTableEnvironment
+from pyflink.table.udf import ScalarFunction, udf
+
+from pipeline import ABOVE_THRESHOLD_FUNCTION, SENSOR_THRESHOLD_FUNCTION, PipelineConfig, add_insert_statements
+from runtime_tuning import RUNTIME_DEFAULTS, apply_runtime_settings
+from anomaly import create_view_window_means, insert_anomalies
+from anomaly_udfs import SensorThreshold, load_thresholds, register_anomaly_functions
+from bench_shared_preaggregation import create_tables
+
+VARIANTS = ("sql", "row", "vectorized", "vectorized+zscore")
+
+
+class RowAboveThreshold(ScalarFunction):
+    # Row-at-a-time equivalent of anomaly_udfs.AboveThreshold
+    def __init__(self, thresholds, default):
+        self.thresholds = thresholds
+        self.default = default
+
+    def eval(self, sensor_id, temperature):
+        return 1 if temperature > self.thresholds.get(sensor_id, self.default) else 0
+
+
+def write_thresholds(sensors, seed):
+    rng = random.Random(seed)
+    file = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, newline="")
+    with file:
+        writer = csv.writer(file)
+        writer.writerow(["sensor_id", "threshold"])
+        for sensor in range(1, sensors + 1):
+            writer.writerow([sensor, rng.choice((29, 30, 31))])
+    return file.name
+
+
+def benchmark_properties(variant, thresholds_file):
+    return [
+        {"PropertyGroupId": "producer.config.0",
+         "PropertyMap": {"input.topic.name": "unused", "bootstrap.servers": "unused"}},
+        {"PropertyGroupId": "consumer.config.0",
+         "PropertyMap": {"output.topic.name": "unused", "output.s3.bucket": "unused"}},
+        {"PropertyGroupId": "pipeline.config.0",
+         "PropertyMap": {"output.metrics.enabled": "false",
+                         "sensor.thresholds.enabled": str(variant != "sql").lower(),
+                         "sensor.thresholds.file": thresholds_file,
+                         "anomaly.zscore.enabled": str(variant == "vectorized+zscore").lower()}},
+    ]
+
+
+def run(variant, args, thresholds_file):
+    settings = EnvironmentSettings.new_instance().in_streaming_mode().use_blink_planner().build()
+    table_env = StreamTableEnvironment.create(environment_settings=settings)
+    runtime = dict(RUNTIME_DEFAULTS, **{
+        "parallelism.default": str(args.parallelism),
+        "python.fn-execution.arrow.batch.size": str(args.arrow_batch_size),
+        "python.fn-execution.bundle.size": str(args.bundle_size),
+    })
+    apply_runtime_settings(table_env, runtime)
+
+    config = PipelineConfig(benchmark_properties(variant, thresholds_file))
+    create_tables(table_env, config, args.rows, args.sensors, args.rows_per_second)
+    if variant == "row":
+        table_env.create_temporary_system_function(ABOVE_THRESHOLD_FUNCTION, udf(
+            RowAboveThreshold(load_thresholds(thresholds_file), config.alert_temperature_threshold),
+            result_type=DataTypes.BIGINT()))
+        # Only on the alert rows, as in the vectorized variants
+        table_env.create_temporary_system_function(SENSOR_THRESHOLD_FUNCTION, udf(
+            SensorThreshold(load_thresholds(thresholds_file)), result_type=DataTypes.DOUBLE(), func_type="pandas"))
+    else:
+        register_anomaly_functions(table_env, config)
+
+    statement_set = table_env.create_statement_set()
+    add_insert_statements(table_env, statement_set, config, "input_table", "output_table_sns", "output_table_s3")
+    if config.anomaly_zscore:
+        table_env.execute_sql(""" CREATE TABLE output_table_anomalies (
+                `sensor_id` VARCHAR(64) NOT NULL,
+                `mean_temp` DOUBLE,
+                `zscore` DOUBLE,
+                `start_event_time` TIMESTAMP(3)
+              ) WITH ('connector' = 'blackhole') """)
+        table_env.execute_sql(create_view_window_means("sensor_window_means", "input_table", config))
+        statement_set.add_insert_sql(insert_anomalies("sensor_window_means", "output_table_anomalies", config))
+
+    started = time.time()
+    statement_set.execute().wait()
+    elapsed = time.time() - started
+    return {
+        "variant": variant,
+        "rows": args.rows,
+        "sensors": args.sensors,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(args.rows / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pure SQL vs Python UDF overhead benchmark")
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--sensors", type=int, default=10000)
+    parser.add_argument("--rows-per-second", type=int, default=10000, help="records per second of event time")
+    parser.add_argument("--parallelism", type=int, default=1)
+    parser.add_argument("--arrow-batch-size", type=int, default=10000)
+    parser.add_argument("--bundle-size", type=int, default=100000)
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=VARIANTS)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    thresholds_file = write_thresholds(args.sensors, args.seed)
+    try:
+        results = [run(variant, args, thresholds_file) for variant in args.variants]
+    finally:
+        os.unlink(thresholds_file)
+    baseline = next((r["seconds"] for r in results if r["variant"] == "sql"), None)
+    if baseline:
+        for result in results:
+            result["overhead_factor"] = round(result["seconds"] / baseline, 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# MSK broker configuration (the CfnConfiguration server properties) built
+# from the cluster_config template, a named tuning profile and per-deployment
+# overrides, in that order, and validated against the properties MSK accepts
+# in a custom configuration. Preview a configuration without synthesizing:
+#
+#   python broker_config.py --profile high-throughput --set num.io.threads=16
+
+import argparse
+import json
+
+# Properties MSK accepts in a custom configuration
+# See https://docs.aws.amazon.com/msk/latest/developerguide/msk-configuration-properties.html
+BOOLEAN_KEYS = {
+    "allow.everyone.if.no.acl.found",
+    "auto.create.topics.enable",
+    "auto.leader.rebalance.enable",
+    "delete.topic.enable",
+    "log.cleaner.enable",
+    "unclean.leader.election.enable",
+}
+INTEGER_KEYS = {
+    "connections.max.idle.ms",
+    "default.replication.factor",
+    "group.initial.rebalance.delay.ms",
+    "group.max.session.timeout.ms",
+    "group.min.session.timeout.ms",
+    "leader.imbalance.per.broker.percentage",
+    "log.cleaner.delete.retention.ms",
+    "log.cleaner.min.cleanable.ratio",
+    "log.flush.interval.messages",
+    "log.flush.interval.ms",
+    "log.message.timestamp.difference.max.ms",
+    "log.retention.bytes",
+    "log.retention.hours",
+    "log.retention.minutes",
+    "log.retention.ms",
+    "log.roll.ms",
+    "log.segment.bytes",
+    "log.segment.delete.delay.ms",
+    "max.incremental.fetch.session.cache.slots",
+    "message.max.bytes",
+    "min.insync.replicas",
+    "num.io.threads",
+    "num.network.threads",
+    "num.partitions",
+    "num.recovery.threads.per.data.dir",
+    "num.replica.fetchers",
+    "offsets.retention.minutes",
+    "offsets.topic.replication.factor",
+    "replica.fetch.max.bytes",
+    "replica.fetch.response.max.bytes",
+    "replica.lag.time.max.ms",
+    "replica.socket.receive.buffer.bytes",
+    "socket.receive.buffer.bytes",
+    "socket.request.max.bytes",
+    "socket.send.buffer.bytes",
+    "transaction.max.timeout.ms",
+    "transaction.state.log.min.isr",
+    "transaction.state.log.replication.factor",
+    "transactional.id.expiration.ms",
+    "zookeeper.session.timeout.ms",
+}
+CHOICE_KEYS = {
+    "compression.type": ("producer", "uncompressed", "gzip", "snappy", "lz4", "zstd"),
+    "log.cleanup.policy": ("delete", "compact", "compact,delete"),
+    "log.message.timestamp.type": ("CreateTime", "LogAppendTime"),
+}
+ALLOWED_KEYS = BOOLEAN_KEYS | INTEGER_KEYS | set(CHOICE_KEYS)
+# Ratios rather than integers
+DECIMAL_KEYS = {"log.cleaner.min.cleanable.ratio"}
+# Kafka's default transaction.max.timeout.ms
+DEFAULT_TRANSACTION_MAX_TIMEOUT_MS = 900000
+
+# Tuning profiles. Producers batch and compress with lz4, so the brokers keep
+# the producer's compression instead of recompressing.
+PROFILES = {
+    # MSK's defaults for the instance type
+    "msk-default": {},
+    # Short acks=all round trips: more replica fetchers so followers catch up
+    # quickly, consumer groups start without the initial rebalance delay
+    "low-latency": {
+        "compression.type": "producer",
+        "num.network.threads": 5,
+        "num.io.threads": 8,
+        "num.replica.fetchers": 4,
+        "replica.lag.time.max.ms": 10000,
+        "group.initial.rebalance.delay.ms": 0,
+    },
+    # Large batches: more request handler threads, 1 MB socket buffers and
+    # 1 GB segments
+    "high-throughput": {
+        "compression.type": "producer",
+        "num.network.threads": 8,
+        "num.io.threads": 16,
+        "num.replica.fetchers": 4,
+        "socket.send.buffer.bytes": 1048576,
+        "socket.receive.buffer.bytes": 1048576,
+        "replica.socket.receive.buffer.bytes": 1048576,
+        "replica.fetch.max.bytes": 10485760,
+        "replica.fetch.response.max.bytes": 20971520,
+        "log.segment.bytes": 1073741824,
+    },
+    # Less storage: one day of retention in smaller segments that are deleted
+    # sooner, fewer threads on small brokers
+    "cost-optimized": {
+        "compression.type": "producer",
+        "num.network.threads": 3,
+        "num.io.threads": 4,
+        "num.replica.fetchers": 1,
+        "log.retention.hours": 24,
+        "log.segment.bytes": 268435456,
+    },
+}
+
+
+def parse_properties(text):
+    properties = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            key, _, value = line.partition("=")
+            properties[key.strip()] = value.strip()
+    return properties
+
+
+def render(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def validate(properties, transaction_timeout_ms=None):
+    # Raises ValueError for keys MSK rejects, malformed values and
+    # inconsistent settings
+    unknown = sorted(set(properties) - ALLOWED_KEYS)
+    if unknown:
+        raise ValueError("Not configurable in MSK: {}".format(", ".join(unknown)))
+    for key, value in properties.items():
+        if key in BOOLEAN_KEYS and value not in ("true", "false"):
+            raise ValueError("{} must be true or false, got {!r}".format(key, value))
+        if key in CHOICE_KEYS and value not in CHOICE_KEYS[key]:
+            raise ValueError("{} must be one of {}, got {!r}".format(key, CHOICE_KEYS[key], value))
+        if key in INTEGER_KEYS:
+            try:
+                number = float(value) if key in DECIMAL_KEYS else int(value)
+            except ValueError:
+                raise ValueError("{} must be a number, got {!r}".format(key, value))
+            if number < 0:
+                raise ValueError("{} must not be negative, got {!r}".format(key, value))
+
+    if "min.insync.replicas" in properties and "default.replication.factor" in properties:
+        if int(properties["min.insync.replicas"]) > int(properties["default.replication.factor"]):
+            raise ValueError("min.insync.replicas must not exceed default.replication.factor")
+    # The exactly-once Flink sink's transactions must fit the broker maximum
+    max_timeout_ms = int(properties.get("transaction.max.timeout.ms", DEFAULT_TRANSACTION_MAX_TIMEOUT_MS))
+    if transaction_timeout_ms and max_timeout_ms < transaction_timeout_ms:
+        raise ValueError("transaction.max.timeout.ms must be at least the Flink sink's transaction timeout "
+                         "of {} ms".format(transaction_timeout_ms))
+
+
+def server_properties(template, profile, overrides=None, transaction_timeout_ms=None):
+    # template: contents of cluster_config; overrides: {key: value} applied
+    # last. Returns the validated server properties, one key per line, sorted.
+    if profile not in PROFILES:
+        raise ValueError("Broker config profile must be one of {}, got {!r}".format(tuple(PROFILES), profile))
+    properties = parse_properties(template)
+    for source in (PROFILES[profile], overrides or {}):
+        properties.update((key, render(value)) for key, value in source.items())
+    validate(properties, transaction_timeout_ms)
+    return "".join("{} = {}\n".format(key, properties[key]) for key in sorted(properties))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MSK broker server properties of a tuning profile")
+    parser.add_argument("--profile", default="low-latency", choices=list(PROFILES))
+    parser.add_argument("--template", default="cluster_config")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="override a property")
+    parser.add_argument("--overrides", type=json.loads, default={}, help="overrides as a JSON object")
+    args = parser.parse_args()
+    overrides = dict(args.overrides)
+    overrides.update(item.split("=", 1) for item in args.set)
+    with open(args.template) as file:
+        template = file.read()
+    print(server_properties(template, args.profile, overrides), end="")
+
+
+if __name__ == "__main__":
+    main()
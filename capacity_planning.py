@@ -0,0 +1,173 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Capacity planning for MSKFlinkStreamingStack: derives the MSK brokers, the
+# topic partition counts, the Flink parallelism and the SNS consumer's event
+# source batch size from a target ingest throughput. Plain Python, so a plan
+# can be computed (and checked) without synthesizing the stack:
+#
+#   python capacity_planning.py --ingest-mbps 40 --record-bytes 120 \
+#       --retention-hours 72 --peak-factor 3 --az-count 3
+#
+# The per-broker and per-partition figures are conservative planning numbers
+# (replication factor 3, TLS in transit, lz4 batches); replace them with your
+# own measurements before relying on a plan for production.
+
+import argparse
+import json
+import math
+
+# Instance type, sustained ingress MB/s per broker, recommended maximum of
+# partition replicas per broker, maximum provisioned storage throughput MiB/s
+# (0 where provisioned throughput is not available), cheapest first
+BROKER_TYPES = (
+    ("kafka.m5.large", 30, 1000, 0),
+    ("kafka.m5.xlarge", 60, 1000, 0),
+    ("kafka.m5.2xlarge", 120, 2000, 0),
+    ("kafka.m5.4xlarge", 200, 4000, 593),
+    ("kafka.m5.8xlarge", 400, 4000, 850),
+    ("kafka.m5.12xlarge", 600, 4000, 1000),
+    ("kafka.m5.16xlarge", 800, 4000, 1000),
+    ("kafka.m5.24xlarge", 1000, 4000, 1000),
+)
+# MSK broker quota per cluster
+MAX_BROKERS = 30
+# EBS volumes: size range in GiB, and the throughput a volume gets without
+# provisioned throughput, in MiB/s (provisioned throughput starts there)
+MIN_VOLUME_GIB = 10
+MAX_VOLUME_GIB = 16384
+BASELINE_VOLUME_THROUGHPUT = 250
+# Lambda MSK event source batches: at most 10000 records in a 6 MB payload
+MAX_EVENT_BATCH_SIZE = 10000
+MAX_EVENT_PAYLOAD_BYTES = 6 * 1000 * 1000
+# Per record JSON of an MSK event around the base64 value
+EVENT_RECORD_OVERHEAD_BYTES = 200
+# Other topics written by the job (late records and stats, anomalies,
+# averages), created with the broker's default partition count
+AUXILIARY_PARTITIONS = 12
+
+DEFAULTS = {
+    "record_bytes": 100,
+    "retention_hours": 24,
+    "peak_factor": 2.0,
+    "az_count": 2,
+    # Brokers per availability zone before a larger instance type is chosen
+    "max_brokers_per_az": 3,
+    # Keep broker throughput and disk use under these shares of capacity
+    "throughput_headroom": 0.7,
+    "disk_headroom": 0.7,
+    # Sustained throughput of one partition for one consumer
+    "partition_mb_per_sec": 5.0,
+    # Records/sec a Flink subtask processes with the job's Python UDFs
+    "records_per_subtask": 5000,
+    "parallelism_per_kpu": 1,
+    # Alerts per input record, and alerts/sec one SNS consumer invocation
+    # (one per partition) publishes
+    "alert_ratio": 0.01,
+    "alert_bytes": 160,
+    "alerts_per_partition": 500,
+}
+
+
+def round_up(value, multiple):
+    return int(math.ceil(value / float(multiple))) * multiple
+
+
+def plan(ingest_mb_per_sec, **overrides):
+    # Returns a dict of the derived sizes, raises ValueError when the inputs
+    # are invalid or no broker type fits within MAX_BROKERS
+    unknown = set(overrides) - set(DEFAULTS)
+    if unknown:
+        raise ValueError("Unknown capacity planning inputs: {}".format(", ".join(sorted(unknown))))
+    inputs = dict(DEFAULTS, **overrides)
+    inputs["ingest_mb_per_sec"] = ingest_mb_per_sec
+    for name, value in inputs.items():
+        if value <= 0:
+            raise ValueError("{} must be positive, got {!r}".format(name, value))
+    if inputs["peak_factor"] < 1:
+        raise ValueError("peak_factor must be at least 1")
+    az_count = int(inputs["az_count"])
+    peak_mb_per_sec = ingest_mb_per_sec * inputs["peak_factor"]
+    replication_factor = min(3, az_count) if az_count > 1 else 1
+
+    # Flink: source subtasks read whole partitions, so the input topic gets
+    # at least one partition per subtask
+    records_per_sec = peak_mb_per_sec * 1000 * 1000 / inputs["record_bytes"]
+    parallelism = max(1, int(math.ceil(records_per_sec / inputs["records_per_subtask"])))
+    kpus = int(math.ceil(parallelism / float(inputs["parallelism_per_kpu"])))
+
+    # Retained data per replica, in GiB
+    retained_gib = ingest_mb_per_sec * 3600 * inputs["retention_hours"] * 1000 * 1000 / 2.0 ** 30
+
+    for instance_type, broker_mb_per_sec, max_partitions, max_volume_throughput in BROKER_TYPES:
+        # Brokers for the peak throughput, the retained data and the
+        # replication factor, spread evenly over the availability zones
+        brokers = max(
+            math.ceil(peak_mb_per_sec / (broker_mb_per_sec * inputs["throughput_headroom"])),
+            math.ceil(retained_gib * replication_factor / (MAX_VOLUME_GIB * inputs["disk_headroom"])),
+            replication_factor,
+        )
+        brokers = round_up(brokers, az_count)
+        if brokers > min(MAX_BROKERS, az_count * inputs["max_brokers_per_az"]):
+            continue
+
+        # Partition counts are multiples of the broker count, so leaders
+        # are spread evenly
+        input_partitions = round_up(max(parallelism, math.ceil(peak_mb_per_sec / inputs["partition_mb_per_sec"])),
+                                    brokers)
+        alerts_per_sec = records_per_sec * inputs["alert_ratio"]
+        alert_partitions = round_up(max(1, math.ceil(alerts_per_sec / inputs["alerts_per_partition"])), brokers)
+        replicas = (input_partitions + alert_partitions + AUXILIARY_PARTITIONS) * replication_factor
+        if replicas > brokers * max_partitions:
+            continue
+
+        # Every broker writes its share of all replicas
+        volume_gib = int(math.ceil(retained_gib * replication_factor / brokers / inputs["disk_headroom"]))
+        volume_gib = min(MAX_VOLUME_GIB, max(MIN_VOLUME_GIB, volume_gib))
+        write_mib_per_sec = peak_mb_per_sec * replication_factor / brokers * 1000 * 1000 / 2.0 ** 20
+        volume_throughput = None
+        if write_mib_per_sec > BASELINE_VOLUME_THROUGHPUT * inputs["throughput_headroom"]:
+            volume_throughput = max(BASELINE_VOLUME_THROUGHPUT,
+                                    round_up(write_mib_per_sec / inputs["throughput_headroom"], 10))
+            if volume_throughput > max_volume_throughput:
+                continue
+        break
+    else:
+        raise ValueError("No broker type sustains {} MB/s with at most {} brokers per availability zone".format(
+            peak_mb_per_sec, inputs["max_brokers_per_az"]))
+
+    # As many alerts per consumer invocation as fit in the event payload
+    event_record_bytes = 4 * math.ceil(inputs["alert_bytes"] / 3.0) + EVENT_RECORD_OVERHEAD_BYTES
+    event_batch_size = min(MAX_EVENT_BATCH_SIZE, MAX_EVENT_PAYLOAD_BYTES // event_record_bytes)
+
+    return {
+        "inputs": inputs,
+        "peak_mb_per_sec": peak_mb_per_sec,
+        "peak_records_per_sec": int(records_per_sec),
+        "broker_instance_type": instance_type,
+        "broker_count": brokers,
+        "replication_factor": replication_factor,
+        "broker_volume_gib": volume_gib,
+        # None: the volume's baseline throughput is enough
+        "broker_volume_throughput": volume_throughput,
+        "input_partitions": input_partitions,
+        "alert_partitions": alert_partitions,
+        "flink_parallelism": parallelism,
+        "flink_parallelism_per_kpu": inputs["parallelism_per_kpu"],
+        "flink_kpus": kpus,
+        "event_batch_size": event_batch_size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MSK, Flink and Lambda sizes for a target ingest throughput")
+    parser.add_argument("--ingest-mbps", type=float, required=True, help="average ingest MB/s")
+    for name, value in DEFAULTS.items():
+        parser.add_argument("--" + name.replace("_", "-"), type=type(value), default=value)
+    args = vars(parser.parse_args())
+    ingest = args.pop("ingest_mbps")
+    print(json.dumps(plan(ingest, **args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Local end-to-end run of the pipeline without MSK, Managed Flink or SNS:
+#
+#   1. kfpLambdaStreamProducer writes a synthetic load to files (localOutputPath)
+#      instead of kfp_sensor_topic
+#   2. PythonKafkaSink/main.py runs on a local PyFlink mini-cluster with the
+#      filesystem connector for both topics and file:// for the S3 sink
+#   3. kfpLambdaConsumerSNS is invoked with MSK events built from the alert
+#      files, publishing to an in-memory SNS stand-in
+#
+#   pip install apache-flink==1.13.6 -r LambdaFunctions/requirements.txt boto3
+#   python local/harness.py --records 20000 --sensors 5 --seed 7
+#
+# Only the line-delimited wire formats (json, csv) can go through files.
+
+import argparse
+import base64
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+LAMBDA_DIR = os.path.join(ROOT, "LambdaFunctions")
+FLINK_DIR = os.path.join(ROOT, "PythonKafkaSink")
+
+INPUT_TOPIC = "kfp_sensor_topic"
+OUTPUT_TOPIC = "kfp_sns_topic"
+CONTROL_TOPIC = "kfp_control_topic"
+SNS_TOPIC_ARN = "arn:aws:sns:us-east-1:000000000000:kfp-local-alerts"
+LOCAL_WIRE_FORMATS = ("json", "csv")
+
+# Fixed simulated clock, so a seeded run produces the same windows every time
+START_TIME = 1672531200
+
+
+class RecordingSNS():
+    # Stand-in for the boto3 SNS client: accepts every entry and keeps the
+    # messages, with the wall-clock time each entry Id was published
+    def __init__(self):
+        self.messages = []
+        self.published_at = {}
+        self.calls = 0
+
+    def publish_batch(self, TopicArn, PublishBatchRequestEntries):
+        self.calls += 1
+        now = time.time()
+        self.messages.extend(PublishBatchRequestEntries)
+        for entry in PublishBatchRequestEntries:
+            self.published_at[entry["Id"]] = now
+        return {"Successful": [{"Id": entry["Id"]} for entry in PublishBatchRequestEntries], "Failed": []}
+
+
+def application_properties(workdir, wire_format, pipeline=None, runtime=None):
+    # Same property groups as FlinkStack, with the topics and bucket replaced by local paths
+    return [
+        {"PropertyGroupId": "producer.config.0",
+         "PropertyMap": {"input.connector": "filesystem",
+                         "input.path": "file://" + os.path.join(workdir, "topics", INPUT_TOPIC),
+                         "control.path": "file://" + os.path.join(workdir, "topics", CONTROL_TOPIC),
+                         "auth.mode": "none",
+                         "wire.format": wire_format}},
+        {"PropertyGroupId": "consumer.config.0",
+         "PropertyMap": {"output.connector": "filesystem",
+                         "output.path": "file://" + os.path.join(workdir, "topics", OUTPUT_TOPIC),
+                         "output.s3.path": "file://" + os.path.join(workdir, "s3"),
+                         "late.records.path": "file://" + os.path.join(workdir, "topics", "late_records"),
+                         "late.stats.path": "file://" + os.path.join(workdir, "topics", "late_stats"),
+                         "anomaly.path": "file://" + os.path.join(workdir, "topics", "anomalies")}},
+        {"PropertyGroupId": "pipeline.config.0", "PropertyMap": dict(pipeline or {})},
+        {"PropertyGroupId": "runtime.config.0", "PropertyMap": dict(runtime or {"parallelism.default": "1"})},
+    ]
+
+
+def lambda_module(name, environment):
+    # The handlers read their environment at import time
+    os.environ.update(environment)
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_REGION", os.environ["AWS_DEFAULT_REGION"])
+    if LAMBDA_DIR not in sys.path:
+        sys.path.insert(0, LAMBDA_DIR)
+    if name in sys.modules:
+        return importlib.reload(sys.modules[name])
+    return importlib.import_module(name)
+
+
+def run_producer(workdir, wire_format, event):
+    producer = lambda_module("kfpLambdaStreamProducer", {
+        "topicName": INPUT_TOPIC,
+        "mskClusterArn": "local",
+        "localOutputPath": os.path.join(workdir, "topics"),
+        "wireFormat": wire_format,
+    })
+    try:
+        return producer.lambda_handler(event, None)
+    finally:
+        # The file producer is cached like the Kafka one; close it so the files are complete
+        cached = producer._producer_cache["producer"]
+        if cached is not None:
+            cached.close()
+            producer._producer_cache.update(producer=None, healthy=False)
+
+
+def run_flink(properties_file):
+    environment = dict(os.environ, FLINK_APPLICATION_PROPERTIES=properties_file)
+    subprocess.run([sys.executable, "main.py"], cwd=FLINK_DIR, env=environment, check=True)
+
+
+def read_lines(directory):
+    # The streaming filesystem sink only commits part files on checkpoints, so
+    # after a bounded run the rows are in hidden in-progress files as well
+    lines = []
+    for path, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.endswith(".crc") or name == "_SUCCESS":
+                continue
+            with open(os.path.join(path, name), "rb") as file:
+                lines.extend(line for line in file.read().splitlines() if line)
+    return lines
+
+
+def msk_events(values, batch_size):
+    # Same shape as the MSK event source: base64 values grouped by topic-partition
+    for start in range(0, len(values), batch_size):
+        yield {
+            "eventSource": "aws:kafka",
+            "records": {
+                OUTPUT_TOPIC + "-0": [
+                    {"topic": OUTPUT_TOPIC, "partition": 0, "offset": offset,
+                     "timestamp": int(time.time() * 1000), "timestampType": "CREATE_TIME",
+                     "value": base64.b64encode(value).decode()}
+                    for offset, value in enumerate(values[start:start + batch_size], start)
+                ]
+            },
+        }
+
+
+def run_consumer(wire_format, values, batch_size, cooldown_seconds=0):
+    consumer = lambda_module("kfpLambdaConsumerSNS", {
+        "SNSTopicArn": SNS_TOPIC_ARN,
+        "wireFormat": wire_format,
+        "alertCooldownSeconds": str(cooldown_seconds),
+    })
+    sns = RecordingSNS()
+    consumer.sns = sns
+    totals = {"invocations": 0, "records": 0, "published": 0, "suppressed": 0, "duplicates": 0, "failed": 0}
+    for event in msk_events(values, batch_size):
+        response = consumer.lambda_handler(event, None)
+        totals["invocations"] += 1
+        for result in response["partitions"].values():
+            totals["records"] += result["records"]
+            totals["published"] += result["published"]
+            totals["suppressed"] += result["suppressed"]
+            totals["duplicates"] += result["duplicates"]
+        totals["failed"] += len(response["batchItemFailures"])
+    totals["sns_calls"] = sns.calls
+    return totals, sns
+
+
+def control_record(threshold=None, min_count=None, update_time=START_TIME):
+    # Alert control record (pipeline.config.0 alert.control.enabled), the
+    # filesystem stand-in of a record on the control topic
+    return {"control_key": "alert", "threshold": threshold, "min_count": min_count,
+            "update_time": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(update_time))}
+
+
+def prepare_workdir(workdir, wire_format, pipeline=None, runtime=None, control=None):
+    # Returns the properties file for main.py; control: alert control records
+    if wire_format not in LOCAL_WIRE_FORMATS:
+        raise ValueError("Local runs support {}, got {!r}".format(LOCAL_WIRE_FORMATS, wire_format))
+    # Only the directories the harness writes are reset
+    for name in ("topics", "s3"):
+        shutil.rmtree(os.path.join(workdir, name), ignore_errors=True)
+    os.makedirs(workdir, exist_ok=True)
+    if control:
+        os.makedirs(os.path.join(workdir, "topics", CONTROL_TOPIC))
+        with open(os.path.join(workdir, "topics", CONTROL_TOPIC, "control.json"), "w") as file:
+            file.writelines(json.dumps(record) + "\n" for record in control)
+        pipeline = dict(pipeline or {}, **{"alert.control.enabled": "true"})
+
+    properties_file = os.path.join(workdir, "application_properties.json")
+    with open(properties_file, "w") as file:
+        json.dump(application_properties(workdir, wire_format, pipeline, runtime), file, indent=2)
+    return properties_file
+
+
+def run(workdir, wire_format="json", event=None, pipeline=None, runtime=None,
+        consumer_batch_size=100, cooldown_seconds=0, control=None):
+    properties_file = prepare_workdir(workdir, wire_format, pipeline, runtime, control)
+    summary = {"workdir": workdir, "wire_format": wire_format, "seconds": {}}
+    started = time.time()
+    summary["producer"] = run_producer(workdir, wire_format, event or {})
+    summary["seconds"]["producer"] = round(time.time() - started, 3)
+
+    started = time.time()
+    run_flink(properties_file)
+    summary["seconds"]["flink"] = round(time.time() - started, 3)
+
+    alerts = read_lines(os.path.join(workdir, "topics", OUTPUT_TOPIC))
+    summary["alerts"] = len(alerts)
+    summary["averages"] = len(read_lines(os.path.join(workdir, "s3")))
+
+    started = time.time()
+    summary["consumer"], sns = run_consumer(wire_format, alerts, consumer_batch_size, cooldown_seconds)
+    summary["seconds"]["consumer"] = round(time.time() - started, 3)
+    summary["sample_messages"] = [entry["Message"] for entry in sns.messages[:3]]
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run producer, Flink job and SNS consumer locally.")
+    parser.add_argument("--workdir", help="directory for topics, outputs and properties (default: a new temp dir)")
+    parser.add_argument("--wire-format", default="json", choices=LOCAL_WIRE_FORMATS)
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--sensors", type=int, default=5)
+    parser.add_argument("--rate", type=float, default=200,
+                        help="simulated records per second of event time")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--zipf", type=float, default=0, help="Zipf exponent of the sensor ids, 0 for uniform")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--consumer-batch-size", type=int, default=100)
+    parser.add_argument("--cooldown", type=float, default=0, help="alertCooldownSeconds of the consumer")
+    parser.add_argument("--pipeline", action="append", default=[], metavar="KEY=VALUE",
+                        help="pipeline.config.0 property, e.g. skew.mode=salt")
+    parser.add_argument("--runtime", action="append", default=[], metavar="KEY=VALUE",
+                        help="runtime.config.0 property, e.g. parallelism.default=4")
+    parser.add_argument("--control-threshold", type=float,
+                        help="alert threshold of a control record, enables the alert control")
+    parser.add_argument("--control-min-count", type=int,
+                        help="alert minimum count of a control record, enables the alert control")
+    args = parser.parse_args(argv)
+
+    event = {"records": args.records, "sensors": args.sensors, "rate": args.rate, "zipfExponent": args.zipf,
+             "seed": args.seed, "startTime": START_TIME, "processes": args.processes}
+    control = None
+    if args.control_threshold is not None or args.control_min_count is not None:
+        control = [control_record(args.control_threshold, args.control_min_count)]
+    workdir = args.workdir or tempfile.mkdtemp(prefix="kfp-local-")
+    summary = run(os.path.abspath(workdir), args.wire_format, event,
+                  pipeline=dict(item.split("=", 1) for item in args.pipeline),
+                  runtime=dict(item.split("=", 1) for item in args.runtime) or None,
+                  consumer_batch_size=args.consumer_batch_size, cooldown_seconds=args.cooldown,
+                  control=control)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
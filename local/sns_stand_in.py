@@ -0,0 +1,131 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Local HTTP stand-in for the SNS PublishBatch API, so kfpLambdaConsumerSNS
+# can run against a real boto3 client (SNSEndpointUrl) with a controlled
+# service latency and throttling:
+#
+#   python local/sns_stand_in.py --port 4575 --latency-ms 20 --throttle-every 50
+#
+# Every call sleeps latency-ms before answering, every throttle-every-th call
+# is rejected with Throttling. Published entries are kept in arrival order.
+
+import argparse
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from xml.sax.saxutils import escape
+
+XMLNS = "http://sns.amazonaws.com/doc/2010-03-31/"
+
+
+class SNSStandIn():
+    def __init__(self, port=0, latency_ms=0, throttle_every=0):
+        self.latency_ms = latency_ms
+        self.throttle_every = throttle_every
+        self.calls = 0
+        self.throttled = 0
+        # (TopicArn, Id, Subject, Message) in the order they arrived
+        self.messages = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint_url(self):
+        return "http://127.0.0.1:{}".format(self._server.server_address[1])
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def publish_batch(self, params):
+        # Returns (HTTP status, XML body)
+        with self._lock:
+            self.calls += 1
+            throttle = self.throttle_every and self.calls % self.throttle_every == 0
+            if throttle:
+                self.throttled += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        if throttle:
+            return 400, _error("Throttling", "Rate exceeded")
+        topic_arn = params.get("TopicArn", [""])[0]
+        entries = []
+        index = 1
+        while "PublishBatchRequestEntries.member.{}.Id".format(index) in params:
+            prefix = "PublishBatchRequestEntries.member.{}.".format(index)
+            entries.append(tuple(params.get(prefix + name, [None])[0] for name in ("Id", "Subject", "Message")))
+            index += 1
+        if not entries or len(entries) > 10:
+            return 400, _error("TooManyEntriesInBatchRequest" if entries else "EmptyBatchRequest",
+                               "A batch holds 1 to 10 entries")
+        with self._lock:
+            self.messages.extend((topic_arn,) + entry for entry in entries)
+        successful = "".join(
+            "<member><Id>{}</Id><MessageId>{}</MessageId></member>".format(escape(entry[0]), uuid.uuid4())
+            for entry in entries)
+        return 200, ('<PublishBatchResponse xmlns="{0}"><PublishBatchResult>'
+                     "<Successful>{1}</Successful><Failed/></PublishBatchResult>"
+                     "<ResponseMetadata><RequestId>{2}</RequestId></ResponseMetadata>"
+                     "</PublishBatchResponse>").format(XMLNS, successful, uuid.uuid4())
+
+
+def _error(code, message):
+    return ('<ErrorResponse xmlns="{0}"><Error><Type>Sender</Type><Code>{1}</Code>'
+            "<Message>{2}</Message></Error><RequestId>{3}</RequestId></ErrorResponse>").format(
+        XMLNS, code, message, uuid.uuid4())
+
+
+def _handler(stand_in):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            params = parse_qs(self.rfile.read(length).decode(), keep_blank_values=True)
+            action = params.get("Action", [""])[0]
+            if action == "PublishBatch":
+                status, body = stand_in.publish_batch(params)
+            else:
+                status, body = 400, _error("InvalidAction", "Unsupported action " + action)
+            data = body.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "text/xml")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SNS PublishBatch stand-in")
+    parser.add_argument("--port", type=int, default=4575)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--throttle-every", type=int, default=0, help="reject every n-th call, 0 never")
+    args = parser.parse_args()
+    stand_in = SNSStandIn(args.port, args.latency_ms, args.throttle_every).start()
+    print("SNS stand-in on {}".format(stand_in.endpoint_url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stand_in.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -22,19 +22,44 @@ from aws_cdk import (
     aws_events as events,
     Duration,
     aws_s3_assets as assets,
-    aws_s3_deployment as s3deployment,
     aws_logs as logs,
     aws_sns as sns,
     aws_lambda_event_sources,
     BundlingOptions,
     custom_resources as cr,
     CfnOutput,
-    CfnParameter
+    CfnParameter,
+    CustomResource
 )
 from constructs import Construct
 import aws_cdk.aws_kinesisanalytics_flink_alpha as flink # L2 Construct for Managed Apache Flink 
 import aws_cdk.aws_msk_alpha as msk_alpha # L2 Construct for Managed Apache Kafka
-import time
+import hashlib
+import json
+import math
+import re
+
+import broker_config
+import capacity_planning
+
+# Record encodings the producer, the Flink job and the SNS consumer all support
+WIRE_FORMATS = ("json", "csv", "avro")
+# Producer record keys, see LambdaFunctions/partitioners.py
+PARTITIONERS = ("murmur2", "modulo", "none")
+# EventBridge accepts at most 5 targets per rule
+TARGETS_PER_RULE = 5
+# Kafka transaction timeout of the exactly-once Flink sink, at most the
+# brokers' transaction.max.timeout.ms
+TRANSACTION_TIMEOUT_MS = 900000
+# Build output that must not change the Lambda assets' hashes
+ASSET_EXCLUDES = ["__pycache__", "*.pyc"]
+
+
+def content_hash(*parts):
+    # Stable across syntheses, changes only with its inputs, so resources
+    # named after it are replaced when (and only when) the inputs change
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:16]
+
 
 class FlinkStack(NestedStack):
     def __init__(self, 
@@ -44,6 +69,13 @@ class FlinkStack(NestedStack):
                 security_group,
                 bootstrap_brokers,
                 cluster,
+                wire_format,
+                parallelism,
+                parallelism_per_kpu,
+                auto_scaling_enabled,
+                delivery_guarantee,
+                checkpoint_interval_seconds,
+                checkpoint_min_pause_seconds,
                 **kwargs):
         super().__init__(scope, construct_id, **kwargs)
         
@@ -57,21 +89,8 @@ class FlinkStack(NestedStack):
             auto_delete_objects= True
         )
         
-        # Bucket where code for Apache Flink is stored 
-        flink_code_bucket = s3.Bucket(
-            self,
-            "flink-code-bucket",
-            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
-            # Removal policy unsuitable for production
-            removal_policy = RemovalPolicy.DESTROY,
-            auto_delete_objects= True
-        )
-
-        flink_app_code_zip = s3deployment.BucketDeployment(self, "flink_app_code_zip",
-            sources=[s3deployment.Source.asset("./PythonKafkaSink.zip")],
-            destination_bucket=flink_code_bucket,
-            extract=False
-        )
+        # The application code is uploaded once, as the content-hashed asset
+        # of ApplicationCode.from_asset below
         
         flink_app_role = iam.Role(self, "FlinkAppRole",
             assumed_by=iam.ServicePrincipal("kinesisanalytics.amazonaws.com"),
@@ -88,7 +107,11 @@ class FlinkStack(NestedStack):
                 "kafka-cluster:*Topic*",
                 "kafka-cluster:WriteData",
                 "kafka-cluster:ReadData",
-                "kafka-cluster:DescribeGroup"
+                "kafka-cluster:DescribeGroup",
+                # Idempotent and transactional Kafka sinks
+                "kafka-cluster:WriteDataIdempotently",
+                "kafka-cluster:DescribeTransactionalId",
+                "kafka-cluster:AlterTransactionalId"
             ],
             resources=[
                "*" 
@@ -100,6 +123,16 @@ class FlinkStack(NestedStack):
         flink_app = flink.Application(self, "Flink-App",
             code=flink.ApplicationCode.from_asset("./PythonKafkaSink.zip"),
             runtime=flink.Runtime.FLINK_1_13,
+            parallelism=parallelism,
+            parallelism_per_kpu=parallelism_per_kpu,
+            auto_scaling_enabled=auto_scaling_enabled,
+            # Exactly-once sinks commit their Kafka transactions on every
+            # checkpoint, so the interval bounds how long alerts stay invisible
+            # to read_committed consumers. The checkpoint timeout is not
+            # configurable in Managed Flink.
+            checkpointing_enabled=True,
+            checkpoint_interval=Duration.seconds(checkpoint_interval_seconds),
+            min_pause_between_checkpoints=Duration.seconds(checkpoint_min_pause_seconds),
             vpc=vpc,
             security_groups=[security_group],
             role=flink_app_role,
@@ -112,11 +145,83 @@ class FlinkStack(NestedStack):
                     ,
                "producer.config.0" : {
                     "input.topic.name" : "kfp_sensor_topic",
-                    "bootstrap.servers": bootstrap_brokers
+                    "bootstrap.servers": bootstrap_brokers,
+                    "wire.format": wire_format,
+                    # Kafka source tuning, see PythonKafkaSink/pipeline.py
+                    "source.option.properties.fetch.min.bytes": "65536",
+                    "source.option.properties.fetch.max.wait.ms": "200",
+                    "source.option.properties.max.poll.records": "2000",
+                    "source.option.scan.topic-partition-discovery.interval": "60 s"
                 },
                 "consumer.config.0": {
                     "output.topic.name": "kfp_sns_topic",
-                    "output.s3.bucket": output_bucket.bucket_name
+                    "output.s3.bucket": output_bucket.bucket_name,
+                    # Columnar averages, compacted per hourly partition
+                    "output.s3.format": "parquet",
+                    "output.s3.compression": "SNAPPY",
+                    "output.s3.partition.granularity": "hour",
+                    # Kafka sink delivery, see DELIVERY_GUARANTEES in pipeline.py
+                    "output.delivery.guarantee": delivery_guarantee,
+                    "output.transaction.timeout.ms": str(TRANSACTION_TIMEOUT_MS),
+                    # Kafka sink batching
+                    "kafka.sink.option.properties.linger.ms": "20",
+                    "kafka.sink.option.properties.batch.size": str(256 * 1024),
+                    "kafka.sink.option.properties.compression.type": "lz4"
+                },
+                "pipeline.config.0": {
+                    "watermark.delay.seconds": "5",
+                    "alert.window.seconds": "30",
+                    "alert.temperature.threshold": "30",
+                    "alert.min.count": "3",
+                    # Threshold and minimum count from kfp_control_topic
+                    # without a restart, see PythonKafkaSink/pipeline.py
+                    "alert.control.enabled": "false",
+                    "average.window.seconds": "60",
+                    "shared.preaggregation.enabled": "true",
+                    "output.metrics.enabled": "false",
+                    # metrics: per-sensor lateness stats to kfp_late_stats_topic,
+                    # route: also the late records to kfp_late_records_topic,
+                    # see late_data.py
+                    "late.data.mode": "off",
+                    "late.stats.window.seconds": "60",
+                    # Vectorized Python UDFs, see PythonKafkaSink/anomaly_udfs.py;
+                    # the threshold UDF runs on every reading
+                    "sensor.thresholds.enabled": "false",
+                    "sensor.thresholds.file": "sensor_thresholds.csv",
+                    "anomaly.zscore.enabled": "false",
+                    "anomaly.zscore.windows": "10",
+                    "anomaly.zscore.threshold": "3",
+                    # Hot sensors, see PythonKafkaSink/pipeline.py:
+                    # skew.metrics.enabled adds per-sensor rates and hot key
+                    # candidates; skew.mode=salt with skew.hot.keys spreads
+                    # the listed sensors over subtasks
+                    "skew.mode": "off",
+                    "skew.hot.keys": "",
+                    "skew.metrics.enabled": "false",
+                    "skew.detect.records.per.second": "1000"
+                },
+                # Sensor metadata joined into the alerts, see
+                # PythonKafkaSink/sensor_metadata.py: lookup=jdbc with
+                # jdbc.url / jdbc.table-name reads an RDS table, lookup=sqlite
+                # the sample database of sensor_metadata.sql
+                "metadata.config.0": {
+                    "lookup": "off",
+                    "sqlite.init-script": "sensor_metadata.sql",
+                    "cache.max-rows": "10000",
+                    "cache.ttl.seconds": "600"
+                },
+                # Validated by PythonKafkaSink/runtime_tuning.py. The
+                # parallelism comes from flink.Application above only:
+                # parallelism.default here would pin the operators and
+                # defeat autoscaling
+                "runtime.config.0": {
+                    "table.exec.mini-batch.enabled": "true",
+                    "table.exec.mini-batch.allow-latency": "1 s",
+                    "table.exec.mini-batch.size": "5000",
+                    "table.optimizer.agg-phase-strategy": "TWO_PHASE",
+                    "python.fn-execution.arrow.batch.size": "10000",
+                    "python.fn-execution.bundle.size": "100000",
+                    "python.fn-execution.bundle.time": "1000"
                 }
             }
             
@@ -135,6 +240,19 @@ class LambdaStack(NestedStack):
             vpc,
             security_group,
             cluster,
+            wire_format,
+            producer_shards,
+            producer_rate,
+            producer_records,
+            producer_sensors,
+            partitioner,
+            topics,
+            event_batch_size,
+            batching_window_seconds,
+            consumer_group_id,
+            consumer_memory_mb,
+            consumer_reserved_concurrency,
+            consumer_timeout_seconds,
             **kwargs):
         super().__init__(scope, construct_id, **kwargs)
     
@@ -168,23 +286,34 @@ class LambdaStack(NestedStack):
             )
         )
             
-        # Producer Function
-        lambdaFn = lambda_.Function(
-            self, "kfpLambdaStreamProducer",
-            code=lambda_.Code.from_asset(
-                "./LambdaFunctions",
-                bundling=BundlingOptions(
+        # Lambda functions with their Kafka client dependencies
+        kafka_client_code = lambda_.Code.from_asset(
+            "./LambdaFunctions",
+            bundling=BundlingOptions(
                 image=lambda_.Runtime.PYTHON_3_8.bundling_image,
                 command=[
                     "bash", "-c",
                     "pip install -r requirements.txt -t /asset-output && cp -au . /asset-output"
                 ],
-            ),),
+            ),
+            exclude=ASSET_EXCLUDES,)
+
+        # Producer Function
+        lambdaFn = lambda_.Function(
+            self, "kfpLambdaStreamProducer",
+            code=kafka_client_code,
             handler="kfpLambdaStreamProducer.lambda_handler",
             timeout=Duration.seconds(150),
             runtime=lambda_.Runtime.PYTHON_3_8,
             environment={'topicName':'kfp_sensor_topic',
-                         'mskClusterArn':cluster.attr_arn},
+                         'mskClusterArn':cluster.attr_arn,
+                         # Batched send path, see kfpLambdaStreamProducer
+                         'recordCount':'99',
+                         'lingerMs':'20',
+                         'batchSize':str(256 * 1024),
+                         'compressionType':'lz4',
+                         'partitioner':partitioner,
+                         'wireFormat':wire_format},
             vpc=vpc,
             vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType('PRIVATE_WITH_EGRESS')),
             role=lambda_role,
@@ -199,30 +328,92 @@ class LambdaStack(NestedStack):
         # SNS Function
         sns_lambdaFn = lambda_.Function(
             self, "sns_alarm_function",
-            code=lambda_.Code.from_asset("./LambdaFunctions"),
+            code=lambda_.Code.from_asset("./LambdaFunctions", exclude=ASSET_EXCLUDES),
             handler="kfpLambdaConsumerSNS.lambda_handler",
-            timeout=Duration.seconds(300),
+            timeout=Duration.seconds(consumer_timeout_seconds),
+            memory_size=consumer_memory_mb,
+            # None leaves the function on the account's unreserved concurrency
+            reserved_concurrent_executions=consumer_reserved_concurrency,
             runtime=lambda_.Runtime.PYTHON_3_8,
-            environment={'SNSTopicArn':alarm_sns_topic.topic_arn},
+            environment={'SNSTopicArn':alarm_sns_topic.topic_arn,
+                         'wireFormat':wire_format,
+                         # At most one notification per sensor every 5 minutes,
+                         # repeats are summarised in the next one
+                         'alertCooldownSeconds':'300',
+                         # Batches of all partitions in flight together, see
+                         # publish_event_async
+                         'publishMode':'async',
+                         # Kept from the invocation's remaining time for the
+                         # batches in flight, see time_budget_deadline
+                         'timeBudgetReserveMs':'5000'},
             vpc=vpc,
             vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType('PRIVATE_WITH_EGRESS')),
             role=lambda_role,
             security_groups=[security_group],# WARNING: tighten up security group 
         )
         
+        # The event source mapping has no isolation.level setting; alerts that
+        # are delivered twice (replays, aborted transactions) are dropped by
+        # the consumer's RecentAlerts
         sns_lambdaFn.add_event_source(aws_lambda_event_sources.ManagedKafkaEventSource(
             cluster_arn=cluster.attr_arn, #cluster_arn
             topic='kfp_sns_topic',
-            starting_position=lambda_.StartingPosition.TRIM_HORIZON
+            starting_position=lambda_.StartingPosition.TRIM_HORIZON,
+            # None leaves the event source defaults: 100 records, no batching
+            # window, a consumer group id generated by Lambda
+            batch_size=event_batch_size,
+            max_batching_window=Duration.seconds(batching_window_seconds) if batching_window_seconds else None,
+            consumer_group_id=consumer_group_id
         ))
 
-        # Run Producer Lambda function every 300 seconds
+        # Topics with explicit partition counts or configs, created before any
+        # client can auto-create them, see
+        # LambdaFunctions/kfpTopicProvisioner.py
+        self.topics = None
+        if topics:
+            topic_provisioner_fn = lambda_.Function(
+                self, "kfpTopicProvisioner",
+                code=kafka_client_code,
+                handler="kfpTopicProvisioner.lambda_handler",
+                timeout=Duration.seconds(120),
+                runtime=lambda_.Runtime.PYTHON_3_8,
+                environment={'wireFormat':wire_format},
+                vpc=vpc,
+                vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType('PRIVATE_WITH_EGRESS')),
+                role=lambda_role,
+                security_groups=[security_group], # WARNING: tighten up security group
+            )
+            topic_provider = cr.Provider(self, "TopicProvider",
+                on_event_handler=topic_provisioner_fn
+            )
+            self.topics = CustomResource(self, "Topics",
+                service_token=topic_provider.service_token,
+                properties={
+                    "ClusterArn": cluster.attr_arn,
+                    "Topics": topics
+                }
+            )
+            lambdaFn.node.add_dependency(self.topics)
+            sns_lambdaFn.node.add_dependency(self.topics)
+
+        # Run producer_shards concurrent Producer invocations every 300 seconds,
+        # each generating its share of the records and the rate for its own
+        # range of sensor ids (sensor_generator.shard_config)
         # See https://docs.aws.amazon.com/lambda/latest/dg/tutorial-scheduled-events-schedule-expressions.html
-        rule = events.Rule(
-            self, "scheduledEvent",
-            schedule=events.Schedule.rate(Duration.seconds(300)),
-        )
-        rule.add_target(targets.LambdaFunction(lambdaFn))
+        for first_shard in range(0, producer_shards, TARGETS_PER_RULE):
+            index = first_shard // TARGETS_PER_RULE
+            rule = events.Rule(
+                self, "scheduledEvent" if index == 0 else "scheduledEvent{}".format(index),
+                schedule=events.Schedule.rate(Duration.seconds(300)),
+            )
+            for shard in range(first_shard, min(first_shard + TARGETS_PER_RULE, producer_shards)):
+                rule.add_target(targets.LambdaFunction(lambdaFn, event=events.RuleTargetInput.from_object({
+                    "shard": shard,
+                    "shardCount": producer_shards,
+                    "records": producer_records,
+                    "rate": producer_rate,
+                    "sensors": producer_sensors,
+                })))
     
     
     
@@ -235,6 +426,48 @@ class MSKFlinkStreamingStack(Stack):
         private_ca_arn = CfnParameter(self, "privateCaArn", type="String",
             description="The ARN of the Private Certificate Authority.")
 
+        # Single place the record encoding is chosen, see cdk.json
+        wire_format = self.node.try_get_context("wireFormat") or "json"
+        if wire_format not in WIRE_FORMATS:
+            raise ValueError(f"wireFormat must be one of {WIRE_FORMATS}, got {wire_format!r}")
+
+        # Producer load: producerShards concurrent invocations share
+        # producerRecords records at producerRate records/sec (0 unpaced) over
+        # producerSensors sensors, keyed with producerPartitioner
+        producer_shards = int(self.node.try_get_context("producerShards") or 1)
+        producer_rate = float(self.node.try_get_context("producerRate") or 0)
+        producer_records = int(self.node.try_get_context("producerRecords") or 99)
+        producer_sensors = int(self.node.try_get_context("producerSensors") or 5)
+        partitioner = self.node.try_get_context("producerPartitioner") or "murmur2"
+        if partitioner not in PARTITIONERS:
+            raise ValueError(f"producerPartitioner must be one of {PARTITIONERS}, got {partitioner!r}")
+        if producer_shards < 1 or producer_sensors < producer_shards:
+            raise ValueError("producerShards must be between 1 and producerSensors")
+        # Each invocation must finish within the producer's 150 s timeout
+        if producer_rate and producer_records / producer_rate > 120:
+            raise ValueError("producerRecords / producerRate must stay under 120 seconds per invocation")
+
+        # SNS consumer: its event source batching and the function's memory,
+        # reserved concurrency and timeout. 0 (or "") keeps the defaults; the
+        # batch size then comes from capacity planning, if enabled.
+        consumer_batch_size = int(self.node.try_get_context("consumerBatchSize") or 0)
+        consumer_batching_window = int(self.node.try_get_context("consumerBatchingWindowSeconds") or 0)
+        consumer_group_id = self.node.try_get_context("consumerGroupId") or None
+        consumer_memory_mb = int(self.node.try_get_context("consumerMemoryMb") or 128)
+        consumer_reserved_concurrency = int(self.node.try_get_context("consumerReservedConcurrency") or 0)
+        consumer_timeout_seconds = int(self.node.try_get_context("consumerTimeoutSeconds") or 300)
+        if not 0 <= consumer_batch_size <= capacity_planning.MAX_EVENT_BATCH_SIZE:
+            raise ValueError(f"consumerBatchSize must be between 1 and {capacity_planning.MAX_EVENT_BATCH_SIZE}")
+        if not 0 <= consumer_batching_window <= 300:
+            raise ValueError("consumerBatchingWindowSeconds must be between 0 and 300")
+        if consumer_group_id is not None and not re.fullmatch(r"[a-zA-Z0-9\-/*:_+=.@]{1,200}", consumer_group_id):
+            raise ValueError(f"consumerGroupId {consumer_group_id!r} is not a valid Kafka consumer group id")
+        if not 128 <= consumer_memory_mb <= 10240:
+            raise ValueError("consumerMemoryMb must be between 128 and 10240")
+        # Well above the function's time budget reserve (timeBudgetReserveMs)
+        if not 10 <= consumer_timeout_seconds <= 900:
+            raise ValueError("consumerTimeoutSeconds must be between 10 and 900")
+
         vpc = ec2.Vpc(self, 
             "MSK-VPC",
             #cidr=172.1.0.0/16,
@@ -256,12 +489,43 @@ class MSKFlinkStreamingStack(Stack):
           "allow all traffic in SG",
         )
 
-        # Load cluster configurations from file
+        # Capacity planning mode: with capacityIngestMBps set, the brokers,
+        # the topic partitions, the Flink parallelism and the SNS consumer's
+        # batch size are derived from the target throughput, see
+        # capacity_planning.py. Otherwise the fixed sizes below apply and the
+        # data topics are auto-created.
+        capacity_plan = None
+        capacity_ingest = float(self.node.try_get_context("capacityIngestMBps") or 0)
+        if capacity_ingest:
+            capacity_plan = capacity_planning.plan(
+                capacity_ingest,
+                record_bytes=int(self.node.try_get_context("capacityRecordBytes") or 100),
+                retention_hours=float(self.node.try_get_context("capacityRetentionHours") or 24),
+                peak_factor=float(self.node.try_get_context("capacityPeakFactor") or 2),
+                az_count=len(vpc.private_subnets),
+            )
+            CfnOutput(self, "CapacityPlan", value=json.dumps(
+                {key: value for key, value in capacity_plan.items() if key != "inputs"}, sort_keys=True))
+
+        # Broker configuration: cluster_config, then the brokerConfigProfile
+        # tuning profile, then brokerConfigOverrides ({key: value}), validated
+        # against the properties MSK accepts, see broker_config.py
         # Currently still need to use the L1 MSK construct to load a config file
-        config_file = open('./cluster_config', 'r')
-        server_properties = config_file.read()
+        broker_profile = self.node.try_get_context("brokerConfigProfile") or "low-latency"
+        broker_overrides = self.node.try_get_context("brokerConfigOverrides") or {}
+        if isinstance(broker_overrides, str):
+            # -c brokerConfigOverrides='{"num.io.threads": 16}'
+            broker_overrides = json.loads(broker_overrides)
+        if capacity_plan:
+            # Brokers keep the data as long as the plan sized their disks for
+            broker_overrides = dict({"log.retention.hours": int(math.ceil(capacity_plan["inputs"]["retention_hours"]))},
+                                    **broker_overrides)
+        with open('./cluster_config', 'r') as config_file:
+            server_properties = broker_config.server_properties(config_file.read(), broker_profile,
+                                                                broker_overrides, TRANSACTION_TIMEOUT_MS)
         cfn_configuration = msk.CfnConfiguration(self, "MyCfnConfig",
             name="MSKConfig",
+            description="Broker profile " + broker_profile,
             server_properties=server_properties
         )
 
@@ -273,16 +537,32 @@ class MSKFlinkStreamingStack(Stack):
             enabled=True
           )
         
+        kafka_version = '3.4.0'
+        broker_instance_type = "kafka.m5.large"
+        broker_count = len(vpc.private_subnets)
+        broker_volume_size = 50
+        provisioned_throughput = None
+        if capacity_plan:
+            broker_instance_type = capacity_plan["broker_instance_type"]
+            broker_count = capacity_plan["broker_count"]
+            broker_volume_size = capacity_plan["broker_volume_gib"]
+            if capacity_plan["broker_volume_throughput"]:
+                provisioned_throughput = msk.CfnCluster.ProvisionedThroughputProperty(
+                    enabled=True,
+                    volume_throughput=capacity_plan["broker_volume_throughput"]
+                )
+
         # MSK Cluster L1 Construct
         msk_cluster = msk.CfnCluster(self, "msk-cluster",
             cluster_name="msk-cluster",
-            number_of_broker_nodes=len(vpc.private_subnets),
-            kafka_version='3.4.0',
+            number_of_broker_nodes=broker_count,
+            kafka_version=kafka_version,
             broker_node_group_info=msk.CfnCluster.BrokerNodeGroupInfoProperty(
-                instance_type="kafka.m5.large",
+                instance_type=broker_instance_type,
                 storage_info=msk.CfnCluster.StorageInfoProperty(
                     ebs_storage_info=msk.CfnCluster.EBSStorageInfoProperty(
-                        volume_size=50
+                        volume_size=broker_volume_size,
+                        provisioned_throughput=provisioned_throughput
                     )
                 ),
                 client_subnets=[
@@ -330,16 +610,24 @@ class MSKFlinkStreamingStack(Stack):
         )
         
         # Get Kafka Cluster current version
-        # Always need most up to date version number. Use current_time to force creation of new custom resource. 
-        current_time = str(int(time.time()))
-        cluster_info=cr.AwsCustomResource(self, "DescribeKafkaCluster"+current_time,
+        # The version changes whenever the cluster definition does, so the
+        # call is keyed on a hash of it: it runs again (and the multi-VPC
+        # update below gets the new version) only when the cluster changed,
+        # and an unchanged stack synthesizes to the same template. The private
+        # CA is a deploy-time parameter that changes the cluster's TLS
+        # settings, so its value is part of the physical id as well.
+        cluster_definition = content_hash(server_properties, kafka_version, broker_instance_type,
+                                          broker_volume_size, broker_count,
+                                          capacity_plan and capacity_plan["broker_volume_throughput"])
+        cluster_info=cr.AwsCustomResource(self, "DescribeKafkaCluster",
             on_update=cr.AwsSdkCall(
                 service="Kafka",
                 action="DescribeCluster",
                 parameters={
                     "ClusterArn": msk_cluster.attr_arn,
                 },
-                physical_resource_id=cr.PhysicalResourceId.of("DescribeKafkaCluster"+current_time)
+                physical_resource_id=cr.PhysicalResourceId.of(
+                    Fn.join("-", ["DescribeKafkaCluster", cluster_definition, private_ca_arn.value_as_string]))
                 ),
             role=cr_iam_role
         )
@@ -410,7 +698,33 @@ class MSKFlinkStreamingStack(Stack):
         lambdaStack = LambdaStack(self, "LambdaStack",
             vpc=vpc,
             security_group=all_sg,
-            cluster=msk_cluster
+            cluster=msk_cluster,
+            wire_format=wire_format,
+            producer_shards=producer_shards,
+            producer_rate=producer_rate,
+            producer_records=producer_records,
+            producer_sensors=producer_sensors,
+            partitioner=partitioner,
+            topics=(capacity_plan and [
+                {"Name": "kfp_sensor_topic", "Partitions": capacity_plan["input_partitions"],
+                 "ReplicationFactor": capacity_plan["replication_factor"]},
+                {"Name": "kfp_sns_topic", "Partitions": capacity_plan["alert_partitions"],
+                 "ReplicationFactor": capacity_plan["replication_factor"]},
+            ] or []) + [
+                # Alert control records, one key, kept by compaction. Created
+                # in both modes, an auto-created topic would be deleted by
+                # retention
+                {"Name": "kfp_control_topic", "Partitions": 1,
+                 "ReplicationFactor": capacity_plan["replication_factor"] if capacity_plan
+                    else min(3, broker_count),
+                 "Configs": {"cleanup.policy": "compact"}},
+            ],
+            event_batch_size=consumer_batch_size or (capacity_plan and capacity_plan["event_batch_size"]) or None,
+            batching_window_seconds=consumer_batching_window,
+            consumer_group_id=consumer_group_id,
+            consumer_memory_mb=consumer_memory_mb,
+            consumer_reserved_concurrency=consumer_reserved_concurrency or None,
+            consumer_timeout_seconds=consumer_timeout_seconds
         )
         
         # Flink Consumer Stack
@@ -418,8 +732,19 @@ class MSKFlinkStreamingStack(Stack):
             vpc=vpc,
             security_group=all_sg,
             bootstrap_brokers=msk_iam_bootstrap_brokers,
-            cluster=msk_cluster
+            cluster=msk_cluster,
+            wire_format=wire_format,
+            parallelism=capacity_plan["flink_parallelism"] if capacity_plan
+                else int(self.node.try_get_context("flinkParallelism") or 1),
+            parallelism_per_kpu=capacity_plan["flink_parallelism_per_kpu"] if capacity_plan
+                else int(self.node.try_get_context("flinkParallelismPerKpu") or 1),
+            auto_scaling_enabled=str(self.node.try_get_context("flinkAutoScaling")).lower() != "false",
+            delivery_guarantee=self.node.try_get_context("flinkDeliveryGuarantee") or "at-least-once",
+            checkpoint_interval_seconds=int(self.node.try_get_context("flinkCheckpointIntervalSeconds") or 60),
+            checkpoint_min_pause_seconds=int(self.node.try_get_context("flinkCheckpointMinPauseSeconds") or 5)
         )
+        # The job's topics exist with their planned partitions before it starts
+        flinkStack.add_dependency(lambdaStack)
 
         
 
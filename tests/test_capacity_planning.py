@@ -0,0 +1,75 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")))
+
+import capacity_planning
+from capacity_planning import plan
+
+
+def test_small_ingest_uses_cheapest_broker_type():
+    result = plan(10)
+    assert result["broker_instance_type"] == capacity_planning.BROKER_TYPES[0][0]
+    assert result["peak_mb_per_sec"] == 20.0
+    assert result["peak_records_per_sec"] == 200000
+    assert result["broker_count"] == 2
+    assert result["replication_factor"] == 2
+    assert result["flink_parallelism"] == 40
+    assert result["flink_kpus"] == 40
+    assert result["input_partitions"] == 40
+    assert result["broker_volume_throughput"] is None
+
+
+@pytest.mark.parametrize("ingest, overrides", [
+    (1, {}),
+    (40, {"record_bytes": 120, "retention_hours": 72, "peak_factor": 3, "az_count": 3}),
+    (150, {"az_count": 3, "record_bytes": 1000}),
+])
+def test_sizes_are_consistent(ingest, overrides):
+    result = plan(ingest, **overrides)
+    brokers = result["broker_count"]
+    az_count = result["inputs"]["az_count"]
+    # Brokers spread evenly over the zones, partitions evenly over the brokers
+    assert brokers % az_count == 0
+    assert result["input_partitions"] % brokers == 0
+    assert result["alert_partitions"] % brokers == 0
+    # Every source subtask reads at least one partition
+    assert result["input_partitions"] >= result["flink_parallelism"]
+    assert result["replication_factor"] <= min(3, brokers)
+    assert capacity_planning.MIN_VOLUME_GIB <= result["broker_volume_gib"] <= capacity_planning.MAX_VOLUME_GIB
+    assert 0 < result["event_batch_size"] <= capacity_planning.MAX_EVENT_BATCH_SIZE
+
+
+def test_higher_ingest_needs_larger_brokers():
+    small = plan(10, az_count=3)
+    large = plan(200, az_count=3, record_bytes=10000)
+    types = [broker[0] for broker in capacity_planning.BROKER_TYPES]
+    assert types.index(large["broker_instance_type"]) > types.index(small["broker_instance_type"])
+
+
+def test_event_batch_size_fits_payload():
+    result = plan(10, alert_bytes=3000)
+    record_bytes = 4 * 1000 + capacity_planning.EVENT_RECORD_OVERHEAD_BYTES
+    assert result["event_batch_size"] == capacity_planning.MAX_EVENT_PAYLOAD_BYTES // record_bytes
+
+
+def test_single_zone_keeps_one_replica():
+    assert plan(1, az_count=1)["replication_factor"] == 1
+
+
+@pytest.mark.parametrize("ingest, overrides", [
+    (0, {}),
+    (10, {"record_bytes": -1}),
+    (10, {"peak_factor": 0.5}),
+    (10, {"unknown_input": 1}),
+    # More than any broker type sustains within max_brokers_per_az
+    (100000, {}),
+])
+def test_invalid_inputs_raise(ingest, overrides):
+    with pytest.raises(ValueError):
+        plan(ingest, **overrides)
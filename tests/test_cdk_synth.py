@@ -0,0 +1,52 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Two syntheses of the unchanged app must produce identical templates, so
+# `cdk deploy` of an unchanged stack is a no-op. Run from the repository root
+# with the CDK requirements installed and PythonKafkaSink.zip built:
+#
+#   python -m pytest tests
+
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT)
+
+cdk = pytest.importorskip("aws_cdk")
+
+
+def synth_templates(outdir):
+    from msk_flink_streaming_stack import MSKFlinkStreamingStack
+
+    with open(os.path.join(ROOT, "cdk.json")) as file:
+        context = json.load(file)["context"]
+    # No Docker bundling of the producer Lambda, it does not change the templates
+    context["aws:cdk:bundling-stacks"] = []
+    app = cdk.App(outdir=str(outdir), context=context)
+    MSKFlinkStreamingStack(app, "MSKFlinkStreamingStack")
+    app.synth()
+    templates = {}
+    for name in sorted(os.listdir(str(outdir))):
+        if name.endswith(".template.json"):
+            with open(os.path.join(str(outdir), name)) as file:
+                templates[name] = json.load(file)
+    return templates
+
+
+def test_consecutive_syntheses_are_identical(tmp_path, monkeypatch):
+    if not os.path.exists(os.path.join(ROOT, "PythonKafkaSink.zip")):
+        pytest.skip("PythonKafkaSink.zip is missing, see the README")
+    monkeypatch.chdir(ROOT)
+    first = synth_templates(tmp_path / "first")
+    second = synth_templates(tmp_path / "second")
+    assert first
+    for name in sorted(set(first) | set(second)):
+        a = first.get(name, {}).get("Resources", {})
+        b = second.get(name, {}).get("Resources", {})
+        changed = sorted(key for key in set(a) | set(b) if a.get(key) != b.get(key))
+        assert not changed, "{}: resources differ between syntheses: {}".format(name, changed)
+    assert first == second